@@ -0,0 +1,56 @@
+import argparse
+import time
+import tracemalloc
+
+from cfg_parse.base import SymbolArena
+from cfg_parse.cfg_build.build import build_symbol_graph
+
+
+def _get_alternatives_symbol_def(n_alternatives: int) -> str:
+    return " | ".join(f'( "a{i}" "b{i}" )' for i in range(n_alternatives))
+
+
+def _get_nested_symbol_def(depth: int) -> str:
+    return "".join(f'( "a{i}" ' for i in range(depth)) + "".join(
+        f' "b{i}" )' for i in reversed(range(depth))
+    )
+
+
+def _get_repetitions_symbol_def(n_repetitions: int) -> str:
+    return " ".join(f'{{ "a{i}" | "b{i}" }}' for i in range(n_repetitions))
+
+
+def _bench(name: str, symbol_def: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build_symbol_graph(symbol_def, SymbolArena())
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    build_symbol_graph(symbol_def, SymbolArena())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<24} best {min(timings) * 1e3:9.2f} ms  peak {peak / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alternatives", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=50)
+    parser.add_argument("--repetitions", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    _bench(
+        f"{args.alternatives} alternatives",
+        _get_alternatives_symbol_def(args.alternatives),
+        args.repeat,
+    )
+    _bench(f"{args.depth} deep", _get_nested_symbol_def(args.depth), args.repeat)
+    _bench(
+        f"{args.repetitions} repetitions",
+        _get_repetitions_symbol_def(args.repetitions),
+        args.repeat,
+    )
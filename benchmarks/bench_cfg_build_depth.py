@@ -0,0 +1,41 @@
+import argparse
+import time
+import tracemalloc
+
+from cfg_parse.base import SymbolArena
+from cfg_parse.cfg_build.build import build_symbol_graph
+
+
+def _get_nested_symbol_def(depth: int) -> str:
+    return "".join(f'( "a{i}" ' for i in range(depth)) + "".join(
+        f' "b{i}" )' for i in reversed(range(depth))
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[100, 1000, 10000, 20000, 50000]
+    )
+    args = parser.parse_args()
+
+    for depth in args.depths:
+        symbol_def = _get_nested_symbol_def(depth)
+
+        start = time.perf_counter()
+        try:
+            build_symbol_graph(symbol_def, SymbolArena())
+        except RecursionError:
+            print(f"depth {depth:>6}  RecursionError")
+            continue
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        build_symbol_graph(symbol_def, SymbolArena())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"depth {depth:>6}  {elapsed * 1e3:10.1f} ms  "
+            f"{elapsed / depth * 1e6:6.1f} us/level  peak {peak / 2**20:7.1f} MiB"
+        )
@@ -0,0 +1,34 @@
+import argparse
+import os
+import time
+
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar
+
+
+def _get_cfg_grammar(n_rules: int) -> str:
+    rules = ["start: " + " | ".join(f"r{i}" for i in range(n_rules))]
+    for i in range(n_rules):
+        rules.append(
+            f'r{i}: "a{i}" {{"b" | "c" r{(i + 1) % n_rules}}} ["d" "e"] '
+            f'("f" | Regex("[0-9]+") "g")'
+        )
+    return "\n".join(rules)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=5000)
+    parser.add_argument(
+        "--max-workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1]
+    )
+    args = parser.parse_args()
+
+    cfg_grammar = _get_cfg_grammar(args.rules)
+    print(f"{args.rules} rules, {len(cfg_grammar) / 1024:.0f} KiB")
+
+    for max_workers in sorted(set(args.max_workers)):
+        start = time.perf_counter()
+        compile_cfg_grammar(cfg_grammar, max_workers=max_workers)
+        print(
+            f"max_workers {max_workers:>3}  {(time.perf_counter() - start) * 1e3:8.1f} ms"
+        )
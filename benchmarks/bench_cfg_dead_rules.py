@@ -0,0 +1,50 @@
+import argparse
+import time
+
+from cfg_parse.cfg_compile.cache import _serialize_compiled_grammar
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar
+
+
+def _get_cfg_grammar(n_rules: int, dead_ratio: float) -> str:
+    # Generated grammars keep rules no longer referred to from `start`, and rules left
+    # without an end.
+    n_live_rules = max(1, int(n_rules * (1 - dead_ratio)))
+    rules = ["start: " + " | ".join(f'"s{i}" r{i}' for i in range(n_live_rules))]
+    for i in range(n_rules):
+        rule = f'r{i}: "a{i}" ["d" "e"] ("f" | Regex("[0-9]+") "g") end'
+        if i % 10 == 0:
+            rules.append(rule + f' | "(" loop{i} ")"')
+            rules.append(f'loop{i}: "x" loop{i}')
+        else:
+            rules.append(rule)
+    rules.append('end: ";"')
+    return "\n".join(rules)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=4000)
+    parser.add_argument("--dead-ratio", type=float, nargs="+", default=[0.0, 0.5, 0.9])
+    args = parser.parse_args()
+
+    for dead_ratio in args.dead_ratio:
+        cfg_grammar = _get_cfg_grammar(args.rules, dead_ratio)
+
+        for eliminate_dead_rules in (False, True):
+            start = time.perf_counter()
+            compiled_cfg_grammar = compile_cfg_grammar(
+                cfg_grammar, eliminate_dead_rules=eliminate_dead_rules
+            )
+            compile_time = time.perf_counter() - start
+
+            report = compiled_cfg_grammar.report
+            n_bytes = len(_serialize_compiled_grammar(compiled_cfg_grammar, bytes(32)))
+            print(
+                f"dead {dead_ratio:4.0%}  eliminate={eliminate_dead_rules!s:<5}  "
+                f"rules {len(compiled_cfg_grammar.rules):>5}  "
+                f"unreachable {len(report.unreachable_rules):>5}  "
+                f"unproductive {len(report.unproductive_rules):>4}  "
+                f"compile {compile_time * 1e3:7.1f} ms  "
+                f"resident {compiled_cfg_grammar.get_nbytes() / 2**20:5.2f} MiB  "
+                f"serialized {n_bytes / 2**20:5.2f} MiB"
+            )
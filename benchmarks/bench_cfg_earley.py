@@ -0,0 +1,119 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+import warnings
+
+from cfg_parse.cfg_guide.guide import CFGGuide
+from cfg_parse.cfg_guide.session import GuideSession
+
+CFG_GRAMMAR_ARITHMETIC = """
+start: expr
+expr: expr "+" term | expr "-" term | term
+term: term "*" factor | factor
+factor: Regex("[0-9]+") | "(" expr ")"
+"""
+
+
+def _get_arithmetic_contents(n_terms: int, seed: int) -> list[str]:
+    # A sum of products, every few factors is an expression in parentheses: `1*(2+3)-4...`.
+    rng = random.Random(seed)
+    contents: list[str] = []
+    depth = 0
+    for i in range(n_terms):
+        if i:
+            contents.append(rng.choice(['"+"', '"-"', '"*"']))
+        while rng.random() < 0.2 and depth < 8:
+            contents.append('"("')
+            depth += 1
+        contents.append(f'"{rng.randrange(100)}"')
+        while depth and rng.random() < 0.3:
+            contents.append('")"')
+            depth -= 1
+    contents += ['")"'] * depth
+    return contents
+
+
+CFG_GRAMMAR_JSON = """
+start: value
+value: object | array | Regex("[a-z]+") | Regex("[0-9]+") | "true" | "false" | "null"
+object: "{" member {"," member} "}"
+member: Regex("[a-z]+") "=" value
+array: "[" value {"," value} "]"
+"""
+
+
+def _get_json_contents(n_items: int, seed: int) -> list[str]:
+    # An array of objects with a random scalar and an array: `[{a=1,b=[x,42]},...]`.
+    rng = random.Random(seed)
+    scalars = ['"x"', '"abc"', '"1"', '"42"']
+    member = ['"a"', '"="']
+    contents = ['"["']
+    for i in range(n_items):
+        if i:
+            contents.append('","')
+        contents += ['"{"', *member, rng.choice(scalars), '","', *member]
+        contents += ['"["', rng.choice(scalars), '","', rng.choice(scalars), '"]"']
+        contents.append('"}"')
+    contents.append('"]"')
+    return contents
+
+
+def _walk(guide: CFGGuide, chosen_contents: list[str]) -> GuideSession:
+    session = GuideSession(guide)
+    for chosen_content in chosen_contents:
+        session.advance(chosen_content)
+    return session
+
+
+def _time_walks(guide: CFGGuide, walks: list[list[str]]) -> float:
+    start = time.perf_counter()
+    for chosen_contents in walks:
+        _walk(guide, chosen_contents)
+    return time.perf_counter() - start
+
+
+def _trace_walk(guide: CFGGuide, chosen_contents: list[str]) -> tuple[int, int]:
+    # The memory held by the live parses at the end of the walk, and at most along it.
+    gc.collect()
+    tracemalloc.start()
+    session = _walk(guide, chosen_contents)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del session
+    return retained, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--walks", type=int, default=20)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    for name, cfg_grammar, get_contents in [
+        ("arithmetic", CFG_GRAMMAR_ARITHMETIC, _get_arithmetic_contents),
+        ("json", CFG_GRAMMAR_JSON, _get_json_contents),
+    ]:
+        for size in args.sizes:
+            walks = [get_contents(size, seed) for seed in range(args.walks)]
+            n_tokens = sum(map(len, walks))
+            print(f"{name} {size}: {n_tokens / len(walks):.0f} tokens per walk")
+            for engine, earley in [("gss", False), ("earley", True)]:
+                # The memo is warmed by a first pass, the walks share its frontiers.
+                guide = CFGGuide(cfg_grammar, earley=earley)
+                cold_time = _time_walks(guide, walks)
+                warm_time = _time_walks(guide, walks)
+                # Without the memo, the memory is that of the live parses only.
+                no_memo_guide = CFGGuide.from_compiled_cfg_grammar(
+                    guide.compiled_cfg_grammar, frontier_memo_max_size=0, earley=earley
+                )
+                no_memo_time = _time_walks(no_memo_guide, walks)
+                retained, peak = _trace_walk(no_memo_guide, walks[0])
+                print(
+                    f"  {engine:<7}  cold {cold_time / n_tokens * 1e6:7.1f} us/token  "
+                    f"warm {warm_time / n_tokens * 1e6:7.1f} us/token  "
+                    f"no memo {no_memo_time / n_tokens * 1e6:7.1f} us/token  "
+                    f"retained {retained / 2**10:8.1f} KiB  peak {peak / 2**10:8.1f} KiB"
+                )
@@ -0,0 +1,112 @@
+import argparse
+import time
+import warnings
+
+from cfg_parse.cfg_guide.guide import CFGGuide
+
+CFG_GRAMMAR_ARITHMETIC = """
+start: expr
+expr: term {("+" | "-") term}
+term: factor {("*" | "/") factor}
+factor: Regex("[0-9]+") | "(" expr ")" | "-" factor
+"""
+
+CFG_GRAMMAR_JSON = """
+start: value
+value: object | array | Regex("[a-z]+") | Regex("[0-9]+") | "true" | "false" | "null"
+object: "{" [member {"," member}] "}"
+member: Regex("[a-z]+") "=" value
+array: "[" [value {"," value}] "]"
+"""
+
+
+def _get_cfg_grammar_deep(depth: int) -> str:
+    # Every frontier goes `depth` rules down before reaching a terminal.
+    rules = ["start: r0 {r0}"]
+    for i in range(depth):
+        rules.append(f'r{i}: r{i + 1} | "a{i}"')
+    rules.append(f'r{depth}: "(" start ")" | "x"')
+    return "\n".join(rules)
+
+
+def _get_cfg_grammar_wide(width: int) -> str:
+    # Every frontier offers the first terminal of each of `width` rules.
+    rules = ["start: item {item}", "item: " + " | ".join(f"w{i}" for i in range(width))]
+    for i in range(width):
+        rules.append(f'w{i}: "a{i}" "b{i}" | "c{i}" item')
+    return "\n".join(rules)
+
+
+def _get_cfg_grammar_diamond(depth: int) -> str:
+    # Each rule reaches the next one through two nodes, `2 ** depth` paths lead to the same
+    # terminals.
+    rules = ["start: d0 {d0}"]
+    for i in range(depth):
+        rules.append(f'd{i}: d{i + 1} "a{i}" | d{i + 1} "b{i}"')
+    rules.append(f'd{depth}: "(" start ")" | "x"')
+    return "\n".join(rules)
+
+
+def _time_guide_walk(guide: CFGGuide, n_steps: int) -> tuple[float, float]:
+    # Times the start frontier, then the steps of a walk rotating through the next terminals.
+    start = time.perf_counter()
+    guide.get_next_terminals()
+    start_time = time.perf_counter() - start
+
+    step_time = 0.0
+    for step in range(n_steps):
+        next_symbols = list(guide.next_terminals_w_history)
+        if not next_symbols:
+            guide.get_next_terminals()
+            continue
+        chosen_symbol = next_symbols[step % len(next_symbols)]
+        generation_state = guide.next_terminals_w_history[chosen_symbol]
+
+        start = time.perf_counter()
+        guide.get_next_terminals(generation_state, chosen_symbol)
+        step_time += time.perf_counter() - start
+
+    return start_time, step_time / n_steps
+
+
+def _time_walk(cfg_grammar: str, n_steps: int) -> tuple[float, float, float]:
+    # The walk is timed again by a guide sharing the compiled grammar, without a memo: the
+    # frontier table is then built already, as when serving many generations.
+    guide = CFGGuide(cfg_grammar)
+    start_time, step_time = _time_guide_walk(guide, n_steps)
+    _, warm_step_time = _time_guide_walk(
+        CFGGuide.from_compiled_cfg_grammar(
+            guide.compiled_cfg_grammar, frontier_memo_max_size=0
+        ),
+        n_steps,
+    )
+    return start_time, step_time, warm_step_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--width", type=int, default=200)
+    parser.add_argument("--diamond-depth", type=int, default=16)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    for name, cfg_grammar in (
+        ("arithmetic", CFG_GRAMMAR_ARITHMETIC),
+        ("json", CFG_GRAMMAR_JSON),
+        (f"deep {args.depth}", _get_cfg_grammar_deep(args.depth)),
+        (f"wide {args.width}", _get_cfg_grammar_wide(args.width)),
+        (
+            f"diamond {args.diamond_depth}",
+            _get_cfg_grammar_diamond(args.diamond_depth),
+        ),
+    ):
+        try:
+            start_time, step_time, warm_step_time = _time_walk(cfg_grammar, args.steps)
+        except RecursionError:
+            print(f"{name:<12}  RecursionError")
+            continue
+        print(
+            f"{name:<12}  start {start_time * 1e6:8.1f} us  step {step_time * 1e6:8.1f} us  warm step {warm_step_time * 1e6:8.1f} us"
+        )
@@ -0,0 +1,69 @@
+import argparse
+import time
+import warnings
+
+from cfg_parse.cfg_guide.guide import CFGGuide
+
+CFG_GRAMMAR_JSON = """
+start: value
+value: object | array | Regex("[a-z]+") | Regex("[0-9]+") | "true" | "false" | "null"
+object: "{" member {"," member} "}"
+member: Regex("[a-z]+") "=" value
+array: "[" value {"," value} "]"
+"""
+
+
+def _get_json_contents(n_items: int) -> list[str]:
+    # An array of objects, each holding a number and an array: `[{a=1,b=[1,2]},...]`.
+    member = ['"[a-z]+"', '"="']
+    item = ['"{"', *member, '"[0-9]+"', '","', *member]
+    item += ['"["', '"[0-9]+"', '","', '"[0-9]+"', '"]"', '"}"']
+    contents = ['"["']
+    for i in range(n_items):
+        if i:
+            contents.append('","')
+        contents.extend(item)
+    contents.append('"]"')
+    return contents
+
+
+def _time_json_walk(
+    chosen_contents: list[str], frontier_memo_max_size: int
+) -> tuple[float, float]:
+    guide = CFGGuide(CFG_GRAMMAR_JSON, frontier_memo_max_size=frontier_memo_max_size)
+    guide.get_next_terminals()
+
+    step_time = 0.0
+    for chosen_content in chosen_contents:
+        (chosen_symbol,) = [
+            symbol
+            for symbol in guide.next_terminals_w_history
+            if symbol.content == chosen_content
+        ]
+        generation_state = guide.next_terminals_w_history[chosen_symbol]
+
+        start = time.perf_counter()
+        guide.get_next_terminals(generation_state, chosen_symbol)
+        step_time += time.perf_counter() - start
+
+    frontier_memo = guide.frontier_memo
+    return (
+        step_time / len(chosen_contents),
+        frontier_memo.get_hit_rate() if frontier_memo else 0.0,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--max-sizes", type=int, nargs="+", default=[0, 16, 1024])
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    chosen_contents = _get_json_contents(args.items)
+    print(f"{len(chosen_contents)} steps")
+    for max_size in args.max_sizes:
+        step_time, hit_rate = _time_json_walk(chosen_contents, max_size)
+        print(
+            f"max_size {max_size:>5}  step {step_time * 1e6:8.1f} us  hit rate {hit_rate:6.1%}"
+        )
@@ -0,0 +1,105 @@
+import argparse
+import random
+import time
+import warnings
+
+from cfg_parse.cfg_guide.guide import CFGGuide
+from cfg_parse.cfg_guide.helpers import _retrace_symbol_objs_from_str
+
+CFG_GRAMMAR_JSON = """
+start: value
+value: object | array | Regex("[a-z]+") | Regex("[0-9]+") | "true" | "false" | "null"
+object: "{" member {"," member} "}"
+member: Regex("[a-z]+") "=" value
+array: "[" value {"," value} "]"
+"""
+
+
+def _get_json_contents(n_items: int, seed: int) -> list[str]:
+    # An array of objects with a random scalar and an array: `[{a=1,b=[x,42]},...]`.
+    rng = random.Random(seed)
+    scalars = ['"x"', '"abc"', '"1"', '"42"']
+    member = ['"a"', '"="']
+    contents = ['"["']
+    for i in range(n_items):
+        if i:
+            contents.append('","')
+        contents += ['"{"', *member, rng.choice(scalars), '","', *member]
+        contents += ['"["', rng.choice(scalars), '","', rng.choice(scalars), '"]"']
+        contents.append('"}"')
+    contents.append('"]"')
+    return contents
+
+
+def _time_sequential_walks(
+    guide: CFGGuide, sequences_chosen_contents: list[list[str]]
+) -> float:
+    # One guide per sequence, advanced one call at a time.
+    guides = [
+        CFGGuide.from_compiled_cfg_grammar(guide.compiled_cfg_grammar)
+        for _ in sequences_chosen_contents
+    ]
+
+    start = time.perf_counter()
+    batch_next_terminals_w_history = []
+    for sequence_guide in guides:
+        sequence_guide.get_next_terminals()
+        batch_next_terminals_w_history.append(
+            dict(sequence_guide.next_terminals_w_history)
+        )
+    for chosen_contents in zip(*sequences_chosen_contents):
+        for i, (sequence_guide, chosen_content) in enumerate(
+            zip(guides, chosen_contents)
+        ):
+            next_terminals_w_history = batch_next_terminals_w_history[i]
+            (chosen_symbol,) = _retrace_symbol_objs_from_str(
+                chosen_content, next_terminals_w_history
+            )
+            sequence_guide.get_next_terminals(
+                next_terminals_w_history[chosen_symbol], chosen_symbol
+            )
+            batch_next_terminals_w_history[i] = dict(
+                sequence_guide.next_terminals_w_history
+            )
+    return time.perf_counter() - start
+
+
+def _time_batch_walks(
+    guide: CFGGuide, sequences_chosen_contents: list[list[str]]
+) -> float:
+    start = time.perf_counter()
+    batch_next_terminals_w_history = guide.get_next_terminals_batch(
+        [None] * len(sequences_chosen_contents), [None] * len(sequences_chosen_contents)
+    )
+    for chosen_contents in zip(*sequences_chosen_contents):
+        batch_next_terminals_w_history = guide.get_next_terminals_batch(
+            batch_next_terminals_w_history, chosen_contents
+        )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 256])
+    # Sequences of a batch follow one of that many distinct walks.
+    parser.add_argument("--distinct-walks", type=int, default=8)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    walks = [
+        _get_json_contents(args.items, seed) for seed in range(args.distinct_walks)
+    ]
+    n_steps = len(walks[0]) + 1
+    print(f"{n_steps} steps, {args.distinct_walks} distinct walks")
+    for batch_size in args.batch_sizes:
+        sequences_chosen_contents = [walks[i % len(walks)] for i in range(batch_size)]
+        sequential_time = _time_sequential_walks(
+            CFGGuide(CFG_GRAMMAR_JSON), sequences_chosen_contents
+        )
+        batch_time = _time_batch_walks(
+            CFGGuide(CFG_GRAMMAR_JSON), sequences_chosen_contents
+        )
+        print(
+            f"batch {batch_size:>4}  sequential {sequential_time / n_steps * 1e3:8.2f} ms/step  batch {batch_time / n_steps * 1e3:8.2f} ms/step  speedup {sequential_time / batch_time:5.1f}x"
+        )
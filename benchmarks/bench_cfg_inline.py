@@ -0,0 +1,65 @@
+import argparse
+import time
+
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar
+from cfg_parse.cfg_guide.guide import CFGGuide
+from cfg_parse.cfg_guide.helpers import _iter_compiled_generation_state_stack
+
+
+def _get_cfg_grammar(n_keys: int) -> str:
+    # Small rules referred to from a few levels of rules, as in generated grammars.
+    keys = " | ".join(f'"k{i}"' for i in range(n_keys))
+    digits = " | ".join(f'"{i}"' for i in range(10))
+    return f"""
+    start: pair {{"," pair}}
+    pair: key "=" value
+    key: {keys}
+    value: sign digit
+    sign: "+" | "-"
+    digit: {digits}
+    """
+
+
+def _time_guide_steps(guide: CFGGuide, n_steps: int) -> tuple[float, float]:
+    # Follows the first proposed terminal for `n_steps` steps, returns the time per step
+    # and the mean depth of the proposed generation stacks.
+    n_layers = 0
+    n_next_terminals = 0
+    start = time.perf_counter()
+    guide.get_next_terminals()
+    for _ in range(n_steps):
+        for generation_state in guide.next_terminals_w_history.values():
+            n_layers += sum(
+                1 for _ in _iter_compiled_generation_state_stack(generation_state)
+            )
+        n_next_terminals += len(guide.next_terminals_w_history)
+
+        chosen_symbol = next(iter(guide.next_terminals_w_history))
+        guide.get_next_terminals(
+            guide.next_terminals_w_history[chosen_symbol], chosen_symbol
+        )
+    return (time.perf_counter() - start) / n_steps, n_layers / n_next_terminals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--inline-max-nodes", type=int, nargs="+", default=[0, 4, 32])
+    args = parser.parse_args()
+
+    cfg_grammar = _get_cfg_grammar(args.keys)
+
+    for inline_max_nodes in args.inline_max_nodes:
+        compiled_cfg_grammar = compile_cfg_grammar(
+            cfg_grammar, inline_max_nodes=inline_max_nodes
+        )
+        step_time, mean_n_layers = _time_guide_steps(
+            CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar), args.steps
+        )
+        print(
+            f"inline_max_nodes {inline_max_nodes:>3}  "
+            f"inlined {sorted(compiled_cfg_grammar.report.inlined_rules)!s:<28}  "
+            f"step {step_time * 1e6:7.1f} us  "
+            f"mean stack depth {mean_n_layers:4.2f}"
+        )
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+from cfg_parse.cfg_guide.guide import CFGGuide
+
+
+def _get_cfg_grammar(n_rules: int) -> str:
+    # `start` only reaches a handful of the rules, as with large grammars of which a
+    # generation only visits a corner.
+    rules = ["start: r0 | r1 | r2"]
+    for i in range(n_rules):
+        rules.append(
+            f'r{i}: "a{i}" {{"b" | "c" r{(i + 1) % n_rules}}} ["d" "e"] '
+            f'("f" | Regex("[0-9]+") "g")'
+        )
+    return "\n".join(rules)
+
+
+def _time_first_step(cfg_grammar: str, **kwargs) -> tuple[float, float]:
+    start = time.perf_counter()
+    guide = CFGGuide(cfg_grammar, **kwargs)
+    startup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    guide.get_next_terminals()
+    first_step_time = time.perf_counter() - start
+
+    return startup_time, first_step_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[500, 2000, 5000])
+    args = parser.parse_args()
+
+    for n_rules in args.rules:
+        cfg_grammar = _get_cfg_grammar(n_rules)
+
+        configs: list[tuple[str, dict[str, bool]]] = [
+            ("eager", {}),
+            ("lazy", {"lazy": True}),
+            ("lazy, no validation", {"lazy": True, "validate": False}),
+        ]
+        for name, kwargs in configs:
+            startup_time, first_step_time = _time_first_step(cfg_grammar, **kwargs)
+            print(
+                f"{n_rules:>6} rules  {name:<20} startup {startup_time * 1e3:8.1f} ms  "
+                f"first step {first_step_time * 1e3:6.2f} ms"
+            )
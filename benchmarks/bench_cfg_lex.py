@@ -0,0 +1,31 @@
+import argparse
+import time
+
+from cfg_parse.cfg_build.helpers import _convert_str_def_to_str_queue
+
+
+def _get_symbol_def(n_alternatives: int) -> str:
+    return " | ".join(
+        f'(term_{i % 7} "op{i}" {{factor "-"}} [Regex("[0-9]+")])'.replace("_", "")
+        for i in range(n_alternatives)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alternatives", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    symbol_def = _get_symbol_def(args.alternatives)
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        queue_symbol_def = _convert_str_def_to_str_queue(symbol_def)
+        timings.append(time.perf_counter() - start)
+
+    print(
+        f"{len(symbol_def) / 2**20:.1f} MiB, {len(queue_symbol_def)} symbols: "
+        f"best {min(timings) * 1e3:.1f} ms"
+    )
@@ -0,0 +1,72 @@
+import argparse
+import mmap
+import os
+import tempfile
+import time
+import tracemalloc
+
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar, compile_cfg_grammar_file
+
+
+def _write_cfg_grammar(cfg_grammar_path: str, n_rules: int, n_alternatives: int):
+    # Large enum vocabularies, one alternative per line.
+    with open(cfg_grammar_path, "w", encoding="utf-8") as file:
+        file.write("start: " + " | ".join(f"r{i}" for i in range(n_rules)) + "\n")
+        for i in range(n_rules):
+            file.write(f'r{i}: "v{i}_0"\n')
+            for j in range(1, n_alternatives):
+                file.write(f'    | "v{i}_{j}"\n')
+
+
+# Memory kept by the compiled grammar and peak of the memory allocated from the grammar file
+# to it, the compiled grammar itself is the same whatever the way the file is read.
+def _measure(compile_cfg_grammar_from_file) -> tuple[float, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    compiled_cfg_grammar = compile_cfg_grammar_from_file()
+    elapsed_time = time.perf_counter() - start
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del compiled_cfg_grammar
+    return elapsed_time, retained_bytes, peak_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--alternatives", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cfg_grammar_path = os.path.join(tmp_dir, "grammar.cfg")
+
+        for n_alternatives in args.alternatives:
+            _write_cfg_grammar(cfg_grammar_path, args.rules, n_alternatives)
+            file_size = os.path.getsize(cfg_grammar_path)
+
+            def compile_str():
+                with open(cfg_grammar_path, encoding="utf-8") as file:
+                    return compile_cfg_grammar(file.read())
+
+            def compile_path():
+                return compile_cfg_grammar_file(cfg_grammar_path)
+
+            def compile_mmap():
+                with open(cfg_grammar_path, "rb") as file:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        return compile_cfg_grammar_file(mapped)
+
+            for name, compile_cfg_grammar_from_file in (
+                ("str", compile_str),
+                ("path", compile_path),
+                ("mmap", compile_mmap),
+            ):
+                elapsed_time, retained_bytes, peak_bytes = _measure(
+                    compile_cfg_grammar_from_file
+                )
+                print(
+                    f"{file_size / 2**20:7.1f} MiB  {name:<5} "
+                    f"{elapsed_time * 1e3:8.1f} ms  "
+                    f"retained {retained_bytes / 2**20:7.2f} MiB  "
+                    f"peak {peak_bytes / 2**20:7.2f} MiB"
+                )
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar
+from cfg_parse.cfg_guide.guide import CFGGuide
+
+
+def _get_cfg_grammar(n_rules: int, n_alternatives: int) -> str:
+    # Alternatives sharing prefixes and suffixes, as in generated enum-like grammars.
+    rules = []
+    for i in range(n_rules):
+        rules.append(
+            ("start" if i == 0 else f"r{i}")
+            + ": "
+            + " | ".join(
+                f'"key" "=" "v{j % 7}" "," "v{j % 5}" ";"'
+                for j in range(n_alternatives)
+            )
+        )
+    return "\n".join(rules)
+
+
+def _get_n_nodes(compiled_cfg_grammar) -> int:
+    return sum(len(rule) for rule in compiled_cfg_grammar.rules)
+
+
+def _time_guide_walk(guide: CFGGuide) -> tuple[float, int]:
+    # Follows the first proposed terminal to the end, returns the size of the first frontier.
+    start = time.perf_counter()
+    guide.get_next_terminals()
+    n_start_next_terminals = len(guide.next_terminals_w_history)
+    while guide.next_terminals_w_history:
+        chosen_symbol = next(iter(guide.next_terminals_w_history))
+        guide.get_next_terminals(
+            guide.next_terminals_w_history[chosen_symbol], chosen_symbol
+        )
+    return time.perf_counter() - start, n_start_next_terminals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=20)
+    parser.add_argument("--alternatives", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    for n_alternatives in args.alternatives:
+        cfg_grammar = _get_cfg_grammar(args.rules, n_alternatives)
+
+        for minimize in (False, True):
+            start = time.perf_counter()
+            compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar, minimize=minimize)
+            compile_time = time.perf_counter() - start
+
+            guide_time, n_start_next_terminals = _time_guide_walk(
+                CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar)
+            )
+            print(
+                f"{n_alternatives:>4} alternatives  minimize={minimize!s:<5}  "
+                f"nodes {_get_n_nodes(compiled_cfg_grammar):>7}  "
+                f"compile {compile_time * 1e3:8.1f} ms  "
+                f"walk {guide_time * 1e3:6.2f} ms  "
+                f"start frontier {n_start_next_terminals:>4}"
+            )
@@ -0,0 +1,56 @@
+import argparse
+import time
+
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar, recompile_cfg_grammar
+from cfg_parse.cfg_guide.guide import CFGGuide
+
+
+def _get_cfg_grammar(n_rules: int, changed_rule: int = -1) -> str:
+    rules = ["start: " + " | ".join(f"r{i}" for i in range(n_rules))]
+    for i in range(n_rules):
+        rules.append(
+            f'r{i}: "a{i}" {{"b" | "c" r{(i + 1) % n_rules}}} ["d" "e"] '
+            f'("f" | Regex("[0-9]+") "{"h" if i == changed_rule else "g"}")'
+        )
+    return "\n".join(rules)
+
+
+# Time of the guide through the first terminals of every rule, the steps carried over by
+# `recompile_cfg_grammar` aren't built again.
+def _get_first_steps_time(compiled_cfg_grammar) -> float:
+    start = time.perf_counter()
+    guide = CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar)
+    guide.get_next_terminals()
+    next_terminals_w_history = dict(guide.next_terminals_w_history)
+    for chosen_symbol, generation_state in next_terminals_w_history.items():
+        guide.get_next_terminals(generation_state, chosen_symbol)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[500, 2000, 5000])
+    args = parser.parse_args()
+
+    for n_rules in args.rules:
+        cfg_grammar = _get_cfg_grammar(n_rules)
+        changed_cfg_grammar = _get_cfg_grammar(n_rules, changed_rule=n_rules // 2)
+
+        start = time.perf_counter()
+        compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar)
+        compile_time = time.perf_counter() - start
+
+        _get_first_steps_time(compiled_cfg_grammar)
+
+        start = time.perf_counter()
+        recompiled_cfg_grammar = recompile_cfg_grammar(
+            compiled_cfg_grammar, changed_cfg_grammar
+        )
+        recompile_time = time.perf_counter() - start
+        first_steps_time = _get_first_steps_time(recompiled_cfg_grammar)
+
+        print(
+            f"{n_rules:>6} rules  compile {compile_time * 1e3:8.1f} ms  "
+            f"recompile one rule {recompile_time * 1e3:7.1f} ms  "
+            f"first steps {first_steps_time * 1e3:7.1f} ms"
+        )
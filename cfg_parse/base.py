@@ -1,9 +1,21 @@
-import uuid
+import sys
+import threading
+from array import array
 from collections import defaultdict
 from copy import deepcopy
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Deque, Generic, Iterable, Iterator, Optional, TypeVar
+from itertools import count
+from typing import (
+    Callable,
+    Generic,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+)
 
 T = TypeVar("T")
 
@@ -54,26 +66,74 @@ class OrderedSet(Generic[T]):
         return deepcopy(self)
 
 
-@dataclass
+# Allocates the ids of the symbols of a grammar, each occurrence of a symbol gets its own id
+# so that two occurrences of the same terminal are still distinct nodes.
+class SymbolArena:
+    __slots__ = ("_s_ids",)
+
+    def __init__(self, start: int = 0):
+        self._s_ids = count(start)
+
+    def allocate(self) -> int:
+        return next(self._s_ids)
+
+    def create_symbol(self, content: str, s_type: "SymbolType") -> "Symbol":
+        return Symbol(content, s_type, self.allocate())
+
+
+# Symbols built without an explicit id or arena are allocated from a process-wide arena.
+DEFAULT_SYMBOL_ARENA = SymbolArena()
+
+
 class Symbol:
+    __slots__ = ("content", "s_type", "s_id", "_hash")
+
     content: str
     s_type: "SymbolType"
-    s_id: uuid.UUID = field(default_factory=lambda: uuid.uuid4())
+    s_id: int
+
+    def __init__(self, content: str, s_type: "SymbolType", s_id: Optional[int] = None):
+        # Contents are interned, occurrences of the same content share a single string.
+        self.content = sys.intern(content)
+        self.s_type = s_type
+        self.s_id = DEFAULT_SYMBOL_ARENA.allocate() if s_id is None else s_id
+        self._hash = hash((self.content, self.s_type, self.s_id))
 
     def __hash__(self):
-        return hash((self.content, self.s_type, self.s_id))
+        return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
+
         # Ensure equality is checked for all fields
         if not isinstance(other, Symbol):
             return False
 
         return (
-            (self.content == other.content)
+            (self.s_id == other.s_id)
+            and (self.content == other.content)
             and (self.s_type == other.s_type)
-            and (self.s_id == other.s_id)
         )
 
+    def __repr__(self) -> str:
+        return (
+            f"Symbol(content={self.content!r}, s_type={self.s_type}, s_id={self.s_id})"
+        )
+
+    def is_eos_symbol(self) -> bool:
+        return self.content == "EOS_SYMBOL" and self.s_type == SymbolType.TERMINAL
+
+    # Symbols are immutable identities, copying a graph shares them.
+    def __copy__(self) -> "Symbol":
+        return self
+
+    def __deepcopy__(self, memo) -> "Symbol":
+        return self
+
+    def __reduce__(self):
+        return (Symbol, (self.content, self.s_type, self.s_id))
+
 
 class SymbolType(Enum):
     TERMINAL = 1
@@ -82,6 +142,28 @@ class SymbolType(Enum):
     SPECIAL = 4
 
 
+# Symbol tokens share their values with `SymbolType`, delimiters and `|` get their own.
+class TokenType(Enum):
+    TERMINAL = 1
+    NON_TERMINAL = 2
+    REGEX = 3
+    SPECIAL = 4
+    OPENING_DELIMITER = 5
+    CLOSING_DELIMITER = 6
+    OR = 7
+
+
+# `offset` is the position of the token in the definition it was read from. Not frozen, since
+# definitions can hold millions of tokens and frozen dataclasses are slower to create.
+@dataclass
+class Token:
+    __slots__ = ("content", "t_type", "offset")
+
+    content: str
+    t_type: TokenType
+    offset: int
+
+
 @dataclass
 class SymbolGraph:
     tree: dict[Symbol, OrderedSet[Symbol]] = field(
@@ -89,6 +171,41 @@ class SymbolGraph:
     )
     initials: OrderedSet[Symbol] = field(default_factory=OrderedSet)
     finals: OrderedSet[Symbol] = field(default_factory=OrderedSet)
+    # Superset of the nodes of `tree` without connections, `None` when it isn't tracked.
+    # It spares the builder from scanning the whole tree to discard single nodes.
+    single_nodes: Optional[OrderedSet[Symbol]] = field(
+        default=None, compare=False, repr=False
+    )
+    # Reverse adjacency of `tree`, kept up to date by `add_edge` and `discard_edge`.
+    # Built from `tree` when it isn't given.
+    predecessors: dict[Symbol, OrderedSet[Symbol]] = field(
+        default=None, compare=False, repr=False  # type: ignore
+    )
+    # `EOS_SYMBOL` symbols of `initials` and `finals`, so that looking for them doesn't scan
+    # the whole sets. Found in `initials` and `finals` when they aren't given.
+    eos_initials: OrderedSet[Symbol] = field(
+        default=None, compare=False, repr=False  # type: ignore
+    )
+    eos_finals: OrderedSet[Symbol] = field(
+        default=None, compare=False, repr=False  # type: ignore
+    )
+
+    def __post_init__(self):
+        if self.predecessors is None:
+            self.predecessors = defaultdict(OrderedSet)
+            for symbol_parent, symbol_children in self.tree.items():
+                for symbol_child in symbol_children:
+                    self.predecessors[symbol_child].add(symbol_parent)
+
+        if self.eos_initials is None:
+            self.eos_initials = OrderedSet(
+                symbol for symbol in self.initials if symbol.is_eos_symbol()
+            )
+
+        if self.eos_finals is None:
+            self.eos_finals = OrderedSet(
+                symbol for symbol in self.finals if symbol.is_eos_symbol()
+            )
 
     def __eq__(self, other) -> bool:
         if isinstance(other, SymbolGraph):
@@ -102,6 +219,22 @@ class SymbolGraph:
     def __bool__(self) -> bool:
         return bool(self.initials) and bool(self.tree) and bool(self.finals)
 
+    def add_node(self, symbol: Symbol) -> None:
+        if symbol not in self.tree:
+            self.tree[symbol] = OrderedSet()
+
+    def add_edge(self, symbol_parent: Symbol, symbol_child: Symbol) -> None:
+        self.tree[symbol_parent].add(symbol_child)
+        self.predecessors[symbol_child].add(symbol_parent)
+
+    def discard_edge(self, symbol_parent: Symbol, symbol_child: Symbol) -> None:
+        self.tree[symbol_parent].discard(symbol_child)
+        if symbol_child in self.predecessors:
+            self.predecessors[symbol_child].discard(symbol_parent)
+
+    def get_predecessors(self, symbol: Symbol) -> OrderedSet[Symbol]:
+        return self.predecessors.get(symbol, OrderedSet())
+
     def copy(self):
         return deepcopy(self)
 
@@ -112,8 +245,307 @@ class SymbolGraphType(Enum):
     NONE_ONCE = 3
 
 
-@dataclass
+# Generation stacks are persistent: a `SymbolGraphState` is an immutable frame pointing to
+# the frame below it through `parent`, while `graph` references the built symbol graph
+# instead of holding a copy of it. Pushing, popping or updating the state of the top frame
+# allocates a single frame and shares everything below it, so forking a stack is O(1).
+@dataclass(frozen=True, eq=False)
 class SymbolGraphState:
     graph: SymbolGraph
     label: str
     state: Optional[Symbol] = None
+    parent: Optional["SymbolGraphState"] = None
+
+
+# The compiled grammar is the runtime format of the guide, `SymbolGraph` stays the front-end
+# format used while building. Each rule graph is lowered into flat integer arrays: nodes are
+# ints, `kinds` holds the `SymbolType` value of each node, `contents` the id of its content in
+# `CompiledGrammar.contents`, and the successors of `node` are stored in CSR layout as
+# `successors[successor_offsets[node] : successor_offsets[node + 1]]`.
+@dataclass(frozen=True, eq=False)
+class CompiledRule:
+    label: str
+    kinds: array
+    contents: array
+    successor_offsets: array
+    successors: array
+    initials: array
+    finals: array
+    # Front-end symbols of the nodes, handed to the caller and used to retrace chosen symbols.
+    symbols: tuple[Symbol, ...]
+    node_ids: dict[Symbol, int]
+    # Content id of the label of the rule each node was inlined from, `-1` for the nodes of the
+    # rule itself. Empty when no rule was inlined into this one.
+    origins: array = field(default_factory=lambda: array("i"))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def get_nbytes(self) -> int:
+        # Estimated resident size, shared objects such as interned strings are not counted.
+        nbytes = sum(
+            sys.getsizeof(integers)
+            for integers in (
+                self.kinds,
+                self.contents,
+                self.successor_offsets,
+                self.successors,
+                self.initials,
+                self.finals,
+                self.origins,
+            )
+        )
+        nbytes += sys.getsizeof(self.symbols) + sys.getsizeof(self.node_ids)
+        if self.symbols:
+            nbytes += len(self.symbols) * sys.getsizeof(self.symbols[0])
+        return nbytes
+
+    def get_next_nodes(self, node: int) -> array:
+        # `node` is `-1` before entering the rule.
+        if node < 0:
+            return self.initials
+        return self.successors[
+            self.successor_offsets[node] : self.successor_offsets[node + 1]
+        ]
+
+
+# What the optional passes of a compilation did. Filled in while compiling, a compiled grammar
+# loaded from the cache has an empty report.
+@dataclass
+class CompileReport:
+    # Number of nodes of each minimized rule, before and after `minimize_symbol_graph`.
+    minimized_rules: dict[str, tuple[int, int]] = field(default_factory=dict)
+    # Labels of the rules inlined into each rule, in the order they were met.
+    inlined_rules: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    # Labels of the rules dropped as unreachable from `start`, and as deriving no terminal
+    # string, in grammar order.
+    unreachable_rules: list[str] = field(default_factory=list)
+    unproductive_rules: list[str] = field(default_factory=list)
+    # Labels of each group of rules entering one another without consuming a terminal (see
+    # `get_left_recursive_rule_groups`).
+    left_recursive_rules: list[tuple[str, ...]] = field(default_factory=list)
+
+    def get_n_merged_nodes(self) -> int:
+        return sum(
+            n_nodes_before - n_nodes_after
+            for n_nodes_before, n_nodes_after in self.minimized_rules.values()
+        )
+
+
+# Options a grammar was compiled with (see `compile_cfg_grammar`), rules compiled with other
+# options are compiled differently and can't be reused by `recompile_cfg_grammar`.
+@dataclass(frozen=True)
+class CompileOptions:
+    minimize: bool = False
+    inline_max_nodes: int = 0
+    eliminate_dead_rules: bool = False
+
+
+# Rules of a lazily compiled grammar, a rule is compiled by `compile_rule` the first time it's
+# looked up and kept afterwards.
+class LazyCompiledRules:
+    def __init__(self, n_rules: int, compile_rule: Callable[[int], CompiledRule]):
+        self.compiled_rules: list[Optional[CompiledRule]] = [None] * n_rules
+        self.compile_rule = compile_rule
+        # Compiling a rule grows the contents and the symbols of the grammar, rules looked up
+        # by concurrent guides are compiled one at a time, and only once.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.compiled_rules)
+
+    def __getitem__(self, rule_id: int) -> CompiledRule:
+        rule = self.compiled_rules[rule_id]
+        if rule is None:
+            with self._lock:
+                rule = self.compiled_rules[rule_id]
+                if rule is None:
+                    rule = self.compiled_rules[rule_id] = self.compile_rule(rule_id)
+        return rule
+
+    def __iter__(self) -> Iterator[CompiledRule]:
+        # Compiles the rules that weren't looked up yet.
+        for rule_id in range(len(self.compiled_rules)):
+            yield self[rule_id]
+
+    def is_compiled(self, rule_id: int) -> bool:
+        return self.compiled_rules[rule_id] is not None
+
+
+# Steps of the guide from a state, `(symbol, node, rule_id, steps)` each: the terminal `symbol`
+# at `node` when `rule_id` is `-1`, otherwise a layer pushed for the rule `rule_id` from the
+# non-terminal `node` of the state, and the steps from that layer. A layer entering a
+# left-recursive rule entered already has no steps, it would loop.
+FrontierSteps = tuple[tuple[Symbol, int, int, "FrontierSteps"], ...]
+
+
+# Steps from a state flattened in the order the guide goes through them (see
+# `get_next_frontier_walk`), each terminal once along with the layers leading to it.
+@dataclass(frozen=True, eq=False)
+class FrontierWalk:
+    # `(layer, rule_id, node)` each, a layer pushed for the rule `rule_id` from the
+    # non-terminal `node` of the layer `layer`. Layers are numbered from `1` in that order,
+    # `0` being the state the walk starts from.
+    pushes: tuple[tuple[int, int, int], ...]
+    # `(symbol, layer)` each, the terminal `symbol` reached from the layer `layer`.
+    terminals: tuple[tuple[Symbol, int], ...]
+
+    def get_nbytes(self) -> int:
+        # Estimated resident size, the symbols are counted with the rules.
+        return sum(
+            sys.getsizeof(entries) + sum(map(sys.getsizeof, entries))
+            for entries in (self.pushes, self.terminals)
+        )
+
+
+# Steps from a node of the graph-structured stack flattened into the nodes it pushes (see
+# `get_next_gss_walk`), each terminal along with every node reaching it.
+@dataclass(frozen=True, eq=False)
+class GSSWalk:
+    # Rules of the nodes pushed, numbered from `1` in that order, `0` being the node the walk
+    # starts from. A rule is pushed once whatever the number of paths entering it.
+    rule_ids: tuple[int, ...]
+    # `(layer, parent_layer, node)` each, a parent of the node `layer` (see `GSSNode`).
+    parents: tuple[tuple[int, int, int], ...]
+    # `(symbol, layers)` each, the nodes reaching the terminal `symbol`.
+    terminals: tuple[tuple[Symbol, tuple[int, ...]], ...]
+
+    def get_nbytes(self) -> int:
+        # Estimated resident size, the symbols are counted with the rules.
+        nbytes = sys.getsizeof(self.rule_ids) + sys.getsizeof(self.parents)
+        nbytes += sum(map(sys.getsizeof, self.parents))
+        nbytes += sys.getsizeof(self.terminals)
+        for terminal in self.terminals:
+            nbytes += sys.getsizeof(terminal) + sys.getsizeof(terminal[1])
+        return nbytes
+
+
+# Steps of the guide built on first use (see `get_next_frontier_steps`), they only depend on the
+# rules and are shared by the guides of a grammar. Steps are immutable, a step built twice by
+# concurrent guides is the same either way.
+class FrontierTable:
+    def __init__(self):
+        # Steps entering a rule, with the rules of its group entered since the last consumed
+        # terminal.
+        self.entry_steps: dict[tuple[int, frozenset[int]], FrontierSteps] = {}
+        # Steps following a node of a rule, `-1` for the initials of the rule.
+        self.next_steps: dict[tuple[int, int], FrontierSteps] = {}
+        # Walks of the steps from the start, and of the steps following a node of a rule.
+        self.start_walk: Optional[FrontierWalk] = None
+        self.next_walks: dict[tuple[int, int], FrontierWalk] = {}
+        # Walks of the graph-structured stack, from its start and following a node of a rule.
+        self.start_gss_walk: Optional[GSSWalk] = None
+        self.next_gss_walks: dict[tuple[int, int], GSSWalk] = {}
+        # Held while finding the groups of the rules of a lazily compiled grammar, the groups
+        # of the rules reached from a rule are found together (see
+        # `_find_left_recursive_rule_groups`).
+        self.left_recursive_rule_groups_lock = threading.Lock()
+        # Estimated resident size of the steps and walks, counted as they're added: the table
+        # grows as long as guides use the grammar.
+        self.nbytes = 0
+        self._nbytes_lock = threading.Lock()
+
+    def add_nbytes(self, nbytes: int):
+        with self._nbytes_lock:
+            self.nbytes += nbytes
+
+
+@dataclass(frozen=True, eq=False)
+class CompiledGrammar:
+    # With a lazily compiled grammar, `rules` are compiled on first look up and `contents` and
+    # `content_rule_ids` grow along with them (see `compile_cfg_grammar`).
+    rules: Union[tuple[CompiledRule, ...], LazyCompiledRules]
+    rule_ids: dict[str, int]
+    contents: Sequence[str]
+    # Maps each content id to the id of the rule it names, `-1` if it doesn't name a rule.
+    content_rule_ids: array
+    start: int
+    # Definition of each rule as divided from the grammar, compared against the definitions of a
+    # new grammar to only rebuild the rules that changed (see `recompile_cfg_grammar`).
+    definitions: tuple[str, ...] = ()
+    # Arena the symbols of the rules were allocated from, rebuilt rules are allocated from it
+    # too so that their symbols stay distinct from the symbols of the other rules.
+    arena: SymbolArena = field(default_factory=SymbolArena, repr=False)
+    # `1` for the rules that can be entered again without consuming a terminal, the guide only
+    # looks for loops when entering them. `-1` for the rules of a lazily compiled grammar whose
+    # group isn't found yet.
+    left_recursive_rules: array = field(default_factory=lambda: array("b"), repr=False)
+    # Group of each rule (see `get_left_recursive_rule_groups`), empty for the rules outside of
+    # any loop. Only the rules of its group can be entered again from a rule. With a lazily
+    # compiled grammar, `None` until the guide first enters the rule.
+    left_recursive_rule_groups: list[Optional[frozenset[int]]] = field(
+        default_factory=list, repr=False
+    )
+    frontier_table: FrontierTable = field(default_factory=FrontierTable, repr=False)
+    options: CompileOptions = field(default_factory=CompileOptions)
+    report: CompileReport = field(default_factory=CompileReport, repr=False)
+
+    def get_nbytes(self) -> int:
+        # Estimated resident size of the compiled grammar, the steps of the guide built so far
+        # included.
+        return self.get_rules_nbytes() + self.frontier_table.nbytes
+
+    def get_rules_nbytes(self) -> int:
+        # Estimated resident size of the compiled grammar but for its frontier table.
+        nbytes = sum(rule.get_nbytes() for rule in self.rules)
+        nbytes += sum(sys.getsizeof(content) for content in self.contents)
+        nbytes += sum(sys.getsizeof(definition) for definition in self.definitions)
+        nbytes += sys.getsizeof(self.content_rule_ids) + sys.getsizeof(self.rule_ids)
+        return nbytes
+
+    def get_rule_id(self, rule: CompiledRule, node: int) -> int:
+        # Id of the rule a `NON_TERMINAL` node refers to.
+        return self.content_rule_ids[rule.contents[node]]
+
+    def get_origin_label(self, rule: CompiledRule, node: int) -> str:
+        # Label of the rule `node` was written in, before any rule was inlined.
+        if rule.origins and rule.origins[node] >= 0:
+            return self.contents[rule.origins[node]]
+        return rule.label
+
+
+# Immutable frame of a persistent generation stack over a `CompiledGrammar`, `node` is the last
+# visited node of the rule `rule_id` and is `-1` before entering it.
+@dataclass(frozen=True, eq=False)
+class CompiledGraphState:
+    rule_id: int
+    node: int = -1
+    parent: Optional["CompiledGraphState"] = None
+
+
+# Next terminals of a state of the guide, each with the top frame of the stack it's reached
+# from (see `CFGGuide.get_next_terminals`).
+NextTerminals = dict[Symbol, CompiledGraphState]
+
+
+# Node of the graph-structured stack of all the live parses of a generation (see
+# `cfg_guide/gss.py`), `node` is the last visited node of the rule `rule_id` and is `-1` before
+# entering it. The layers pushed for a rule at the same position of the generation are one
+# node, whatever they're pushed from: `parents` are `(parent, node)` each, the node of the
+# rule of `parent` the layer was pushed from. Parents are only added while the position of
+# the node is being expanded, a left-recursive rule is its own parent.
+@dataclass(frozen=True, eq=False)
+class GSSNode:
+    rule_id: int
+    node: int = -1
+    parents: list[tuple["GSSNode", int]] = field(default_factory=list)
+
+
+# Set of an Earley chart at one position of a generation (see `cfg_guide/earley.py`). Only what
+# completions need is kept: for each rule predicted at this position, the items waiting for it
+# along with their non-terminal node referring to it. Items are filled in while the position is
+# being expanded, a set is kept alive by the items started at it.
+class EarleySet:
+    __slots__ = ("waiting_items",)
+
+    def __init__(self):
+        self.waiting_items: dict[int, list[tuple["EarleyItem", int]]] = {}
+
+
+# Item of an Earley chart, `node` is the last visited node of the rule `rule_id` and is `-1`
+# before entering it, `origin` is the set the rule was predicted at.
+@dataclass(frozen=True, eq=False)
+class EarleyItem:
+    rule_id: int
+    node: int
+    origin: EarleySet
@@ -1,31 +1,47 @@
-from typing import Deque
-
-from cfg_parse.base import OrderedSet, Symbol, SymbolGraph, SymbolGraphType, SymbolType
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from cfg_parse.base import (
+    DEFAULT_SYMBOL_ARENA,
+    OrderedSet,
+    Symbol,
+    SymbolArena,
+    SymbolGraph,
+    SymbolGraphType,
+    SymbolType,
+)
 from cfg_parse.cfg_build.helpers import (
     _convert_str_def_to_str_queue,
     _convert_str_to_symbol,
     _discard_single_nodes_from_tree,
+    _enumerate_symbol_graph_nodes,
+    _get_bisimilar_node_classes,
+    _get_co_reachable_node_classes,
     _get_symbol_predecessors,
-    _get_symbol_from_content_attr,
-    _tree_contains_eos_symbol,
+    _merge_node_classes,
+    _merge_symbol_graph_trees,
 )
 
 
 def construct_symbol_subgraph(
-    symbols_str: list[str], graph_type: SymbolGraphType = SymbolGraphType.STANDARD
+    symbols_str: list[str],
+    graph_type: SymbolGraphType = SymbolGraphType.STANDARD,
+    arena: SymbolArena = DEFAULT_SYMBOL_ARENA,
 ) -> SymbolGraph:
-    symbol_graph = SymbolGraph()
-
     # Empty symbol graph.
     if len(symbols_str) == 0:
-        return symbol_graph
+        return SymbolGraph()
+
+    symbol_graph = SymbolGraph(single_nodes=OrderedSet())
 
     # INITIALS
-    initial = _convert_str_to_symbol(symbols_str[0])
+    initial = _convert_str_to_symbol(symbols_str[0], arena)
     # Add the node to the initials.
     symbol_graph.initials.add(initial)
     # Add the node to the symbol graph.
-    symbol_graph.tree[initial]
+    symbol_graph.add_node(initial)
+    symbol_graph.single_nodes.add(initial)  # type: ignore
 
     # Single node
     if len(symbols_str) == 1:
@@ -33,7 +49,7 @@ def construct_symbol_subgraph(
             [initial]
         )
         # Node without connections
-        symbol_graph.tree[initial]
+        symbol_graph.add_node(initial)
         return symbol_graph
 
     symbol_previous = initial
@@ -42,17 +58,18 @@ def construct_symbol_subgraph(
             symbol_graph.finals.add(symbol_previous)
             continue
 
-        node = _convert_str_to_symbol(symbol_str)
+        node = _convert_str_to_symbol(symbol_str, arena)
 
         if symbol_previous in symbol_graph.finals:
             # Add the node to the initials.
             symbol_graph.initials.add(node)
             # Add the node to the symbol graph
-            symbol_graph.tree[node]
+            symbol_graph.add_node(node)
+            symbol_graph.single_nodes.add(node)  # type: ignore
             symbol_previous = node
             continue
 
-        symbol_graph.tree[symbol_previous].add(node)
+        symbol_graph.add_edge(symbol_previous, node)
 
         symbol_previous = node
 
@@ -60,12 +77,15 @@ def construct_symbol_subgraph(
     # Add the node to the finals.
     symbol_graph.finals.add(symbol_previous)
 
-    return cast_symbol_graph(symbol_graph, graph_type)
+    return cast_symbol_graph(symbol_graph, graph_type, arena, in_place=True)
 
 
+# With `in_place`, the operands are owned by the result: they are modified and shared
+# instead of copied, and shouldn't be used afterwards.
 def connect_symbol_graph(
     symbol_graph_lhs: SymbolGraph,
     symbol_graph_rhs: SymbolGraph,
+    in_place: bool = False,
 ) -> SymbolGraph:
     if not symbol_graph_lhs.tree and not symbol_graph_rhs.tree:
         return SymbolGraph()
@@ -77,52 +97,60 @@ def connect_symbol_graph(
         return symbol_graph_lhs
 
     # Passing by value and not by reference, avoids modifying the original dicts.
-    symbol_graph_lhs_copy = symbol_graph_lhs.copy()
-    symbol_graph_rhs_copy = symbol_graph_rhs.copy()
+    if not in_place:
+        symbol_graph_lhs = symbol_graph_lhs.copy()
+        symbol_graph_rhs = symbol_graph_rhs.copy()
 
     # Single node symbols will connect through their `INITIALS` and `FINALS`.
-    symbol_graph_lhs_copy.tree = _discard_single_nodes_from_tree(
-        symbol_graph_lhs_copy.tree
+    _discard_single_nodes_from_tree(
+        symbol_graph_lhs.tree, symbol_graph_lhs.single_nodes
     )
-    symbol_graph_rhs_copy.tree = _discard_single_nodes_from_tree(
-        symbol_graph_rhs_copy.tree
+    _discard_single_nodes_from_tree(
+        symbol_graph_rhs.tree, symbol_graph_rhs.single_nodes
     )
 
-    # Union the connections between both symbol graphs.
-    symbol_graph_tree_out = symbol_graph_lhs_copy.tree | symbol_graph_rhs_copy.tree
+    # Union the connections between both symbol graphs, keeps the initials from the left
+    # symbol graph and the finals from the right symbol graph.
+    # Every node left is connected, but for predecessors of `EOS_SYMBOL` symbols that
+    # could end up without connections.
+    symbol_graph_out = SymbolGraph(
+        initials=symbol_graph_lhs.initials,
+        tree=_merge_symbol_graph_trees(symbol_graph_lhs.tree, symbol_graph_rhs.tree),
+        finals=symbol_graph_rhs.finals,
+        single_nodes=OrderedSet(),
+        predecessors=_merge_symbol_graph_trees(
+            symbol_graph_lhs.predecessors, symbol_graph_rhs.predecessors
+        ),
+        eos_initials=symbol_graph_lhs.eos_initials,
+        eos_finals=symbol_graph_rhs.eos_finals,
+    )
 
     # Connect the left `FINALS` (also takes care of `EOS_SYMBOLS`) with the right `INITIALS`.
-    for symbol_final in symbol_graph_lhs_copy.finals:
+    for symbol_final in symbol_graph_lhs.finals:
         if symbol_final.content == "EOS_SYMBOL":
             symbol_predecessors = _get_symbol_predecessors(
-                symbol_graph_tree_out, symbol_final
+                symbol_graph_out, symbol_final
             )
             # Discarding the connection to `EOS_SYMBOL` symbol.
             for symbol_predecessor in symbol_predecessors:
-                symbol_graph_tree_out[symbol_predecessor].discard(symbol_final)
-            symbol_final = symbol_predecessors
-
-        if not isinstance(symbol_final, list):
-            symbol_final = [symbol_final]
-
-        for symbol_initial in symbol_graph_rhs_copy.initials:
-            for final in symbol_final:
-                symbol_graph_tree_out[final].add(symbol_initial)
+                symbol_graph_out.discard_edge(symbol_predecessor, symbol_final)
+                symbol_graph_out.single_nodes.add(symbol_predecessor)  # type: ignore
+            connected_finals = symbol_predecessors
+        else:
+            connected_finals = [symbol_final]
 
-    # Keeps the initials from the left symbol graph and the finals from the right symbol graph.
-    symbol_graph_initials_out = symbol_graph_lhs_copy.initials
-    symbol_graph_finals_out = symbol_graph_rhs_copy.finals
+        for symbol_initial in symbol_graph_rhs.initials:
+            for final in connected_finals:
+                symbol_graph_out.add_edge(final, symbol_initial)
 
-    return SymbolGraph(
-        initials=symbol_graph_initials_out,
-        tree=symbol_graph_tree_out,
-        finals=symbol_graph_finals_out,
-    )
+    return symbol_graph_out
 
 
+# With `in_place`, the operands are owned by the result (see `connect_symbol_graph`).
 def union_symbol_graph(
     symbol_graph_lhs: SymbolGraph,
     symbol_graph_rhs: SymbolGraph,
+    in_place: bool = False,
 ) -> SymbolGraph:
     if not symbol_graph_lhs.tree and not symbol_graph_rhs.tree:
         return SymbolGraph()
@@ -134,36 +162,49 @@ def union_symbol_graph(
         return symbol_graph_lhs
 
     # Passing by value and not by reference, avoids modifying the original dicts.
-    symbol_graph_lhs_copy = symbol_graph_lhs.copy()
-    symbol_graph_rhs_copy = symbol_graph_rhs.copy()
+    if not in_place:
+        symbol_graph_lhs = symbol_graph_lhs.copy()
+        symbol_graph_rhs = symbol_graph_rhs.copy()
 
     # Extend the left `INITIALS` to the right `INITIALS`, `|` is not used because it discards the order (*for testing).
 
     # Removes duplicates (if they exist) `EOS_SYMBOL` symbols from `INITIALS`.
-    if _tree_contains_eos_symbol(
-        symbol_graph_lhs_copy.initials
-    ) and _tree_contains_eos_symbol(symbol_graph_rhs_copy.initials):
-        symbol_special_eos_symbol = _get_symbol_from_content_attr(
-            symbol_graph_rhs_copy.initials, "EOS_SYMBOL"
-        )
-        symbol_graph_rhs_copy.initials.discard(symbol_special_eos_symbol[0])
+    if symbol_graph_lhs.eos_initials and symbol_graph_rhs.eos_initials:
+        for symbol_special_eos_symbol in symbol_graph_rhs.eos_initials:
+            symbol_graph_rhs.initials.discard(symbol_special_eos_symbol)
+        symbol_graph_rhs.eos_initials = OrderedSet()
 
-    symbol_graph_initials_out = symbol_graph_lhs_copy.initials.extend(
-        symbol_graph_rhs_copy.initials
+    symbol_graph_initials_out = symbol_graph_lhs.initials.extend(
+        symbol_graph_rhs.initials
     )
 
     # Union two `symbol_graphs`, both without their `INITIALS` and `FINALS`.
-    symbol_graph_tree_out = symbol_graph_lhs_copy.tree | symbol_graph_rhs_copy.tree
+    symbol_graph_tree_out = _merge_symbol_graph_trees(
+        symbol_graph_lhs.tree, symbol_graph_rhs.tree
+    )
 
     # Extend the left `FINALS` to the right `FINALS`, `|` is not used because it discards the order (*for testing).
-    symbol_graph_finals_out = symbol_graph_lhs_copy.finals.extend(
-        symbol_graph_rhs_copy.finals
+    symbol_graph_finals_out = symbol_graph_lhs.finals.extend(symbol_graph_rhs.finals)
+
+    symbol_graph_single_nodes_out = (
+        symbol_graph_lhs.single_nodes.extend(symbol_graph_rhs.single_nodes)
+        if symbol_graph_lhs.single_nodes is not None
+        and symbol_graph_rhs.single_nodes is not None
+        else None
     )
 
     return SymbolGraph(
         initials=symbol_graph_initials_out,
         tree=symbol_graph_tree_out,
         finals=symbol_graph_finals_out,
+        single_nodes=symbol_graph_single_nodes_out,
+        predecessors=_merge_symbol_graph_trees(
+            symbol_graph_lhs.predecessors, symbol_graph_rhs.predecessors
+        ),
+        eos_initials=symbol_graph_lhs.eos_initials.extend(
+            symbol_graph_rhs.eos_initials
+        ),
+        eos_finals=symbol_graph_lhs.eos_finals.extend(symbol_graph_rhs.eos_finals),
     )
 
 
@@ -173,11 +214,14 @@ def union_symbol_graph(
 # (factor "-") | {Regex([0-9]*.[0-9]*) factor | "+" expression},
 # there'll be new connections, one of them is '"-"' being connected to Regex([0-9]*.[0-9]*) and '"+"'.
 # `cast_symbol_graph` will add those remaining connections.
+# With `in_place`, the operand is owned by the result (see `connect_symbol_graph`).
 def cast_symbol_graph(
     symbol_graph: SymbolGraph,
     symbol_graph_cast_type: SymbolGraphType,
+    arena: SymbolArena = DEFAULT_SYMBOL_ARENA,
+    in_place: bool = False,
 ) -> SymbolGraph:
-    symbol_graph_copy = symbol_graph.copy()
+    symbol_graph_copy = symbol_graph if in_place else symbol_graph.copy()
 
     if symbol_graph_cast_type == SymbolGraphType.NONE_ANY:
         # Add a `EOS_SYMBOL` to the `initials`, since it can be `NONE`.
@@ -189,12 +233,10 @@ def cast_symbol_graph(
 
         for symbol_final in symbol_graph_copy.finals:
             if symbol_final.content == "EOS_SYMBOL":
-                # [PERFORMANCE] Could raise a flag here and avoid calling is_contain_EOS_SYMBOL(symbol_graph_copy.finals).
-                # symbol_predecessor = get_symbol_predecessor(
-                #     symbol_graph_copy.tree, symbol_final
-                # )
+                # The predecessors come from the index of the graph and whether there's an
+                # `EOS_SYMBOL` in the finals from `eos_finals`, neither scans the graph.
                 symbol_predecessors = _get_symbol_predecessors(
-                    symbol_graph_copy.tree, symbol_final
+                    symbol_graph_copy, symbol_final
                 )
 
                 # Removing the `EOS_SYMBOL` node.
@@ -215,36 +257,42 @@ def cast_symbol_graph(
                 if symbol_initial.content == "EOS_SYMBOL":
                     continue
                 for final in symbol_final:
-                    symbol_graph_copy.tree[final].add(symbol_initial)
+                    symbol_graph_copy.add_edge(final, symbol_initial)
 
-        if _tree_contains_eos_symbol(
-            symbol_graph_copy.initials
-        ) and _tree_contains_eos_symbol(symbol_graph_copy.finals):
+        if symbol_graph_copy.eos_initials and symbol_graph_copy.eos_finals:
             return symbol_graph_copy
 
-        if not _tree_contains_eos_symbol(symbol_graph_copy.initials):
+        if not symbol_graph_copy.eos_initials:
             # `EOS_SYMBOL` symbol for the initials.
-            symbol_special_eos_initial = Symbol("EOS_SYMBOL", SymbolType.TERMINAL)
+            symbol_special_eos_initial = arena.create_symbol(
+                "EOS_SYMBOL", SymbolType.TERMINAL
+            )
 
             # Add `EOS_SYMBOL` as `initials`.
             symbol_graph_copy.initials.add(symbol_special_eos_initial)
+            symbol_graph_copy.eos_initials.add(symbol_special_eos_initial)
 
             # Add `EOS_SYMBOL` as node.
-            symbol_graph_copy.tree[symbol_special_eos_initial]
+            symbol_graph_copy.add_node(symbol_special_eos_initial)
+            if symbol_graph_copy.single_nodes is not None:
+                symbol_graph_copy.single_nodes.add(symbol_special_eos_initial)
 
-        if not _tree_contains_eos_symbol(symbol_graph_copy.finals):
+        if not symbol_graph_copy.eos_finals:
             # `EOS_SYMBOL` symbols for the initials and finals.
-            symbol_special_eos_final = Symbol("EOS_SYMBOL", SymbolType.TERMINAL)
+            symbol_special_eos_final = arena.create_symbol(
+                "EOS_SYMBOL", SymbolType.TERMINAL
+            )
 
             # Connect the `EOS_SYMBOL` in `FINALS` with the elements in the "previous" (before cast) `FINALS`.
             for symbol_final in symbol_graph_copy.finals:
-                symbol_graph_copy.tree[symbol_final].add(symbol_special_eos_final)
+                symbol_graph_copy.add_edge(symbol_final, symbol_special_eos_final)
 
             # Clear the finals since the `EOS_SYMBOL` will be the only element in the finals.
             symbol_graph_copy.finals = OrderedSet([])
 
             # Add `EOS_SYMBOL` as `finals`.
             symbol_graph_copy.finals.add(symbol_special_eos_final)
+            symbol_graph_copy.eos_finals = OrderedSet([symbol_special_eos_final])
 
             # Add `EOS_SYMBOL` as node.
             # symbol_graph_copy.tree[symbol_special_eos_final]
@@ -255,25 +303,40 @@ def cast_symbol_graph(
         # Add a `EOS_SYMBOL` to the SOURCE, since it can be `NONE`.
 
         # Check if `EOS_SYMBOL` already exists.
-        for symbol_initial in symbol_graph_copy.initials:
-            if symbol_initial.content == "EOS_SYMBOL":
-                return symbol_graph_copy
+        if symbol_graph_copy.eos_initials:
+            return symbol_graph_copy
 
         # Add `EOS_SYMBOL` as `initials`
-        symbol_special_eos_initial = Symbol("EOS_SYMBOL", SymbolType.TERMINAL)
+        symbol_special_eos_initial = arena.create_symbol(
+            "EOS_SYMBOL", SymbolType.TERMINAL
+        )
         symbol_graph_copy.initials.add(symbol_special_eos_initial)
-        symbol_graph_copy.tree[symbol_special_eos_initial]
+        symbol_graph_copy.eos_initials.add(symbol_special_eos_initial)
+        symbol_graph_copy.add_node(symbol_special_eos_initial)
+        if symbol_graph_copy.single_nodes is not None:
+            symbol_graph_copy.single_nodes.add(symbol_special_eos_initial)
         return symbol_graph_copy
 
     else:
-        if _tree_contains_eos_symbol(
-            symbol_graph_copy.initials
-        ) and _tree_contains_eos_symbol(symbol_graph_copy.finals):
-            return symbol_graph_copy
         return symbol_graph_copy
 
 
-def build_symbol_graph(symbol_def: str) -> SymbolGraph:
+# A stack level of `build_symbol_graph`, opened by `(`, `[`, `{` (or `|` followed by one of
+# them) and closed by the matching delimiter. `pending_delimiter` is what opened the level
+# above it: the symbol graph that level returns is connected (`(`) or united (`|`) with
+# `accumulated_symbol_graph`, `bottom_level_symbol_graph` holds the symbols read before `(`.
+@dataclass
+class _BuildStackLevel:
+    accumulated_symbols: list[str] = field(default_factory=list)
+    accumulated_symbol_graph: SymbolGraph = field(default_factory=SymbolGraph)
+    pending_delimiter: Optional[str] = None
+    bottom_level_symbol_graph: Optional[SymbolGraph] = None
+
+
+# `arena` allocates the ids of the symbols, a grammar builds all its rules from one arena.
+def build_symbol_graph(
+    symbol_def: str, arena: SymbolArena = DEFAULT_SYMBOL_ARENA
+) -> SymbolGraph:
     queue_symbol_def = _convert_str_def_to_str_queue(symbol_def)
 
     # We build graphs from the left, (_1 `def_1` (_2 `def_2` 2_) `def_3` (_3 def_4 3_) 1_),
@@ -284,138 +347,220 @@ def build_symbol_graph(symbol_def: str) -> SymbolGraph:
     # it refers to the bottom stack layer.
     # Because we can look at it as follows:
     # (_0 [EMPTY_GRAPH] --> `symbol_graph_bottom_level_{0}` (_1 `def_1` (_2 `def_2` 2_) `def_3` ) 1_) 0_)
-    # When we reach a new stack layer, in the example `(_2`, we'll recurse through the next stack layer `(_2`
-    # and return the result (when we encouter a closing delimiter `), ], }`) to a variable called `symbol_graph_upper_level_{1}`.
+    # When we reach a new stack layer, in the example `(_2`, we'll push the next stack layer `(_2`
+    # and pop it (when we encouter a closing delimiter `), ], }`), its result is returned to the layer below.
     # Then we build `def_2` which'll be returned to symbol_graph_upper_level_{1}`.
     # Finally, It'll be connected to `def_1` and stored into a variable called `symbol_graph_partial_lhs_{1}`.`
     # We repeat the same process within a single stack, we successively build bottom and upper layers,
     # ``def_1` (_2 `def_2` 2_)` and ``def_3` (_3 def_4 3_)` while acummulating the result
     # in `symbol_graph_partial_lhs_{1}` .
-    def recurse_build(queue_symbol_def: Deque[str]):
-        current_stack_accumulated_symbols: list[str] = []
-        current_stack_accumulated_symbol_graph: SymbolGraph = SymbolGraph()
-        while True:
-            str_symbol = queue_symbol_def.popleft()
-
-            if str_symbol in ("(", "[", "{"):
-                symbol_graph_bottom_level = construct_symbol_subgraph(
-                    current_stack_accumulated_symbols
-                )
+    # Stack layers are kept in an explicit stack instead of the call stack, so the nesting
+    # depth isn't bounded by the recursion limit.
+    stack_levels: list[_BuildStackLevel] = [_BuildStackLevel()]
+
+    while True:
+        stack_level = stack_levels[-1]
+        str_symbol = queue_symbol_def.popleft()
 
-                # What happens if `current_stack_accumulated_symbols` is not cleared?
-                # Let's have a look at the following example: (_1 `def_1` (_2 `def_2` 2_) `def_3` ) 1_)
-                # Each (_NUM should be looked at as a stack,
-                # Since we're building accordingly from the left, what'll happen is upon leaving the second
-                # stack, we'll have already built and connect `def_1` and `def_2`.
-                # Then while consuming the symbols `def_3`, we'll have additional symbols fron `def_1`.
-                current_stack_accumulated_symbols.clear()
+        if str_symbol in ("(", "[", "{"):
+            stack_level.bottom_level_symbol_graph = construct_symbol_subgraph(
+                stack_level.accumulated_symbols, arena=arena
+            )
+
+            # What happens if `accumulated_symbols` is not cleared?
+            # Let's have a look at the following example: (_1 `def_1` (_2 `def_2` 2_) `def_3` ) 1_)
+            # Each (_NUM should be looked at as a stack,
+            # Since we're building accordingly from the left, what'll happen is upon leaving the second
+            # stack, we'll have already built and connect `def_1` and `def_2`.
+            # Then while consuming the symbols `def_3`, we'll have additional symbols fron `def_1`.
+            stack_level.accumulated_symbols.clear()
 
-                symbol_graph_upper_level = recurse_build(queue_symbol_def)
+            stack_level.pending_delimiter = "("
+            stack_levels.append(_BuildStackLevel())
+            continue
 
-                # Accumulates successive bottom-upper stack level symbol graph builds.
-                if current_stack_accumulated_symbol_graph:
+        if str_symbol in (")", "]", "}"):
+            if str_symbol == ")":
+                SYMBOL_GRAPH_TYPE = SymbolGraphType.STANDARD
+            elif str_symbol == "}":
+                SYMBOL_GRAPH_TYPE = SymbolGraphType.NONE_ANY
+            elif str_symbol == "]":
+                SYMBOL_GRAPH_TYPE = SymbolGraphType.NONE_ONCE
+
+            # Handles the case where there exist no opening `("(", "[", "{")` delimiter next to '|.
+            # Example: (_1 `def_1` {_2 `def_2` 2_} `def_4` | `def_3` 1_), with `def_4` which could be empty.
+            # In such case, we'll return the union of the left definition (`def_1` {`def_2`} `def_4`) to the `|`
+            # with the right definition (`def_3`).
+            if "|" in stack_level.accumulated_symbols:
+                index = stack_level.accumulated_symbols.index("|")
+                symbol_graph_or_lhs, symbol_graph_or_rhs = (
+                    construct_symbol_subgraph(
+                        stack_level.accumulated_symbols[:index], arena=arena
+                    ),
+                    construct_symbol_subgraph(
+                        stack_level.accumulated_symbols[index + 1 :], arena=arena
+                    ),
+                )
+                # Accumulate the left symbol graph with left portion before the '|' symbol.
+                stack_level.accumulated_symbol_graph = connect_symbol_graph(
+                    stack_level.accumulated_symbol_graph,
+                    symbol_graph_or_lhs,
+                    in_place=True,
+                )
+                # Union the left symbol graph with the right portion after the '|' symbol.
+                symbol_graph_out = union_symbol_graph(
+                    stack_level.accumulated_symbol_graph,
+                    symbol_graph_or_rhs,
+                    in_place=True,
+                )
+            else:
+                current_stack_to_accumulate_symbol_graph = construct_symbol_subgraph(
+                    stack_level.accumulated_symbols, arena=arena
+                )
+                symbol_graph_out = connect_symbol_graph(
+                    stack_level.accumulated_symbol_graph,
+                    current_stack_to_accumulate_symbol_graph,
+                    in_place=True,
+                )
+            symbol_graph_out = cast_symbol_graph(
+                symbol_graph_out, SYMBOL_GRAPH_TYPE, arena, in_place=True
+            )
+
+            # Returns `symbol_graph_out` to the layers below, until one of them has symbols
+            # left to read.
+            while True:
+                stack_levels.pop()
+                if not stack_levels:
+                    return symbol_graph_out
+
+                stack_level = stack_levels[-1]
+                if stack_level.pending_delimiter == "(":
+                    # Accumulates successive bottom-upper stack level symbol graph builds.
                     from_upper_stack_to_accumulate_symbol_graph = connect_symbol_graph(
-                        symbol_graph_bottom_level, symbol_graph_upper_level
-                    )
-                    current_stack_accumulated_symbol_graph = connect_symbol_graph(
-                        current_stack_accumulated_symbol_graph,
-                        from_upper_stack_to_accumulate_symbol_graph,
+                        stack_level.bottom_level_symbol_graph,  # type: ignore
+                        symbol_graph_out,
+                        in_place=True,
                     )
+                    if stack_level.accumulated_symbol_graph:
+                        stack_level.accumulated_symbol_graph = connect_symbol_graph(
+                            stack_level.accumulated_symbol_graph,
+                            from_upper_stack_to_accumulate_symbol_graph,
+                            in_place=True,
+                        )
+                    else:
+                        stack_level.accumulated_symbol_graph = (
+                            from_upper_stack_to_accumulate_symbol_graph
+                        )
+                    stack_level.bottom_level_symbol_graph = None
                 else:
-                    current_stack_accumulated_symbol_graph = connect_symbol_graph(
-                        symbol_graph_bottom_level, symbol_graph_upper_level
+                    stack_level.accumulated_symbol_graph = union_symbol_graph(
+                        stack_level.accumulated_symbol_graph,
+                        symbol_graph_out,
+                        in_place=True,
                     )
+                stack_level.pending_delimiter = None
 
                 # Avoids leaving the the `lower` level stack after terminating a `higher` level stack.
                 if bool(queue_symbol_def):
-                    continue
+                    break
 
                 # We need to return at the last delimiter to not pop from an empty queue,
                 # the expression needs to be correct syntactically.
-                return current_stack_accumulated_symbol_graph
-
-            if str_symbol in (")", "]", "}"):
-                if str_symbol == ")":
-                    SYMBOL_GRAPH_TYPE = SymbolGraphType.STANDARD
-                elif str_symbol == "}":
-                    SYMBOL_GRAPH_TYPE = SymbolGraphType.NONE_ANY
-                elif str_symbol == "]":
-                    SYMBOL_GRAPH_TYPE = SymbolGraphType.NONE_ONCE
-
-                # Handles the case where there exist no opening `("(", "[", "{")` delimiter next to '|.
-                # Example: (_1 `def_1` {_2 `def_2` 2_} `def_4` | `def_3` 1_), with `def_4` which could be empty.
-                # In such case, we'll return the union of the left definition (`def_1` {`def_2`} `def_4`) to the `|`
-                # with the right definition (`def_3`).
-                if "|" in current_stack_accumulated_symbols:
-                    index = current_stack_accumulated_symbols.index("|")
-                    symbol_graph_or_lhs, symbol_graph_or_rhs = (
-                        construct_symbol_subgraph(
-                            current_stack_accumulated_symbols[:index]
-                        ),
-                        construct_symbol_subgraph(
-                            current_stack_accumulated_symbols[index + 1 :]
-                        ),
-                    )
-                    # Accumulate the left symbol graph with left portion before the '|' symbol.
-                    current_stack_accumulated_symbol_graph = connect_symbol_graph(
-                        current_stack_accumulated_symbol_graph, symbol_graph_or_lhs
-                    )
-                    # Union the left symbol graph with the right portion after the '|' symbol.
-                    symbol_graph_out = union_symbol_graph(
-                        current_stack_accumulated_symbol_graph, symbol_graph_or_rhs
-                    )
-                    return cast_symbol_graph(symbol_graph_out, SYMBOL_GRAPH_TYPE)
-
-                current_stack_to_accumulate_symbol_graph = construct_symbol_subgraph(
-                    current_stack_accumulated_symbols
-                )
-                symbol_graph_out = connect_symbol_graph(
-                    current_stack_accumulated_symbol_graph,
-                    current_stack_to_accumulate_symbol_graph,
-                )
-                return cast_symbol_graph(symbol_graph_out, SYMBOL_GRAPH_TYPE)
+                symbol_graph_out = stack_level.accumulated_symbol_graph
+            continue
 
-            elif str_symbol == "|":
-                # Handles the case where there exist no opening `("(", "[", "{")` delimiter next to '|.
-                if queue_symbol_def[0] not in ["(", "[", "{"]:
-                    current_stack_accumulated_symbols.append(str_symbol)
-                    continue
+        if str_symbol == "|":
+            # Handles the case where there exist no opening `("(", "[", "{")` delimiter next to '|.
+            if queue_symbol_def[0] not in ["(", "[", "{"]:
+                stack_level.accumulated_symbols.append(str_symbol)
+                continue
 
-                # Handles the case where there exist an opening `("(", "[", "{")` delimiter next to '|.
-                # Creates subgraph of accumulated symbols, if they exist; else return an empty graph.
-                current_stack_to_accumulate_symbol_graph = construct_symbol_subgraph(
-                    current_stack_accumulated_symbols
-                )
+            # Handles the case where there exist an opening `("(", "[", "{")` delimiter next to '|.
+            # Creates subgraph of accumulated symbols, if they exist; else return an empty graph.
+            current_stack_to_accumulate_symbol_graph = construct_symbol_subgraph(
+                stack_level.accumulated_symbols, arena=arena
+            )
 
-                # Consumes `current_stack_accumulated_symbols.`
-                current_stack_accumulated_symbols.clear()
+            # Consumes `accumulated_symbols.`
+            stack_level.accumulated_symbols.clear()
 
-                # Accumulates `current_stack_accumulated_symbol_graph`.
-                current_stack_accumulated_symbol_graph = connect_symbol_graph(
-                    current_stack_accumulated_symbol_graph,
-                    current_stack_to_accumulate_symbol_graph,
-                )
+            # Accumulates `accumulated_symbol_graph`.
+            stack_level.accumulated_symbol_graph = connect_symbol_graph(
+                stack_level.accumulated_symbol_graph,
+                current_stack_to_accumulate_symbol_graph,
+                in_place=True,
+            )
 
-                # Avoids opening an additional stack.
-                # One when encountering the symbol `|` and second with an opening delimiter (`(`, `[`, `{`).
-                # Not doing so will (steal) an enclosing delimiter, thus breaking the logic.
-                if queue_symbol_def[0] in ["(", "[", "{"]:
-                    queue_symbol_def.popleft()
+            # Avoids opening an additional stack.
+            # One when encountering the symbol `|` and second with an opening delimiter (`(`, `[`, `{`).
+            # Not doing so will (steal) an enclosing delimiter, thus breaking the logic.
+            queue_symbol_def.popleft()
 
-                from_upper_stack_to_accumulate_symbol_graph = recurse_build(
-                    queue_symbol_def
-                )
+            stack_level.pending_delimiter = "|"
+            stack_levels.append(_BuildStackLevel())
+            continue
 
-                current_stack_accumulated_symbol_graph = union_symbol_graph(
-                    current_stack_accumulated_symbol_graph,
-                    from_upper_stack_to_accumulate_symbol_graph,
-                )
+        stack_level.accumulated_symbols.append(str_symbol)
+
+
+# Merges the nodes the guide can't tell apart, as DFA minimization does: nodes with the same
+# content and type whose successors are merged too, and nodes with the same content and type
+# reached from the same nodes that both end or both don't end the rule. Successors of merged
+# nodes are joined, the sequences of symbols the rule derives stay the same.
+def minimize_symbol_graph(symbol_graph: SymbolGraph) -> SymbolGraph:
+    symbols = _enumerate_symbol_graph_nodes(symbol_graph)
+    node_ids = {symbol: node for node, symbol in enumerate(symbols)}
+
+    node_labels = [(symbol.content, symbol.s_type) for symbol in symbols]
+    successors = {
+        node: [
+            node_ids[symbol_child] for symbol_child in symbol_graph.tree.get(symbol, ())
+        ]
+        for node, symbol in enumerate(symbols)
+    }
+    initial_nodes = {node_ids[symbol] for symbol in symbol_graph.initials}
+
+    # Node each node was merged into.
+    node_representatives = list(range(len(symbols)))
+    n_nodes = len(symbols)
+    while True:
+        # Co-reachable classes are looked for once bisimilar nodes are merged.
+        for co_reachable in (False, True):
+            node_classes = (
+                _get_co_reachable_node_classes(node_labels, successors, initial_nodes)
+                if co_reachable
+                else _get_bisimilar_node_classes(node_labels, successors)
+            )
+            representatives, successors, initial_nodes = _merge_node_classes(
+                node_classes, successors, initial_nodes
+            )
+            node_representatives = [
+                representatives[node] for node in node_representatives
+            ]
 
-                if bool(queue_symbol_def):
-                    continue
+        if len(successors) == n_nodes:
+            break
+        n_nodes = len(successors)
 
-                return current_stack_accumulated_symbol_graph
+    if n_nodes == len(symbols):
+        return symbol_graph
 
-            current_stack_accumulated_symbols.append(str_symbol)
+    tree: dict[Symbol, OrderedSet[Symbol]] = defaultdict(OrderedSet)
+    for symbol_parent in symbol_graph.tree:
+        node = node_representatives[node_ids[symbol_parent]]
+        if symbols[node] not in tree:
+            tree[symbols[node]] = OrderedSet(
+                symbols[successor] for successor in successors[node]
+            )
 
-    return recurse_build(queue_symbol_def)
+    return SymbolGraph(
+        tree=tree,
+        initials=OrderedSet(
+            symbols[node_representatives[node_ids[symbol]]]
+            for symbol in symbol_graph.initials
+        ),
+        finals=OrderedSet(
+            symbols[node_representatives[node_ids[symbol]]]
+            for symbol in symbol_graph.finals
+        ),
+    )
@@ -1,37 +1,45 @@
 import re
 from collections import defaultdict, deque
-from typing import Deque
-
-from cfg_parse.base import OrderedSet, Symbol, SymbolGraph, SymbolType
+from typing import Deque, Iterable, Iterator, Optional
+
+from cfg_parse.base import (
+    DEFAULT_SYMBOL_ARENA,
+    OrderedSet,
+    Symbol,
+    SymbolArena,
+    SymbolGraph,
+    SymbolType,
+    Token,
+    TokenType,
+)
 from cfg_parse.exceptions import InvalidDelimiters, InvalidSymbol, SymbolNotFound
 
 
-def _convert_str_to_symbol(symbol_str: str) -> Symbol:
+def _convert_str_to_symbol(
+    symbol_str: str, arena: SymbolArena = DEFAULT_SYMBOL_ARENA
+) -> Symbol:
     if symbol_str.startswith('"') and symbol_str.endswith('"'):
-        node = Symbol(symbol_str, SymbolType.TERMINAL)
+        node = arena.create_symbol(symbol_str, SymbolType.TERMINAL)
 
     elif symbol_str.startswith('Regex("') and symbol_str.endswith('")'):
         # Index to strip `symbol` from `Regex()`.
         start = symbol_str.find("(")
         # [NOTE] Use a raw string.
-        node = Symbol(symbol_str[start + 1 : -1], SymbolType.REGEX)
+        node = arena.create_symbol(symbol_str[start + 1 : -1], SymbolType.REGEX)
 
     elif symbol_str in ("(", ")", "[", "]", "{", "}"):
-        node = Symbol(symbol_str, SymbolType.SPECIAL)
+        node = arena.create_symbol(symbol_str, SymbolType.SPECIAL)
 
     else:
-        node = Symbol(symbol_str, SymbolType.NON_TERMINAL)
+        node = arena.create_symbol(symbol_str, SymbolType.NON_TERMINAL)
 
     return node
 
 
 def _get_symbol_predecessors(
-    symbol_graph_tree: dict[Symbol, OrderedSet[Symbol]], search_symbol: Symbol
+    symbol_graph: SymbolGraph, search_symbol: Symbol
 ) -> list[Symbol]:
-    symbol_predecessors = []
-    for symbol_parent, symbol_children in symbol_graph_tree.items():
-        if search_symbol in symbol_children:
-            symbol_predecessors.append(symbol_parent)
+    symbol_predecessors = list(symbol_graph.get_predecessors(search_symbol))
 
     if len(symbol_predecessors) == 0:
         raise SymbolNotFound(
@@ -41,27 +49,160 @@ def _get_symbol_predecessors(
     return symbol_predecessors
 
 
-def _tree_contains_eos_symbol(symbol_graph_tree: OrderedSet[Symbol]) -> bool:
-    for symbol in symbol_graph_tree:
-        if symbol.content == "EOS_SYMBOL" and symbol.s_type == SymbolType.TERMINAL:
-            return True
-    return False
-
-
+# Discards in place the nodes without connections, when `single_nodes` is tracked only those
+# nodes are looked at instead of the whole tree.
 def _discard_single_nodes_from_tree(
-    symbol_graph_tree: dict[Symbol, OrderedSet[Symbol]]
+    symbol_graph_tree: dict[Symbol, OrderedSet[Symbol]],
+    single_nodes: Optional[Iterable[Symbol]] = None,
 ) -> dict[Symbol, OrderedSet[Symbol]]:
     single_node_symbols = []
-    symbol_graph_tree_copy = symbol_graph_tree.copy()
 
-    for symbol_key in symbol_graph_tree_copy.keys():
-        if not symbol_graph_tree_copy[symbol_key]:
+    for symbol_key in symbol_graph_tree if single_nodes is None else single_nodes:
+        if symbol_key in symbol_graph_tree and not symbol_graph_tree[symbol_key]:
             single_node_symbols.append(symbol_key)
 
     for single_node_symbol in single_node_symbols:
-        del symbol_graph_tree_copy[single_node_symbol]
+        del symbol_graph_tree[single_node_symbol]
 
-    return symbol_graph_tree_copy
+    return symbol_graph_tree
+
+
+# Merges two trees with distinct nodes, the smaller tree is merged into the larger one and
+# the right tree wins on a shared node, as with `symbol_graph_tree_lhs | symbol_graph_tree_rhs`.
+def _merge_symbol_graph_trees(
+    symbol_graph_tree_lhs: dict[Symbol, OrderedSet[Symbol]],
+    symbol_graph_tree_rhs: dict[Symbol, OrderedSet[Symbol]],
+) -> dict[Symbol, OrderedSet[Symbol]]:
+    if len(symbol_graph_tree_lhs) >= len(symbol_graph_tree_rhs):
+        symbol_graph_tree_lhs.update(symbol_graph_tree_rhs)
+        symbol_graph_tree_out = symbol_graph_tree_lhs
+    else:
+        for symbol_key, symbol_children in symbol_graph_tree_lhs.items():
+            symbol_graph_tree_rhs.setdefault(symbol_key, symbol_children)
+        symbol_graph_tree_out = symbol_graph_tree_rhs
+
+    if not isinstance(symbol_graph_tree_out, defaultdict):
+        symbol_graph_tree_out = defaultdict(OrderedSet, symbol_graph_tree_out)
+
+    return symbol_graph_tree_out
+
+
+def _enumerate_symbol_graph_nodes(symbol_graph: SymbolGraph) -> list[Symbol]:
+    # The node ids follow the order in which symbols are first met, `INITIALS` first.
+    nodes: dict[Symbol, None] = dict.fromkeys(symbol_graph.initials)
+
+    for symbol_parent, symbol_children in symbol_graph.tree.items():
+        nodes[symbol_parent] = None
+        for symbol_child in symbol_children:
+            nodes[symbol_child] = None
+
+    for symbol_final in symbol_graph.finals:
+        nodes[symbol_final] = None
+
+    return list(nodes)
+
+
+# Classes of the nodes with the same label whose successors are in the same classes (bisimilar
+# nodes). The classes of the labels are split until they're stable, a split class only has the
+# classes of the predecessors of its moved nodes looked at again.
+def _get_bisimilar_node_classes(
+    node_labels: list[tuple[str, SymbolType]], successors: dict[int, list[int]]
+) -> dict[int, int]:
+    predecessors: dict[int, list[int]] = {node: [] for node in successors}
+    for node, node_successors in successors.items():
+        for successor in node_successors:
+            predecessors[successor].append(node)
+
+    label_classes: dict[tuple[str, SymbolType], int] = {}
+    node_classes = {
+        node: label_classes.setdefault(node_labels[node], len(label_classes))
+        for node in successors
+    }
+    class_nodes: list[list[int]] = [[] for _ in label_classes]
+    for node, node_class in node_classes.items():
+        class_nodes[node_class].append(node)
+
+    unstable_classes = set(range(len(class_nodes)))
+    while unstable_classes:
+        node_class = unstable_classes.pop()
+
+        signature_nodes: dict[frozenset[int], list[int]] = {}
+        for node in class_nodes[node_class]:
+            signature_nodes.setdefault(
+                frozenset(node_classes[successor] for successor in successors[node]),
+                [],
+            ).append(node)
+        if len(signature_nodes) == 1:
+            continue
+
+        # The first nodes keep the class, the others are moved to new classes.
+        split_nodes = iter(signature_nodes.values())
+        class_nodes[node_class] = next(split_nodes)
+        for nodes in split_nodes:
+            new_node_class = len(class_nodes)
+            class_nodes.append(nodes)
+            for node in nodes:
+                node_classes[node] = new_node_class
+            for node in nodes:
+                for predecessor in predecessors[node]:
+                    unstable_classes.add(node_classes[predecessor])
+
+    return node_classes
+
+
+# Classes of the nodes with the same label, reached from the same nodes (or both initials),
+# that either both end the rule or both don't.
+def _get_co_reachable_node_classes(
+    node_labels: list[tuple[str, SymbolType]],
+    successors: dict[int, list[int]],
+    initial_nodes: set[int],
+) -> dict[int, int]:
+    predecessors: dict[int, list[int]] = {node: [] for node in successors}
+    for node, node_successors in successors.items():
+        for successor in node_successors:
+            predecessors[successor].append(node)
+
+    signatures: dict[tuple, int] = {}
+    return {
+        node: signatures.setdefault(
+            (
+                node_labels[node],
+                node in initial_nodes,
+                bool(successors[node]),
+                frozenset(predecessors[node]),
+            ),
+            len(signatures),
+        )
+        for node in successors
+    }
+
+
+# Merges each class into its first node, which gets the successors of the whole class.
+def _merge_node_classes(
+    node_classes: dict[int, int],
+    successors: dict[int, list[int]],
+    initial_nodes: set[int],
+) -> tuple[dict[int, int], dict[int, list[int]], set[int]]:
+    class_representatives: dict[int, int] = {}
+    representatives = {
+        node: class_representatives.setdefault(node_class, node)
+        for node, node_class in node_classes.items()
+    }
+
+    merged_successors: dict[int, dict[int, None]] = {}
+    for node, node_successors in successors.items():
+        merged_successors.setdefault(representatives[node], {}).update(
+            dict.fromkeys(representatives[successor] for successor in node_successors)
+        )
+
+    return (
+        representatives,
+        {
+            node: list(node_successors)
+            for node, node_successors in merged_successors.items()
+        },
+        {representatives[node] for node in initial_nodes},
+    )
 
 
 def _get_symbol_from_content_attr(
@@ -78,137 +219,151 @@ def _get_symbol_from_content_attr(
     return symbols
 
 
-# Throws exception if delimiters are invalid.
-def _check_for_delimiter_coherence(symbol_def_str: list[str]):
-    stack_delim_tracker: Deque[tuple[int, str]] = deque()
-
-    # We capture the index to send useful error messages.
-    for symbol_index, symbol_str in enumerate(symbol_def_str):
-        if symbol_str in ["(", "[", "{"]:
-            stack_delim_tracker.append((symbol_index, symbol_str))
-
-        elif symbol_str == ")":
-            if stack_delim_tracker[-1][1] != "(":
-                raise InvalidDelimiters(
-                    f'No opening delimiter `(` found for `)` in `{" ".join(symbol_def_str[:symbol_index])} <<{symbol_def_str[symbol_index]}>>`.'
-                )
-            stack_delim_tracker.pop()
-
-        elif symbol_str == "}":
-            if stack_delim_tracker[-1][1] != "{":
-                raise InvalidDelimiters(
-                    f'No opening delimiter {"`{`"} found for {"`}`"} in `{" ".join(symbol_def_str[:symbol_index])} <<{symbol_def_str[symbol_index]}>>`.'
-                )
-            stack_delim_tracker.pop()
-
-        elif symbol_str == "]":
-            if stack_delim_tracker[-1][1] != "[":
-                # print(stack_delim_tracker[: symbol_index + 1])
-                raise InvalidDelimiters(
-                    f'No opening delimiter `[` found for `]` in `{" ".join(symbol_def_str[:symbol_index])} <<{symbol_def_str[symbol_index]}>>`.'
-                )
-            stack_delim_tracker.pop()
-
-    # Raise an exception if the stack is not empty.
-    if stack_delim_tracker:
-        symbol_index, symbol_str = stack_delim_tracker[-1]
-        raise InvalidDelimiters(
-            f'Non enclosed delimiter `{symbol_str}` in `{" ".join(symbol_def_str[:symbol_index+1])}`.'
-        )
-
-
-def _is_valid_symbol_syntax(symbol_str: str) -> bool:
-    # Special characters REGEX.
-    regex = re.compile(r"[@_!#$%^&*()<>?/\\|}~:]")
+# Whitespace runs, quotes, the `Regex` keyword and delimiters, everything else is read as
+# part of the symbol around it.
+_SYMBOL_DEF_SCANNER = re.compile(r'\s+|"|Regex|[()\[\]{}]')
 
-    def _is_terminal(symbol_str: str):
-        return symbol_str[0] == '"' and symbol_str[-1] == '"'
+# Special characters REGEX.
+_NON_TERMINAL_SPECIAL_CHARACTERS = re.compile(r"[@_!#$%^&*()<>?/\\|}~:]")
 
-    def _is_non_terminal(symbol_str: str):
-        return (
-            symbol_str[0] != '"'
-            and symbol_str[-1] != '"'
-            and (regex.search(symbol_str) is None)
-        )
-
-    def _is_regex(symbol_str: str):
-        return symbol_str.startswith('Regex("') and symbol_str.endswith('")')
-
-    def _is_special_symbol(symbol_str: str):
-        return len(symbol_str) == 1
-
-    return (
-        _is_terminal(symbol_str)
-        or _is_non_terminal(symbol_str)
-        or _is_regex(symbol_str)
-        or _is_special_symbol(symbol_str)
-    )
-
-
-# # This checks if the symbol's syntax is correct.
-def _check_symbol_syntax(symbol_def_str: list[str]):
-    for symbol_str in symbol_def_str:
-        # 1) Check for symbol validity.
-        if not _is_valid_symbol_syntax(symbol_str):
-            raise InvalidSymbol(f"Invalid symbol name {symbol_str}.")
-
-
-# This checks if the definition is correct.
-def _check_for_errors_symbol_def(symbol_def_str: list[str]):
-    # [NOTE] Needs tests.
-    _check_symbol_syntax(symbol_def_str)
-    _check_for_delimiter_coherence(symbol_def_str)
+_OPENING_DELIMITERS = {")": "(", "]": "[", "}": "{"}
 
+_SINGLE_CHARACTER_TOKEN_TYPES = {
+    "(": TokenType.OPENING_DELIMITER,
+    "[": TokenType.OPENING_DELIMITER,
+    "{": TokenType.OPENING_DELIMITER,
+    ")": TokenType.CLOSING_DELIMITER,
+    "]": TokenType.CLOSING_DELIMITER,
+    "}": TokenType.CLOSING_DELIMITER,
+    "|": TokenType.OR,
+}
 
-# [TODO] Need additional initial `( )` for `build_full_graph` to start.
-def _insert_standard_delimiters(symbol_def: str):
-    return "(" + symbol_def + ")"
 
-
-# Insert space between delimiters, `terminal` delimiters `"(", ")", "[", "]", "{", "}"` are not considered.
-def _insert_space_between_delimiters(symbol_def_str: list[str]) -> str:
+# Yields the `(start, end)` span of each symbol of the definition in a single pass.
+# Delimiters `"(", ")", "[", "]", "{", "}"` are symbols of their own, but within a terminal
+# or a `Regex(...)` where they belong to the symbol.
+def _iter_symbol_def_spans(symbol_def: str) -> Iterator[tuple[int, int]]:
     in_quote = False
     in_regex = False
-    result = []
-    i = 0
-
-    while i < len(symbol_def_str):
-        if symbol_def_str[i] == '"' and not in_regex:
-            in_quote = not in_quote
-            result.append(symbol_def_str[i])
-        elif symbol_def_str[i : i + 5] == "Regex":
+    # Start of the symbol being read, `-1` in between symbols.
+    symbol_start = -1
+    previous_end = 0
+
+    for match in _SYMBOL_DEF_SCANNER.finditer(symbol_def):
+        start, end = match.span()
+        if symbol_start < 0 and start > previous_end:
+            symbol_start = previous_end
+        previous_end = end
+
+        char = symbol_def[start]
+        if char == '"':
+            if not in_regex:
+                in_quote = not in_quote
+        elif char == "R":
             in_regex = True
-            result.append(symbol_def_str[i])
-        elif symbol_def_str[i] in "([{" and not in_quote and not in_regex:
-            result.append(" " + symbol_def_str[i] + " ")
-        elif symbol_def_str[i] in ")]}" and not in_quote and not in_regex:
-            result.append(" " + symbol_def_str[i] + " ")
-        elif symbol_def_str[i] == ")" and in_regex:
-            in_regex = False
-            result.append(symbol_def_str[i])
+        elif char in "([{)]}":
+            if not in_quote and not in_regex:
+                if symbol_start >= 0:
+                    yield symbol_start, start
+                    symbol_start = -1
+                yield start, end
+                continue
+            if char == ")" and in_regex:
+                in_regex = False
         else:
-            result.append(symbol_def_str[i])
-        i += 1
-
-    return "".join(result)
+            if symbol_start >= 0:
+                yield symbol_start, start
+                symbol_start = -1
+            continue
+
+        if symbol_start < 0:
+            symbol_start = start
+
+    if symbol_start < 0 and len(symbol_def) > previous_end:
+        symbol_start = previous_end
+    if symbol_start >= 0:
+        yield symbol_start, len(symbol_def)
+
+
+def _get_token_type(symbol_str: str) -> Optional[TokenType]:
+    if len(symbol_str) == 1 and symbol_str in _SINGLE_CHARACTER_TOKEN_TYPES:
+        return _SINGLE_CHARACTER_TOKEN_TYPES[symbol_str]
+
+    if symbol_str[0] == '"' and symbol_str[-1] == '"':
+        return TokenType.TERMINAL
+
+    if (
+        symbol_str[0] != '"'
+        and symbol_str[-1] != '"'
+        and _NON_TERMINAL_SPECIAL_CHARACTERS.search(symbol_str) is None
+    ):
+        return TokenType.NON_TERMINAL
+
+    if symbol_str.startswith('Regex("') and symbol_str.endswith('")'):
+        return TokenType.REGEX
+
+    if len(symbol_str) == 1:
+        return TokenType.SPECIAL
+
+    # Invalid symbol.
+    return None
+
+
+# Reads the definition into tokens while checking the syntax of the symbols and the
+# coherence of the delimiters, all in one pass. Invalid symbols are reported before invalid
+# delimiters, so the first delimiter error is only raised once the whole definition is read.
+def _lex_symbol_def(symbol_def: str) -> list[Token]:
+    # [TODO] Need additional initial `( )` for `build_full_graph` to start.
+    # Offsets are given in `symbol_def`, the additional `(` is at `-1`.
+    standard_symbol_def = "(" + symbol_def + ")"
+
+    tokens: list[Token] = []
+    # Indices of the tokens of the opening delimiters that aren't closed yet.
+    stack_delim_tracker: list[int] = []
+    delimiters_error: Optional[InvalidDelimiters] = None
+
+    for start, end in _iter_symbol_def_spans(standard_symbol_def):
+        symbol_str = standard_symbol_def[start:end]
+        token_type = _get_token_type(symbol_str)
+
+        if token_type is None:
+            raise InvalidSymbol(f"Invalid symbol name {symbol_str}.", start - 1)
+
+        if delimiters_error is None:
+            if token_type == TokenType.OPENING_DELIMITER:
+                stack_delim_tracker.append(len(tokens))
+
+            elif token_type == TokenType.CLOSING_DELIMITER:
+                opening_delimiter = _OPENING_DELIMITERS[symbol_str]
+                if (
+                    not stack_delim_tracker
+                    or tokens[stack_delim_tracker[-1]].content != opening_delimiter
+                ):
+                    delimiters_error = InvalidDelimiters(
+                        f'No opening delimiter `{opening_delimiter}` found for `{symbol_str}` in `{" ".join(token.content for token in tokens)} <<{symbol_str}>>`.',
+                        start - 1,
+                    )
+                else:
+                    stack_delim_tracker.pop()
+
+        tokens.append(Token(symbol_str, token_type, start - 1))
+
+    if delimiters_error is not None:
+        raise delimiters_error
 
+    # Raise an exception if the stack is not empty.
+    if stack_delim_tracker:
+        symbol_index = stack_delim_tracker[-1]
+        raise InvalidDelimiters(
+            f'Non enclosed delimiter `{tokens[symbol_index].content}` in `{" ".join(token.content for token in tokens[: symbol_index + 1])}`.',
+            tokens[symbol_index].offset,
+        )
 
-def _pre_process_symbol_def(symbol_def: str) -> str:
-    return _insert_space_between_delimiters(_insert_standard_delimiters(symbol_def))
+    return tokens
 
 
 def _convert_str_def_to_str_queue(symbol_def: str) -> Deque[str]:
-    pre_processed_symbol_def = _pre_process_symbol_def(symbol_def)
-    symbols = pre_processed_symbol_def.split()
-
-    # Check for errors.
-    _check_for_errors_symbol_def(symbols)
-
-    queue: Deque = deque()
-    for symbol in symbols:
-        queue.append(symbol)
-
-    return queue
+    return deque(token.content for token in _lex_symbol_def(symbol_def))
 
 
 def get_symbols_from_generated_symbol_graph(
@@ -0,0 +1,434 @@
+import sys
+from array import array
+from typing import Optional, Sequence
+
+from cfg_parse.base import (
+    CompiledGrammar,
+    CompiledRule,
+    FrontierSteps,
+    FrontierWalk,
+    Symbol,
+)
+from cfg_parse.cfg_compile.helpers import (
+    _NON_TERMINAL_KIND,
+    _get_strongly_connected_components,
+)
+
+
+# Rules entered from each rule without consuming a terminal, the rules its initial nodes refer
+# to. A rule never derives the empty string, so no other node of it is entered that way.
+def get_left_corner_rule_ids(
+    rules: Sequence[CompiledRule], content_rule_ids: array
+) -> list[list[int]]:
+    return [
+        list(
+            dict.fromkeys(
+                content_rule_ids[rule.contents[initial]]
+                for initial in rule.initials
+                if rule.kinds[initial] == _NON_TERMINAL_KIND
+                and content_rule_ids[rule.contents[initial]] >= 0
+            )
+        )
+        for rule in rules
+    ]
+
+
+# Groups of rules that can enter one another, or themselves, without consuming a terminal. Each
+# group is a strongly connected component of the left-corner graph, its rules in grammar order.
+def get_left_recursive_rule_groups(
+    rules: Sequence[CompiledRule], content_rule_ids: array
+) -> list[list[int]]:
+    left_corner_rule_ids = get_left_corner_rule_ids(rules, content_rule_ids)
+
+    groups = [
+        sorted(component)
+        for component in _get_strongly_connected_components(left_corner_rule_ids)
+        if len(component) > 1 or component[0] in left_corner_rule_ids[component[0]]
+    ]
+    groups.sort()
+
+    return groups
+
+
+# `1` for the rules of `groups`, the guide only looks for loops when entering them.
+def get_left_recursive_rule_flags(n_rules: int, groups: list[list[int]]) -> array:
+    left_recursive_rules = array("b", [0]) * n_rules
+    for group in groups:
+        for rule_id in group:
+            left_recursive_rules[rule_id] = 1
+    return left_recursive_rules
+
+
+# Group of each rule, empty for the rules of no group.
+def get_left_recursive_rule_group_sets(
+    n_rules: int, groups: list[list[int]]
+) -> list[Optional[frozenset[int]]]:
+    no_group: Optional[frozenset[int]] = frozenset()
+    group_sets = [no_group] * n_rules
+    for group in groups:
+        group_set = frozenset(group)
+        for rule_id in group:
+            group_sets[rule_id] = group_set
+    return group_sets
+
+
+# Rules whose left corners reach one of `rule_ids` (see `get_left_corner_rule_ids`), along with
+# `rule_ids`. Ids of `rule_ids` past the rules are only kept as they are.
+def get_rule_ids_reaching(
+    left_corner_rule_ids: list[list[int]], rule_ids: set[int]
+) -> set[int]:
+    entering_rule_ids: list[list[int]] = [[] for _ in left_corner_rule_ids]
+    for rule_id, rule_left_corner_ids in enumerate(left_corner_rule_ids):
+        for left_corner_id in rule_left_corner_ids:
+            entering_rule_ids[left_corner_id].append(rule_id)
+
+    reaching_rule_ids = set(rule_ids)
+    pending_rule_ids = [
+        rule_id for rule_id in rule_ids if rule_id < len(left_corner_rule_ids)
+    ]
+    while pending_rule_ids:
+        for entering_rule_id in entering_rule_ids[pending_rule_ids.pop()]:
+            if entering_rule_id not in reaching_rule_ids:
+                reaching_rule_ids.add(entering_rule_id)
+                pending_rule_ids.append(entering_rule_id)
+    return reaching_rule_ids
+
+
+# Finds the groups of the rules reached from `rule_id` through the initials of the rules (see
+# `get_left_recursive_rule_groups`), for a lazily compiled grammar. A strongly connected
+# component of the rules reached is one of the whole grammar, and the rules reached are those
+# the guide compiles to enter `rule_id` anyway. Rules whose group is known already are left out,
+# the rules they reach are known too.
+def _find_left_recursive_rule_groups(
+    compiled_cfg_grammar: CompiledGrammar, rule_id: int
+) -> frozenset[int]:
+    left_recursive_rules = compiled_cfg_grammar.left_recursive_rules
+    groups = compiled_cfg_grammar.left_recursive_rule_groups
+    with compiled_cfg_grammar.frontier_table.left_recursive_rule_groups_lock:
+        group = groups[rule_id]
+        if group is not None:
+            return group
+
+        reached_rule_ids = [rule_id]
+        reached_ids = {rule_id: 0}
+        left_corner_ids: list[list[int]] = []
+        for reached_rule_id in reached_rule_ids:
+            rule = compiled_cfg_grammar.rules[reached_rule_id]
+            rule_left_corner_ids = []
+            for initial in rule.initials:
+                if rule.kinds[initial] != _NON_TERMINAL_KIND:
+                    continue
+                next_rule_id = compiled_cfg_grammar.get_rule_id(rule, initial)
+                if next_rule_id < 0 or groups[next_rule_id] is not None:
+                    continue
+                if next_rule_id not in reached_ids:
+                    reached_ids[next_rule_id] = len(reached_rule_ids)
+                    reached_rule_ids.append(next_rule_id)
+                rule_left_corner_ids.append(reached_ids[next_rule_id])
+            left_corner_ids.append(rule_left_corner_ids)
+
+        no_group: frozenset[int] = frozenset()
+        for component in _get_strongly_connected_components(left_corner_ids):
+            is_left_recursive = (
+                len(component) > 1 or component[0] in left_corner_ids[component[0]]
+            )
+            group = (
+                frozenset(reached_rule_ids[i] for i in component)
+                if is_left_recursive
+                else no_group
+            )
+            for i in component:
+                left_recursive_rules[reached_rule_ids[i]] = is_left_recursive
+                groups[reached_rule_ids[i]] = group
+
+    return groups[rule_id]  # type: ignore
+
+
+# Finds the groups of `rule_ids` that aren't known yet (see `_find_left_recursive_rule_groups`),
+# and returns the groups of the whole grammar as `get_left_recursive_rule_groups` does.
+def find_left_recursive_rule_groups(
+    compiled_cfg_grammar: CompiledGrammar, rule_ids: set[int]
+) -> list[list[int]]:
+    for rule_id in sorted(rule_ids):
+        if compiled_cfg_grammar.left_recursive_rule_groups[rule_id] is None:
+            _find_left_recursive_rule_groups(compiled_cfg_grammar, rule_id)
+
+    groups = {
+        id(group): group
+        for group in compiled_cfg_grammar.left_recursive_rule_groups
+        if group
+    }
+    return sorted(sorted(group) for group in groups.values())
+
+
+# Rules of the group of `rule_id` entered since the last consumed terminal once `rule_id` is
+# entered too, `None` when `rule_id` was already entered and entering it again would loop. The
+# rules entered before `rule_id` reach it, those it can reach back are in its group: the others
+# can't be entered again from it, they're dropped so as not to tell apart the same steps.
+def _enter_left_recursive_rule(
+    compiled_cfg_grammar: CompiledGrammar,
+    rule_id: int,
+    entered_rule_ids: frozenset[int],
+) -> Optional[frozenset[int]]:
+    group = compiled_cfg_grammar.left_recursive_rule_groups[rule_id]
+    if group is None:
+        group = _find_left_recursive_rule_groups(compiled_cfg_grammar, rule_id)
+    if not group:
+        return frozenset()
+    if rule_id in entered_rule_ids:
+        return None
+    return (entered_rule_ids & group) | {rule_id}
+
+
+# Estimated resident size of `steps`, the steps they lead to are counted with their own entry.
+def _get_frontier_steps_nbytes(steps: FrontierSteps) -> int:
+    return sys.getsizeof(steps) + sum(map(sys.getsizeof, steps))
+
+
+# Steps of the guide entering the rule `rule_id`, with the rules of its group entered since the
+# last consumed terminal (see `_enter_left_recursive_rule`). Layers entering one of them again
+# have no steps as they would loop, a walk pushes nothing for them while the GSS links them back
+# to the layer already pushed. The steps of a rule only depend on the rules of its group entered
+# before it, they're built once for each of them. The rules entered are kept on an explicit
+# stack, deeply nested grammars aren't bounded by the recursion limit.
+def get_entry_frontier_steps(
+    compiled_cfg_grammar: CompiledGrammar,
+    rule_id: int,
+    entered_rule_ids: frozenset[int],
+) -> FrontierSteps:
+    frontier_table = compiled_cfg_grammar.frontier_table
+    entry_steps = frontier_table.entry_steps
+    key = (rule_id, entered_rule_ids)
+    steps = entry_steps.get(key)
+    if steps is not None:
+        return steps
+
+    # Rules being entered, with the position of their next initial to look at and the steps
+    # built so far.
+    entries: list[tuple[int, frozenset[int], int, list]] = [
+        (rule_id, entered_rule_ids, 0, [])
+    ]
+    while entries:
+        rule_id, entered_rule_ids, position, built_steps = entries[-1]
+        rule = compiled_cfg_grammar.rules[rule_id]
+
+        if position < len(rule.initials):
+            node = rule.initials[position]
+            if rule.kinds[node] != _NON_TERMINAL_KIND:
+                built_steps.append((rule.symbols[node], node, -1, ()))
+            else:
+                next_rule_id = compiled_cfg_grammar.get_rule_id(rule, node)
+                next_entered_rule_ids = _enter_left_recursive_rule(
+                    compiled_cfg_grammar, next_rule_id, entered_rule_ids
+                )
+                if next_entered_rule_ids is None:
+                    built_steps.append((rule.symbols[node], node, next_rule_id, ()))
+                else:
+                    next_steps = entry_steps.get((next_rule_id, next_entered_rule_ids))
+                    if next_steps is None:
+                        # The node is looked at again once the rule it refers to is entered.
+                        entries.append((next_rule_id, next_entered_rule_ids, 0, []))
+                        continue
+                    built_steps.append(
+                        (rule.symbols[node], node, next_rule_id, next_steps)
+                    )
+            entries[-1] = (rule_id, entered_rule_ids, position + 1, built_steps)
+            continue
+
+        entries.pop()
+        steps = entry_steps[(rule_id, entered_rule_ids)] = tuple(built_steps)
+        frontier_table.add_nbytes(_get_frontier_steps_nbytes(steps))
+
+    return entry_steps[key]
+
+
+# Steps of the guide right after `node` of the rule `rule_id`, `-1` for its initials. A
+# terminal was just consumed or a layer popped, so the rules are entered afresh.
+def get_next_frontier_steps(
+    compiled_cfg_grammar: CompiledGrammar, rule_id: int, node: int
+) -> FrontierSteps:
+    next_steps = compiled_cfg_grammar.frontier_table.next_steps
+    key = (rule_id, node)
+    steps = next_steps.get(key)
+    if steps is not None:
+        return steps
+
+    rule = compiled_cfg_grammar.rules[rule_id]
+    built_steps = []
+    for next_node in rule.get_next_nodes(node):
+        if rule.kinds[next_node] != _NON_TERMINAL_KIND:
+            built_steps.append((rule.symbols[next_node], next_node, -1, ()))
+            continue
+
+        next_rule_id = compiled_cfg_grammar.get_rule_id(rule, next_node)
+        built_steps.append(
+            (
+                rule.symbols[next_node],
+                next_node,
+                next_rule_id,
+                get_entry_frontier_steps(
+                    compiled_cfg_grammar,
+                    next_rule_id,
+                    _enter_left_recursive_rule(  # type: ignore
+                        compiled_cfg_grammar, next_rule_id, frozenset()
+                    ),
+                ),
+            )
+        )
+
+    steps = next_steps[key] = tuple(built_steps)
+    compiled_cfg_grammar.frontier_table.add_nbytes(_get_frontier_steps_nbytes(steps))
+    return steps
+
+
+def get_start_frontier_steps(compiled_cfg_grammar: CompiledGrammar) -> FrontierSteps:
+    start = compiled_cfg_grammar.start
+    return get_entry_frontier_steps(
+        compiled_cfg_grammar,
+        start,
+        _enter_left_recursive_rule(  # type: ignore
+            compiled_cfg_grammar, start, frozenset()
+        ),
+    )
+
+
+# Flattens `steps` into the pushes and the terminals the guide goes through, on an explicit
+# stack. A terminal reached through several paths is only kept with the layers of the first
+# one. The steps entering a rule are shared by all the nodes referring to it: once they were gone
+# through, the terminals they reach are all kept already, so they're only gone through once and
+# rules reached through many paths (e.g. `a: b "x" | b "y"`) aren't expanded along each of them.
+# Layers leading to no kept terminal are left out.
+def _get_frontier_walk(steps: FrontierSteps) -> FrontierWalk:
+    pushes: list[tuple[int, int, int]] = []
+    terminals: list[tuple[Symbol, int]] = []
+    kept_symbols: set[Symbol] = set()
+    # Steps are kept alive by `steps`, they're told apart by their `id`.
+    visited_steps = {id(steps)}
+
+    pending_steps = [(0, iter(steps))]
+    while pending_steps:
+        layer, steps_iter = pending_steps[-1]
+        for symbol, node, rule_id, next_steps in steps_iter:
+            if rule_id < 0:
+                if symbol not in kept_symbols:
+                    kept_symbols.add(symbol)
+                    terminals.append((symbol, layer))
+            elif id(next_steps) not in visited_steps:
+                visited_steps.add(id(next_steps))
+                pushes.append((layer, rule_id, node))
+                pending_steps.append((len(pushes), iter(next_steps)))
+                break
+        else:
+            pending_steps.pop()
+
+    # Layers are pushed after the layer they're pushed on, they're renumbered in one pass.
+    used_layers = [False] * (len(pushes) + 1)
+    used_layers[0] = True
+    for _, layer in terminals:
+        while not used_layers[layer]:
+            used_layers[layer] = True
+            layer = pushes[layer - 1][0]
+
+    layer_ids = [0] * (len(pushes) + 1)
+    used_pushes: list[tuple[int, int, int]] = []
+    for layer, (parent_layer, rule_id, node) in enumerate(pushes, 1):
+        if used_layers[layer]:
+            used_pushes.append((layer_ids[parent_layer], rule_id, node))
+            layer_ids[layer] = len(used_pushes)
+
+    return FrontierWalk(
+        tuple(used_pushes),
+        tuple((symbol, layer_ids[layer]) for symbol, layer in terminals),
+    )
+
+
+def get_next_frontier_walk(
+    compiled_cfg_grammar: CompiledGrammar, rule_id: int, node: int
+) -> FrontierWalk:
+    next_walks = compiled_cfg_grammar.frontier_table.next_walks
+    walk = next_walks.get((rule_id, node))
+    if walk is None:
+        walk = next_walks[(rule_id, node)] = _get_frontier_walk(
+            get_next_frontier_steps(compiled_cfg_grammar, rule_id, node)
+        )
+        compiled_cfg_grammar.frontier_table.add_nbytes(walk.get_nbytes())
+    return walk
+
+
+def get_start_frontier_walk(compiled_cfg_grammar: CompiledGrammar) -> FrontierWalk:
+    frontier_table = compiled_cfg_grammar.frontier_table
+    if frontier_table.start_walk is None:
+        frontier_table.start_walk = _get_frontier_walk(
+            get_start_frontier_steps(compiled_cfg_grammar)
+        )
+        frontier_table.add_nbytes(frontier_table.start_walk.get_nbytes())
+    return frontier_table.start_walk
+
+
+# Carries the groups and the steps of `previous_compiled_cfg_grammar` over to a recompiled
+# version of it (see `recompile_cfg_grammar`). `changed_rule_ids` are the rules that aren't the
+# same rule with the same id in both grammars, `stale_rule_ids` the rules reaching them through
+# their left corners (see `get_rule_ids_reaching`). The group of a rule and its entry steps only
+# depend on the rules its left corners reach, the rules of a group reach one another. The steps
+# following a node of a rule depend on the rule and on the entry steps of the rules they enter.
+# Groups of the stale rules are left unknown (see `find_left_recursive_rule_groups`).
+def carry_over_left_recursive_rule_groups(
+    previous_compiled_cfg_grammar: CompiledGrammar,
+    n_rules: int,
+    stale_rule_ids: set[int],
+) -> tuple[array, list[Optional[frozenset[int]]]]:
+    left_recursive_rules = array("b", [-1]) * n_rules
+    groups: list[Optional[frozenset[int]]] = [None] * n_rules
+    for rule_id in range(n_rules):
+        if rule_id not in stale_rule_ids:
+            left_recursive_rules[
+                rule_id
+            ] = previous_compiled_cfg_grammar.left_recursive_rules[rule_id]
+            groups[rule_id] = previous_compiled_cfg_grammar.left_recursive_rule_groups[
+                rule_id
+            ]
+    return left_recursive_rules, groups
+
+
+# Steps and walks carried over along with the groups (see
+# `carry_over_left_recursive_rule_groups`), the stale rules' are built again on first use.
+def carry_over_frontier_table(
+    previous_compiled_cfg_grammar: CompiledGrammar,
+    compiled_cfg_grammar: CompiledGrammar,
+    changed_rule_ids: set[int],
+    stale_rule_ids: set[int],
+):
+    # Copied first, guides of the previous grammar may still be adding to its table.
+    previous_frontier_table = previous_compiled_cfg_grammar.frontier_table
+    frontier_table = compiled_cfg_grammar.frontier_table
+    nbytes = 0
+
+    for entry_key, steps in list(previous_frontier_table.entry_steps.items()):
+        if entry_key[0] not in stale_rule_ids:
+            frontier_table.entry_steps[entry_key] = steps
+            nbytes += _get_frontier_steps_nbytes(steps)
+
+    for key, steps in list(previous_frontier_table.next_steps.items()):
+        if key[0] not in changed_rule_ids and all(
+            step[2] not in stale_rule_ids for step in steps
+        ):
+            frontier_table.next_steps[key] = steps
+            nbytes += _get_frontier_steps_nbytes(steps)
+
+    for key, walk in list(previous_frontier_table.next_walks.items()):
+        if key in frontier_table.next_steps:
+            frontier_table.next_walks[key] = walk
+            nbytes += walk.get_nbytes()
+    for key, gss_walk in list(previous_frontier_table.next_gss_walks.items()):
+        if key in frontier_table.next_steps:
+            frontier_table.next_gss_walks[key] = gss_walk
+            nbytes += gss_walk.get_nbytes()
+
+    if compiled_cfg_grammar.start not in stale_rule_ids:
+        frontier_table.start_walk = previous_frontier_table.start_walk
+        frontier_table.start_gss_walk = previous_frontier_table.start_gss_walk
+        for start_walk in (frontier_table.start_walk, frontier_table.start_gss_walk):
+            if start_walk is not None:
+                nbytes += start_walk.get_nbytes()
+
+    frontier_table.add_nbytes(nbytes)
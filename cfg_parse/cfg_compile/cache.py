@@ -0,0 +1,297 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from typing import Optional, Sequence
+
+from cfg_parse import __version__
+from cfg_parse.base import CompiledGrammar, CompiledRule, CompileOptions, SymbolArena
+from cfg_parse.cfg_compile.analysis import (
+    get_left_recursive_rule_flags,
+    get_left_recursive_rule_group_sets,
+    get_left_recursive_rule_groups,
+    get_start_frontier_walk,
+)
+from cfg_parse.cfg_compile.helpers import _assemble_compiled_rule
+from cfg_parse.exceptions import InvalidCompiledGrammar
+
+# Bump whenever the layout written by `_serialize_compiled_grammar` changes.
+COMPILED_GRAMMAR_FORMAT_VERSION = 4
+
+_COMPILED_GRAMMAR_MAGIC = b"CFGC"
+# magic, format version, library version length, key, payload length, payload checksum.
+_COMPILED_GRAMMAR_HEADER = struct.Struct("<4sHH32sQI")
+_UINT32 = struct.Struct("<I")
+_INT32 = struct.Struct("<i")
+# minimize, inline max nodes, eliminate dead rules.
+_COMPILE_OPTIONS = struct.Struct("<?I?")
+
+
+def get_compiled_grammar_cache_key(
+    canonical_cfg_grammar: str,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+) -> bytes:
+    # Keyed by the library version too, since the compiled layout follows the builder.
+    # Grammars compiled with other options are compiled differently, they get keys of their
+    # own.
+    options = "\0minimize" if minimize else ""
+    if inline_max_nodes > 0:
+        options += f"\0inline={inline_max_nodes}"
+    if eliminate_dead_rules:
+        options += "\0eliminate_dead_rules"
+    return hashlib.sha256(
+        f"{__version__}{options}\0{canonical_cfg_grammar}".encode("utf-8")
+    ).digest()
+
+
+def _get_compiled_grammar_cache_path(cache_dir: str, key: bytes) -> str:
+    return os.path.join(cache_dir, f"{key.hex()}.cfgc")
+
+
+def _pack_array(integers: array) -> bytes:
+    # Arrays are stored little-endian whatever the platform.
+    if sys.byteorder == "big":
+        integers = array(integers.typecode, integers)
+        integers.byteswap()
+    return _UINT32.pack(len(integers)) + integers.tobytes()
+
+
+def _unpack_array(typecode: str, data: memoryview, offset: int) -> tuple[array, int]:
+    (length,) = _UINT32.unpack_from(data, offset)
+    offset += _UINT32.size
+
+    integers = array(typecode)
+    end = offset + length * integers.itemsize
+    if end > len(data):
+        raise InvalidCompiledGrammar("Truncated compiled grammar.")
+    integers.frombytes(data[offset:end])
+
+    if sys.byteorder == "big":
+        integers.byteswap()
+    return integers, end
+
+
+def _pack_strs(strs: Sequence[str]) -> bytes:
+    chunks = [_UINT32.pack(len(strs))]
+    for string in strs:
+        string_bytes = string.encode("utf-8")
+        chunks.append(_UINT32.pack(len(string_bytes)) + string_bytes)
+    return b"".join(chunks)
+
+
+# Contents and rules of a compiled grammar, also used on their own to ship the rules compiled
+# by worker processes (see `compile_cfg_grammar`).
+def _pack_compiled_rules(
+    contents: Sequence[str], rules: Sequence[CompiledRule]
+) -> bytes:
+    # CONTENTS
+    chunks: list[bytes] = [_pack_strs(contents)]
+
+    # RULES
+    chunks.append(_UINT32.pack(len(rules)))
+    for rule in rules:
+        label_bytes = rule.label.encode("utf-8")
+        chunks.append(_UINT32.pack(len(label_bytes)) + label_bytes)
+        for integers in (
+            rule.kinds,
+            rule.contents,
+            rule.successor_offsets,
+            rule.successors,
+            rule.initials,
+            rule.finals,
+            rule.origins,
+        ):
+            chunks.append(_pack_array(integers))
+
+    return b"".join(chunks)
+
+
+def _serialize_compiled_grammar(
+    compiled_cfg_grammar: CompiledGrammar, key: bytes
+) -> bytes:
+    # The rules of a lazily compiled grammar are all compiled before being packed.
+    payload = b"".join(
+        (
+            _pack_compiled_rules(
+                compiled_cfg_grammar.contents, tuple(compiled_cfg_grammar.rules)
+            ),
+            _pack_array(compiled_cfg_grammar.content_rule_ids),
+            _INT32.pack(compiled_cfg_grammar.start),
+            _pack_strs(compiled_cfg_grammar.definitions),
+            _COMPILE_OPTIONS.pack(
+                compiled_cfg_grammar.options.minimize,
+                compiled_cfg_grammar.options.inline_max_nodes,
+                compiled_cfg_grammar.options.eliminate_dead_rules,
+            ),
+        )
+    )
+    version_bytes = __version__.encode("utf-8")
+
+    header = _COMPILED_GRAMMAR_HEADER.pack(
+        _COMPILED_GRAMMAR_MAGIC,
+        COMPILED_GRAMMAR_FORMAT_VERSION,
+        len(version_bytes),
+        key,
+        len(payload),
+        zlib.crc32(payload),
+    )
+    return header + version_bytes + payload
+
+
+def _unpack_str(data: memoryview, offset: int) -> tuple[str, int]:
+    (length,) = _UINT32.unpack_from(data, offset)
+    offset += _UINT32.size
+    if offset + length > len(data):
+        raise InvalidCompiledGrammar("Truncated compiled grammar.")
+    return str(data[offset : offset + length], "utf-8"), offset + length
+
+
+def _unpack_strs(data: memoryview, offset: int) -> tuple[list[str], int]:
+    (strs_length,) = _UINT32.unpack_from(data, offset)
+    offset += _UINT32.size
+    strs = []
+    for _ in range(strs_length):
+        string, offset = _unpack_str(data, offset)
+        strs.append(string)
+    return strs, offset
+
+
+# Reverses `_pack_compiled_rules`, each rule is given as its label and its arrays.
+def _unpack_compiled_rules(
+    data: memoryview, offset: int
+) -> tuple[list[str], list[tuple], int]:
+    # CONTENTS
+    contents, offset = _unpack_strs(data, offset)
+
+    # RULES
+    (rules_length,) = _UINT32.unpack_from(data, offset)
+    offset += _UINT32.size
+    packed_rules = []
+    for _ in range(rules_length):
+        label, offset = _unpack_str(data, offset)
+        kinds, offset = _unpack_array("b", data, offset)
+        rule_arrays = []
+        for _ in range(6):
+            integers, offset = _unpack_array("i", data, offset)
+            rule_arrays.append(integers)
+        packed_rules.append((label, kinds, *rule_arrays))
+
+    return contents, packed_rules, offset
+
+
+def _deserialize_compiled_grammar(data: bytes, key: bytes) -> CompiledGrammar:
+    if len(data) < _COMPILED_GRAMMAR_HEADER.size:
+        raise InvalidCompiledGrammar("Truncated compiled grammar header.")
+
+    (
+        magic,
+        format_version,
+        version_length,
+        stored_key,
+        payload_length,
+        checksum,
+    ) = _COMPILED_GRAMMAR_HEADER.unpack_from(data)
+
+    if magic != _COMPILED_GRAMMAR_MAGIC:
+        raise InvalidCompiledGrammar("Not a compiled grammar.")
+
+    if format_version != COMPILED_GRAMMAR_FORMAT_VERSION:
+        raise InvalidCompiledGrammar(
+            f"Stale compiled grammar format {format_version}, expected {COMPILED_GRAMMAR_FORMAT_VERSION}."
+        )
+
+    offset = _COMPILED_GRAMMAR_HEADER.size
+    version = data[offset : offset + version_length].decode("utf-8", "replace")
+    if version != __version__ or stored_key != key:
+        raise InvalidCompiledGrammar(
+            f"Stale compiled grammar built by version {version}."
+        )
+
+    payload = memoryview(data)[offset + version_length :]
+    if len(payload) != payload_length or zlib.crc32(payload) != checksum:
+        raise InvalidCompiledGrammar("Corrupted compiled grammar.")
+
+    try:
+        contents, packed_rules, offset = _unpack_compiled_rules(payload, 0)
+
+        arena = SymbolArena()
+        rules = [
+            _assemble_compiled_rule(*packed_rule, contents, arena)  # type: ignore
+            for packed_rule in packed_rules
+        ]
+
+        content_rule_ids, offset = _unpack_array("i", payload, offset)
+        (start,) = _INT32.unpack_from(payload, offset)
+        offset += _INT32.size
+        definitions, offset = _unpack_strs(payload, offset)
+        # Kept so that a recompile from the loaded grammar knows which rules it can reuse.
+        options = CompileOptions(*_COMPILE_OPTIONS.unpack_from(payload, offset))
+
+        left_recursive_rule_groups = get_left_recursive_rule_groups(
+            rules, content_rule_ids
+        )
+
+        compiled_cfg_grammar = CompiledGrammar(
+            rules=tuple(rules),
+            rule_ids={rule.label: rule_id for rule_id, rule in enumerate(rules)},
+            contents=tuple(contents),
+            content_rule_ids=content_rule_ids,
+            start=start,
+            definitions=tuple(definitions),
+            arena=arena,
+            left_recursive_rules=get_left_recursive_rule_flags(
+                len(rules), left_recursive_rule_groups
+            ),
+            left_recursive_rule_groups=get_left_recursive_rule_group_sets(
+                len(rules), left_recursive_rule_groups
+            ),
+            options=options,
+        )
+        get_start_frontier_walk(compiled_cfg_grammar)
+
+    except (struct.error, UnicodeDecodeError, ValueError, IndexError) as exc:
+        raise InvalidCompiledGrammar(f"Corrupted compiled grammar: {exc}.") from exc
+
+    return compiled_cfg_grammar
+
+
+def load_compiled_grammar(cache_dir: str, key: bytes) -> Optional[CompiledGrammar]:
+    # Missing, stale or corrupted entries are reported as a cache miss.
+    try:
+        with open(_get_compiled_grammar_cache_path(cache_dir, key), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    try:
+        return _deserialize_compiled_grammar(data, key)
+    except InvalidCompiledGrammar:
+        return None
+
+
+def save_compiled_grammar(
+    cache_dir: str, key: bytes, compiled_cfg_grammar: CompiledGrammar
+) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    data = _serialize_compiled_grammar(compiled_cfg_grammar, key)
+
+    # Written to a temporary file then renamed, processes starting at the same time either
+    # see a complete entry or none, and concurrent writers replace it with identical bytes.
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, _get_compiled_grammar_cache_path(cache_dir, key))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
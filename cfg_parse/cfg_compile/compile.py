@@ -0,0 +1,810 @@
+import warnings
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Optional
+
+from cfg_parse.base import (
+    CompiledGrammar,
+    CompiledRule,
+    CompileOptions,
+    CompileReport,
+    LazyCompiledRules,
+    SymbolArena,
+    SymbolGraph,
+)
+from cfg_parse.cfg_build.build import build_symbol_graph, minimize_symbol_graph
+from cfg_parse.cfg_build.helpers import _enumerate_symbol_graph_nodes
+from cfg_parse.cfg_compile.analysis import (
+    carry_over_frontier_table,
+    carry_over_left_recursive_rule_groups,
+    find_left_recursive_rule_groups,
+    get_left_corner_rule_ids,
+    get_left_recursive_rule_flags,
+    get_left_recursive_rule_group_sets,
+    get_left_recursive_rule_groups,
+    get_rule_ids_reaching,
+    get_start_frontier_walk,
+)
+from cfg_parse.cfg_compile.cache import (
+    _pack_compiled_rules,
+    _unpack_compiled_rules,
+    get_compiled_grammar_cache_key,
+    load_compiled_grammar,
+    save_compiled_grammar,
+)
+from cfg_parse.cfg_compile.helpers import (
+    _NON_TERMINAL_KIND,
+    _assemble_compiled_rule,
+    _canonicalize_cfg_grammar,
+    _canonicalize_cfg_grammar_definitions,
+    _check_compiled_rule,
+    _eliminate_dead_compiled_rules,
+    _inline_compiled_rules,
+    _intern_content,
+    _iter_referred_labels,
+    _link_compiled_rules,
+    _lower_symbol_graph_into_compiled_rule,
+    _split_reachable_cfg_grammar_definitions,
+    _validate_cfg_grammar_definitions,
+)
+from cfg_parse.cfg_compile.loader import CFGGrammarSource, iter_cfg_grammar_definitions
+from cfg_parse.cfg_guide.helpers import _divide_cfg_grammar_into_definitions
+
+# Grammars whose definitions add up to fewer characters are compiled serially even when
+# `max_workers` allows a process pool, starting the workers would cost more than it saves.
+PARALLEL_COMPILE_MIN_GRAMMAR_SIZE = 256 * 1024
+# Definitions are split into about this many chunks per worker, to balance the workers.
+_PARALLEL_COMPILE_CHUNKS_PER_WORKER = 4
+
+
+def compile_symbol_graphs(built_cfg_grammar: dict[str, SymbolGraph]) -> CompiledGrammar:
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    rules: list[CompiledRule] = []
+
+    for symbol_name, symbol_graph in built_cfg_grammar.items():
+        rules.append(
+            _lower_symbol_graph_into_compiled_rule(
+                symbol_name, symbol_graph, contents, content_ids
+            )
+        )
+
+    # The symbols weren't allocated from a known arena, new ones are allocated after them.
+    arena = SymbolArena(
+        max((symbol.s_id for rule in rules for symbol in rule.symbols), default=-1) + 1
+    )
+
+    return _link_compiled_grammar(rules, contents, content_ids, (), arena)
+
+
+def _link_compiled_grammar(
+    rules: list[CompiledRule],
+    contents: list[str],
+    content_ids: dict[str, int],
+    definitions: tuple[str, ...],
+    arena: SymbolArena,
+    checked_rules: Optional[list[CompiledRule]] = None,
+    report: Optional[CompileReport] = None,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+    previous_compiled_cfg_grammar: Optional[CompiledGrammar] = None,
+) -> CompiledGrammar:
+    if report is None:
+        report = CompileReport()
+
+    # Rule labels are interned too, so that `NON_TERMINAL` nodes can be linked to their rule.
+    for rule in rules:
+        _intern_content(rule.label, contents, content_ids)
+
+    if eliminate_dead_rules:
+        labels = [rule.label for rule in rules]
+        unreachable_labels, unproductive_labels = _eliminate_dead_compiled_rules(
+            rules, contents
+        )
+        report.unreachable_rules.extend(unreachable_labels)
+        report.unproductive_rules.extend(unproductive_labels)
+
+        if unreachable_labels or unproductive_labels:
+            kept_labels = {rule.label for rule in rules}
+            if definitions:
+                definitions = tuple(
+                    symbol_def
+                    for label, symbol_def in zip(labels, definitions)
+                    if label in kept_labels
+                )
+            # Dropped rules can't be linked anymore, the remaining ones replaced them.
+            checked_rules = None
+
+    rule_ids = {rule.label: rule_id for rule_id, rule in enumerate(rules)}
+
+    if inline_max_nodes > 0:
+        for label, inlined_labels in _inline_compiled_rules(
+            rules, contents, content_ids, arena, inline_max_nodes
+        ).items():
+            report.inlined_rules[label] = tuple(
+                dict.fromkeys(report.inlined_rules.get(label, ()) + inlined_labels)
+            )
+        # Inlined rules replaced the rules to check.
+        checked_rules = None
+
+    content_rule_ids = _link_compiled_rules(rules, contents, content_ids, checked_rules)
+
+    # Loops of rules are found once here, the guide ignores the paths entering a rule again
+    # without consuming a terminal. When recompiling, only the loops of the rules reaching a
+    # changed rule through their left corners are found again, the groups and the steps of the
+    # others are carried over (see `carry_over_left_recursive_rule_groups`).
+    if previous_compiled_cfg_grammar is not None and not isinstance(
+        previous_compiled_cfg_grammar.rules, LazyCompiledRules
+    ):
+        previous_rules = previous_compiled_cfg_grammar.rules
+        changed_rule_ids = {
+            rule_id
+            for rule_id in range(max(len(rules), len(previous_rules)))
+            if rule_id >= len(rules)
+            or rule_id >= len(previous_rules)
+            or rules[rule_id] is not previous_rules[rule_id]
+        }
+        stale_rule_ids = get_rule_ids_reaching(
+            get_left_corner_rule_ids(rules, content_rule_ids), changed_rule_ids
+        )
+        (
+            left_recursive_rules,
+            left_recursive_rule_group_sets,
+        ) = carry_over_left_recursive_rule_groups(
+            previous_compiled_cfg_grammar, len(rules), stale_rule_ids
+        )
+    else:
+        previous_compiled_cfg_grammar = None
+        left_recursive_rule_groups = get_left_recursive_rule_groups(
+            rules, content_rule_ids
+        )
+        left_recursive_rules = get_left_recursive_rule_flags(
+            len(rules), left_recursive_rule_groups
+        )
+        left_recursive_rule_group_sets = get_left_recursive_rule_group_sets(
+            len(rules), left_recursive_rule_groups
+        )
+
+    compiled_cfg_grammar = CompiledGrammar(
+        rules=tuple(rules),
+        rule_ids=rule_ids,
+        contents=tuple(contents),
+        content_rule_ids=content_rule_ids,
+        start=rule_ids["start"],
+        definitions=definitions,
+        arena=arena,
+        left_recursive_rules=left_recursive_rules,
+        left_recursive_rule_groups=left_recursive_rule_group_sets,
+        options=CompileOptions(minimize, inline_max_nodes, eliminate_dead_rules),
+        report=report,
+    )
+
+    if previous_compiled_cfg_grammar is not None:
+        left_recursive_rule_groups = find_left_recursive_rule_groups(
+            compiled_cfg_grammar, stale_rule_ids
+        )
+        carry_over_frontier_table(
+            previous_compiled_cfg_grammar,
+            compiled_cfg_grammar,
+            changed_rule_ids,
+            stale_rule_ids,
+        )
+
+    for group in left_recursive_rule_groups:
+        report.left_recursive_rules.append(
+            tuple(rules[rule_id].label for rule_id in group)
+        )
+    if report.left_recursive_rules:
+        warnings.warn(
+            f"Loops of non-terminal symbols are found {', '.join(' ->'.join(labels + labels[:1]) for labels in report.left_recursive_rules)}, paths entering them again will be ignored."
+        )
+
+    # The first frontier of every generation is built once here.
+    get_start_frontier_walk(compiled_cfg_grammar)
+
+    return compiled_cfg_grammar
+
+
+# Builds the symbol graph of a rule and lowers it. With `minimize`, equivalent nodes of the
+# graph are merged first and the node counts are recorded in `report`.
+def _compile_symbol_def(
+    symbol_name: str,
+    symbol_def: str,
+    arena: SymbolArena,
+    contents: list[str],
+    content_ids: dict[str, int],
+    minimize: bool,
+    report: CompileReport,
+) -> CompiledRule:
+    symbol_graph = build_symbol_graph(symbol_def, arena)
+
+    if minimize:
+        n_nodes_before = len(_enumerate_symbol_graph_nodes(symbol_graph))
+        symbol_graph = minimize_symbol_graph(symbol_graph)
+        report.minimized_rules[symbol_name] = (
+            n_nodes_before,
+            len(_enumerate_symbol_graph_nodes(symbol_graph)),
+        )
+
+    return _lower_symbol_graph_into_compiled_rule(
+        symbol_name, symbol_graph, contents, content_ids
+    )
+
+
+def _compile_cfg_grammar(
+    cfg_grammar: str,
+    max_workers: int = 1,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+) -> CompiledGrammar:
+    divided_cfg_grammar_dict = _divide_cfg_grammar_into_definitions(cfg_grammar)
+
+    if max_workers > 1 and len(divided_cfg_grammar_dict) > 1:
+        grammar_size = sum(
+            len(symbol_def) for symbol_def in divided_cfg_grammar_dict.values()
+        )
+        if grammar_size >= PARALLEL_COMPILE_MIN_GRAMMAR_SIZE:
+            report = CompileReport()
+            # Workers build whole chunks, unreachable rules are found by the lexer first.
+            if eliminate_dead_rules:
+                (
+                    divided_cfg_grammar_dict,
+                    unreachable_labels,
+                ) = _split_reachable_cfg_grammar_definitions(divided_cfg_grammar_dict)
+                report.unreachable_rules.extend(unreachable_labels)
+
+            return _compile_cfg_grammar_in_parallel(
+                divided_cfg_grammar_dict,
+                max_workers,
+                minimize,
+                inline_max_nodes,
+                eliminate_dead_rules,
+                report,
+            )
+
+    if eliminate_dead_rules:
+        return _compile_reachable_symbol_defs(
+            divided_cfg_grammar_dict, minimize, inline_max_nodes
+        )
+
+    return _compile_symbol_defs(
+        divided_cfg_grammar_dict.items(), minimize, inline_max_nodes
+    )
+
+
+# Builds the rules reachable from `start` only, the rules a rule refers to are read from its
+# compiled nodes. The rules keep the order of the grammar, the dead ones are dropped.
+def _compile_reachable_symbol_defs(
+    divided_cfg_grammar_dict: dict[str, str],
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+) -> CompiledGrammar:
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    compiled_rules: dict[str, CompiledRule] = {}
+    report = CompileReport()
+
+    arena = SymbolArena()
+    reached_labels = {"start"}
+    labels = ["start"]
+    while labels:
+        label = labels.pop()
+        rule = compiled_rules[label] = _compile_symbol_def(
+            label,
+            divided_cfg_grammar_dict[label],
+            arena,
+            contents,
+            content_ids,
+            minimize,
+            report,
+        )
+        for kind, content_id in zip(rule.kinds, rule.contents):
+            referred_label = contents[content_id]
+            if (
+                kind == _NON_TERMINAL_KIND
+                and referred_label in divided_cfg_grammar_dict
+                and referred_label not in reached_labels
+            ):
+                reached_labels.add(referred_label)
+                labels.append(referred_label)
+
+    rules: list[CompiledRule] = []
+    definitions: list[str] = []
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        if symbol_name in compiled_rules:
+            rules.append(compiled_rules[symbol_name])
+            definitions.append(symbol_def)
+        else:
+            report.unreachable_rules.append(symbol_name)
+
+    return _link_compiled_grammar(
+        rules,
+        contents,
+        content_ids,
+        tuple(definitions),
+        arena,
+        report=report,
+        minimize=minimize,
+        inline_max_nodes=inline_max_nodes,
+        eliminate_dead_rules=True,
+    )
+
+
+# Compiles the rules in the order they're given, `symbol_defs` can be read incrementally.
+def _compile_symbol_defs(
+    symbol_defs: Iterable[tuple[str, str]],
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+) -> CompiledGrammar:
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    rules: list[CompiledRule] = []
+    definitions: list[str] = []
+    report = CompileReport()
+
+    # Symbol ids are allocated per grammar. Each rule is lowered as soon as it's built, its
+    # symbol graph doesn't outlive it.
+    arena = SymbolArena()
+    for symbol_name, symbol_def in symbol_defs:
+        rules.append(
+            _compile_symbol_def(
+                symbol_name, symbol_def, arena, contents, content_ids, minimize, report
+            )
+        )
+        definitions.append(symbol_def)
+
+    return _link_compiled_grammar(
+        rules,
+        contents,
+        content_ids,
+        tuple(definitions),
+        arena,
+        report=report,
+        minimize=minimize,
+        inline_max_nodes=inline_max_nodes,
+        eliminate_dead_rules=eliminate_dead_rules,
+    )
+
+
+# Only divides the grammar, each rule is built and lowered the first time the guide looks it up.
+# With `validate`, the definitions are still checked up front by a lexer-only pass.
+# With `eliminate_dead_rules`, only the unreachable rules are dropped, finding the rules that
+# derive no terminal string would build every rule.
+def _compile_cfg_grammar_lazily(
+    divided_cfg_grammar_dict: dict[str, str],
+    validate: bool = True,
+    minimize: bool = False,
+    eliminate_dead_rules: bool = False,
+) -> CompiledGrammar:
+    report = CompileReport()
+
+    if eliminate_dead_rules:
+        (
+            divided_cfg_grammar_dict,
+            unreachable_labels,
+        ) = _split_reachable_cfg_grammar_definitions(divided_cfg_grammar_dict)
+        report.unreachable_rules.extend(unreachable_labels)
+
+    if validate:
+        _validate_cfg_grammar_definitions(divided_cfg_grammar_dict)
+
+    labels = list(divided_cfg_grammar_dict)
+    definitions = tuple(divided_cfg_grammar_dict.values())
+
+    # Rule labels are interned first, the content id of a label is the id of its rule and
+    # the contents interned afterwards don't name a rule.
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    for label in labels:
+        _intern_content(label, contents, content_ids)
+    content_rule_ids = array("i", range(len(labels)))
+
+    arena = SymbolArena()
+
+    def compile_rule(rule_id: int) -> CompiledRule:
+        rule = _compile_symbol_def(
+            labels[rule_id],
+            definitions[rule_id],
+            arena,
+            contents,
+            content_ids,
+            minimize,
+            report,
+        )
+        content_rule_ids.extend(
+            array("i", [-1]) * (len(contents) - len(content_rule_ids))
+        )
+        _check_compiled_rule(rule, contents, content_rule_ids)
+        return rule
+
+    rule_ids = {label: rule_id for rule_id, label in enumerate(labels)}
+
+    return CompiledGrammar(
+        rules=LazyCompiledRules(len(labels), compile_rule),
+        rule_ids=rule_ids,
+        contents=contents,
+        content_rule_ids=content_rule_ids,
+        start=rule_ids["start"],
+        definitions=definitions,
+        arena=arena,
+        # Finding the loops would compile every rule, the guide finds the group of a rule the
+        # first time it enters it.
+        left_recursive_rules=array("b", [-1]) * len(labels),
+        left_recursive_rule_groups=[None] * len(labels),
+        options=CompileOptions(minimize, eliminate_dead_rules=eliminate_dead_rules),
+        report=report,
+    )
+
+
+# Runs in the worker processes. Rules are sent back packed as in the cache, their content ids
+# referring to the contents of the chunk, instead of pickling symbols and graphs.
+def _compile_cfg_grammar_definitions(
+    symbol_defs: list[tuple[str, str]], minimize: bool = False
+) -> tuple[bytes, dict[str, tuple[int, int]]]:
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    report = CompileReport()
+
+    arena = SymbolArena()
+    rules = [
+        _compile_symbol_def(
+            symbol_name, symbol_def, arena, contents, content_ids, minimize, report
+        )
+        for symbol_name, symbol_def in symbol_defs
+    ]
+
+    return _pack_compiled_rules(contents, rules), report.minimized_rules
+
+
+def _split_cfg_grammar_definitions(
+    divided_cfg_grammar_dict: dict[str, str], n_chunks: int
+) -> list[list[tuple[str, str]]]:
+    # Contiguous chunks of about the same number of characters, keeping the order of the rules.
+    grammar_size = sum(
+        len(symbol_def) for symbol_def in divided_cfg_grammar_dict.values()
+    )
+    chunk_size = max(1, grammar_size // n_chunks)
+
+    chunks: list[list[tuple[str, str]]] = [[]]
+    current_chunk_size = 0
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        if current_chunk_size >= chunk_size:
+            chunks.append([])
+            current_chunk_size = 0
+        chunks[-1].append((symbol_name, symbol_def))
+        current_chunk_size += len(symbol_def)
+
+    return chunks
+
+
+def _compile_cfg_grammar_in_parallel(
+    divided_cfg_grammar_dict: dict[str, str],
+    max_workers: int,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+    report: Optional[CompileReport] = None,
+) -> CompiledGrammar:
+    contents: list[str] = []
+    content_ids: dict[str, int] = {}
+    rules: list[CompiledRule] = []
+    if report is None:
+        report = CompileReport()
+
+    chunks = _split_cfg_grammar_definitions(
+        divided_cfg_grammar_dict, max_workers * _PARALLEL_COMPILE_CHUNKS_PER_WORKER
+    )
+
+    # Chunks are merged in order and the contents of a chunk are in order of appearance, so
+    # the contents end up interned in the same order as with a serial compile.
+    arena = SymbolArena()
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        for packed_chunk, minimized_rules in executor.map(
+            partial(_compile_cfg_grammar_definitions, minimize=minimize), chunks
+        ):
+            report.minimized_rules.update(minimized_rules)
+            chunk_contents, packed_rules, _ = _unpack_compiled_rules(
+                memoryview(packed_chunk), 0
+            )
+            chunk_content_ids = [
+                _intern_content(content, contents, content_ids)
+                for content in chunk_contents
+            ]
+
+            for (
+                label,
+                kinds,
+                rule_contents,
+                successor_offsets,
+                successors,
+                initials,
+                finals,
+                origins,
+            ) in packed_rules:
+                rule_contents = array(
+                    "i", [chunk_content_ids[content_id] for content_id in rule_contents]
+                )
+                origins = array(
+                    "i",
+                    [
+                        chunk_content_ids[content_id] if content_id >= 0 else -1
+                        for content_id in origins
+                    ],
+                )
+                rules.append(
+                    _assemble_compiled_rule(
+                        label,
+                        kinds,
+                        rule_contents,
+                        successor_offsets,
+                        successors,
+                        initials,
+                        finals,
+                        origins,
+                        contents,
+                        arena,
+                    )
+                )
+
+    return _link_compiled_grammar(
+        rules,
+        contents,
+        content_ids,
+        tuple(divided_cfg_grammar_dict.values()),
+        arena,
+        report=report,
+        minimize=minimize,
+        inline_max_nodes=inline_max_nodes,
+        eliminate_dead_rules=eliminate_dead_rules,
+    )
+
+
+# Compiles `cfg_grammar` from `compiled_cfg_grammar`, an earlier version of it. Only the rules
+# whose definition changed are rebuilt, the others are reused as they are. Every rule is rebuilt
+# when `minimize`, `inline_max_nodes` or `eliminate_dead_rules` differ from the options
+# `compiled_cfg_grammar` was compiled with.
+def recompile_cfg_grammar(
+    compiled_cfg_grammar: CompiledGrammar,
+    cfg_grammar: str,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+) -> CompiledGrammar:
+    divided_cfg_grammar_dict = _divide_cfg_grammar_into_definitions(cfg_grammar)
+    report = CompileReport()
+    options = CompileOptions(minimize, inline_max_nodes, eliminate_dead_rules)
+
+    if eliminate_dead_rules:
+        (
+            divided_cfg_grammar_dict,
+            unreachable_labels,
+        ) = _split_reachable_cfg_grammar_definitions(divided_cfg_grammar_dict)
+        report.unreachable_rules.extend(unreachable_labels)
+
+    reused_rules: dict[str, CompiledRule] = {}
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        rule_id = compiled_cfg_grammar.rule_ids.get(symbol_name)
+        if (
+            compiled_cfg_grammar.options == options
+            and rule_id is not None
+            and rule_id < len(compiled_cfg_grammar.definitions)
+            and compiled_cfg_grammar.definitions[rule_id] == symbol_def
+        ):
+            # Looked up before the content table is copied, a lazily compiled grammar can
+            # still intern contents when compiling the rule.
+            reused_rules[symbol_name] = compiled_cfg_grammar.rules[rule_id]
+
+    # The paths of a rule through dropped rules (e.g. unproductive ones) were dropped, they're
+    # rebuilt in case those rules derive terminal strings now. Dropped rules are found from
+    # `rule_ids` rather than from the report, a grammar loaded from the cache has no report.
+    missing_labels = {
+        symbol_name
+        for symbol_name in divided_cfg_grammar_dict
+        if symbol_name not in compiled_cfg_grammar.rule_ids
+    }
+    if missing_labels:
+        for symbol_name in list(reused_rules):
+            if not missing_labels.isdisjoint(
+                _iter_referred_labels(divided_cfg_grammar_dict[symbol_name])
+            ):
+                del reused_rules[symbol_name]
+
+    # A rule with inlined rules is stale too once one of them is rebuilt or removed.
+    stale_rule = True
+    while stale_rule:
+        stale_rule = False
+        for symbol_name, rule in list(reused_rules.items()):
+            if any(
+                origin >= 0
+                and compiled_cfg_grammar.contents[origin] not in reused_rules
+                for origin in rule.origins
+            ):
+                del reused_rules[symbol_name]
+                stale_rule = True
+
+    # The content table is only appended to, so that the content ids of the reused rules
+    # stay valid.
+    contents = list(compiled_cfg_grammar.contents)
+    content_ids = dict(zip(contents, range(len(contents))))
+    rules: list[CompiledRule] = []
+    rebuilt_rules: list[CompiledRule] = []
+
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        if symbol_name in reused_rules:
+            rules.append(reused_rules[symbol_name])
+            if symbol_name in compiled_cfg_grammar.report.minimized_rules:
+                report.minimized_rules[
+                    symbol_name
+                ] = compiled_cfg_grammar.report.minimized_rules[symbol_name]
+            if symbol_name in compiled_cfg_grammar.report.inlined_rules:
+                report.inlined_rules[
+                    symbol_name
+                ] = compiled_cfg_grammar.report.inlined_rules[symbol_name]
+            continue
+
+        rule = _compile_symbol_def(
+            symbol_name,
+            symbol_def,
+            compiled_cfg_grammar.arena,
+            contents,
+            content_ids,
+            minimize,
+            report,
+        )
+        rules.append(rule)
+        rebuilt_rules.append(rule)
+
+    removed_rule = any(
+        symbol_name not in divided_cfg_grammar_dict
+        for symbol_name in compiled_cfg_grammar.rule_ids
+    )
+    if not rebuilt_rules and not removed_rule:
+        if list(divided_cfg_grammar_dict) == list(compiled_cfg_grammar.rule_ids):
+            return compiled_cfg_grammar
+
+    # Reused rules were checked already, unless a rule they could refer to was removed.
+    return _link_compiled_grammar(
+        rules,
+        contents,
+        content_ids,
+        tuple(divided_cfg_grammar_dict.values()),
+        compiled_cfg_grammar.arena,
+        None if removed_rule else rebuilt_rules,
+        report,
+        minimize,
+        inline_max_nodes,
+        eliminate_dead_rules,
+        compiled_cfg_grammar,
+    )
+
+
+# With `max_workers > 1`, rules of large grammars are compiled by a pool of processes.
+# With `lazy`, rules are compiled the first time they're looked up instead, `validate` still
+# checks the whole grammar up front with a lexer-only pass.
+# With `minimize`, equivalent nodes of each rule are merged (see `minimize_symbol_graph`).
+# With `inline_max_nodes > 0`, non-recursive rules of at most that many nodes are spliced into
+# the rules referring to them, so that fewer layers are pushed while guiding. Inlining would
+# compile every rule, it can't be combined with `lazy`.
+# With `eliminate_dead_rules`, the rules unreachable from `start` are dropped before being
+# built, and so are the rules deriving no terminal string along with the paths through them.
+def compile_cfg_grammar(
+    cfg_grammar: str,
+    cache_dir: Optional[str] = None,
+    max_workers: int = 1,
+    lazy: bool = False,
+    validate: bool = True,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+) -> CompiledGrammar:
+    if lazy and inline_max_nodes > 0:
+        raise ValueError("A lazily compiled grammar can't be inlined.")
+
+    if cache_dir is None:
+        if lazy:
+            return _compile_cfg_grammar_lazily(
+                _divide_cfg_grammar_into_definitions(cfg_grammar),
+                validate,
+                minimize,
+                eliminate_dead_rules,
+            )
+        return _compile_cfg_grammar(
+            cfg_grammar, max_workers, minimize, inline_max_nodes, eliminate_dead_rules
+        )
+
+    key = get_compiled_grammar_cache_key(
+        _canonicalize_cfg_grammar(cfg_grammar),
+        minimize,
+        inline_max_nodes,
+        eliminate_dead_rules,
+    )
+
+    compiled_cfg_grammar = load_compiled_grammar(cache_dir, key)
+    if compiled_cfg_grammar is not None:
+        return compiled_cfg_grammar
+
+    # [NOTE] Caching would compile every rule, a lazily compiled grammar isn't saved.
+    if lazy:
+        return _compile_cfg_grammar_lazily(
+            _divide_cfg_grammar_into_definitions(cfg_grammar),
+            validate,
+            minimize,
+            eliminate_dead_rules,
+        )
+
+    # Missing, stale or corrupted entries are rebuilt and replaced.
+    compiled_cfg_grammar = _compile_cfg_grammar(
+        cfg_grammar, max_workers, minimize, inline_max_nodes, eliminate_dead_rules
+    )
+    try:
+        save_compiled_grammar(cache_dir, key, compiled_cfg_grammar)
+    except OSError as exc:
+        warnings.warn(f"Compiled grammar couldn't be cached in {cache_dir}: {exc}.")
+
+    return compiled_cfg_grammar
+
+
+# Compiles a grammar file (see `iter_cfg_grammar_definitions`), each rule is compiled as soon as
+# it's read, the text of the whole grammar is never held at once. Dead rules can only be found
+# once every rule is read, with `eliminate_dead_rules` they're dropped after being built.
+# With `cache_dir` or `lazy`, the definitions are all read first, to key the cache or to be
+# compiled on demand, then the grammar is compiled as `compile_cfg_grammar` does.
+def compile_cfg_grammar_file(
+    source: CFGGrammarSource,
+    minimize: bool = False,
+    inline_max_nodes: int = 0,
+    eliminate_dead_rules: bool = False,
+    cache_dir: Optional[str] = None,
+    lazy: bool = False,
+    validate: bool = True,
+) -> CompiledGrammar:
+    if lazy and inline_max_nodes > 0:
+        raise ValueError("A lazily compiled grammar can't be inlined.")
+
+    if cache_dir is None and not lazy:
+        return _compile_symbol_defs(
+            iter_cfg_grammar_definitions(source),
+            minimize,
+            inline_max_nodes,
+            eliminate_dead_rules,
+        )
+
+    divided_cfg_grammar_dict = dict(iter_cfg_grammar_definitions(source))
+    if cache_dir is None:
+        return _compile_cfg_grammar_lazily(
+            divided_cfg_grammar_dict, validate, minimize, eliminate_dead_rules
+        )
+
+    key = get_compiled_grammar_cache_key(
+        _canonicalize_cfg_grammar_definitions(divided_cfg_grammar_dict),
+        minimize,
+        inline_max_nodes,
+        eliminate_dead_rules,
+    )
+
+    compiled_cfg_grammar = load_compiled_grammar(cache_dir, key)
+    if compiled_cfg_grammar is not None:
+        return compiled_cfg_grammar
+
+    # [NOTE] Caching would compile every rule, a lazily compiled grammar isn't saved.
+    if lazy:
+        return _compile_cfg_grammar_lazily(
+            divided_cfg_grammar_dict, validate, minimize, eliminate_dead_rules
+        )
+
+    compiled_cfg_grammar = _compile_symbol_defs(
+        divided_cfg_grammar_dict.items(),
+        minimize,
+        inline_max_nodes,
+        eliminate_dead_rules,
+    )
+    try:
+        save_compiled_grammar(cache_dir, key, compiled_cfg_grammar)
+    except OSError as exc:
+        warnings.warn(f"Compiled grammar couldn't be cached in {cache_dir}: {exc}.")
+
+    return compiled_cfg_grammar
@@ -0,0 +1,594 @@
+from array import array
+from typing import Iterable, Iterator, Optional, Sequence
+
+from cfg_parse.base import (
+    CompiledRule,
+    Symbol,
+    SymbolArena,
+    SymbolGraph,
+    SymbolType,
+    TokenType,
+)
+from cfg_parse.cfg_build.helpers import (
+    _enumerate_symbol_graph_nodes,
+    _iter_symbol_def_spans,
+    _lex_symbol_def,
+)
+from cfg_parse.cfg_guide.helpers import _divide_cfg_grammar_into_definitions
+from cfg_parse.exceptions import InvalidGrammar
+
+# `CompiledRule.kinds` holds `SymbolType` values, this avoids going through the enum at guide time.
+_NON_TERMINAL_KIND = SymbolType.NON_TERMINAL.value
+
+
+def _intern_content(content: str, contents: list[str], content_ids: dict[str, int]):
+    content_id = content_ids.get(content)
+    if content_id is None:
+        content_id = content_ids[content] = len(contents)
+        contents.append(content)
+    return content_id
+
+
+def _lower_symbol_graph_into_compiled_rule(
+    label: str,
+    symbol_graph: SymbolGraph,
+    contents: list[str],
+    content_ids: dict[str, int],
+) -> CompiledRule:
+    symbols = _enumerate_symbol_graph_nodes(symbol_graph)
+    node_ids = {symbol: node for node, symbol in enumerate(symbols)}
+
+    kinds = array("b", [symbol.s_type.value for symbol in symbols])
+    symbol_contents = array(
+        "i",
+        [_intern_content(symbol.content, contents, content_ids) for symbol in symbols],
+    )
+
+    # CSR adjacency, the successors of `node` are `successors[successor_offsets[node]:successor_offsets[node + 1]]`.
+    successor_offsets = array("i", [0])
+    successors = array("i")
+    for symbol in symbols:
+        successors.extend(
+            node_ids[symbol_child] for symbol_child in symbol_graph.tree.get(symbol, ())
+        )
+        successor_offsets.append(len(successors))
+
+    return CompiledRule(
+        label=label,
+        kinds=kinds,
+        contents=symbol_contents,
+        successor_offsets=successor_offsets,
+        successors=successors,
+        initials=array("i", [node_ids[symbol] for symbol in symbol_graph.initials]),
+        finals=array("i", [node_ids[symbol] for symbol in symbol_graph.finals]),
+        symbols=tuple(symbols),
+        node_ids=node_ids,
+    )
+
+
+# Only the `NON_TERMINAL` nodes of `checked_rules` (all the rules by default) are checked
+# against the rules of the grammar.
+def _link_compiled_rules(
+    rules: list[CompiledRule],
+    contents: list[str],
+    content_ids: dict[str, int],
+    checked_rules: Optional[Iterable[CompiledRule]] = None,
+) -> array:
+    # Maps each content id to the id of the rule it names, `-1` if it doesn't name a rule.
+    content_rule_ids = array("i", [-1]) * len(contents)
+    for rule_id, rule in enumerate(rules):
+        content_id = content_ids.get(rule.label)
+        if content_id is not None:
+            content_rule_ids[content_id] = rule_id
+
+    for rule in rules if checked_rules is None else checked_rules:
+        _check_compiled_rule(rule, contents, content_rule_ids)
+
+    return content_rule_ids
+
+
+def _check_compiled_rule(
+    rule: CompiledRule, contents: Sequence[str], content_rule_ids: array
+) -> None:
+    for kind, content_id in zip(rule.kinds, rule.contents):
+        if kind == _NON_TERMINAL_KIND and content_rule_ids[content_id] == -1:
+            raise InvalidGrammar(
+                f"Undefined grammar rule: {contents[content_id]} (in {rule.label})."
+            )
+
+
+# Lexer-only check of the definitions, cheaper than building them: invalid symbols and
+# delimiters are raised as when building, and so are the non-terminals that name no rule.
+def _validate_cfg_grammar_definitions(
+    divided_cfg_grammar_dict: dict[str, str],
+) -> None:
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        for label in _iter_referred_labels(symbol_def):
+            if label not in divided_cfg_grammar_dict:
+                raise InvalidGrammar(
+                    f"Undefined grammar rule: {label} (in {symbol_name})."
+                )
+
+
+def _assemble_compiled_rule(
+    label: str,
+    kinds: array,
+    contents: array,
+    successor_offsets: array,
+    successors: array,
+    initials: array,
+    finals: array,
+    origins: array,
+    grammar_contents: Sequence[str],
+    arena: SymbolArena,
+) -> CompiledRule:
+    # Front-end symbols are recreated from the arrays, each node gets its own symbol.
+    symbols = tuple(
+        arena.create_symbol(grammar_contents[content_id], SymbolType(kind))
+        for kind, content_id in zip(kinds, contents)
+    )
+
+    return CompiledRule(
+        label=label,
+        kinds=kinds,
+        contents=contents,
+        successor_offsets=successor_offsets,
+        successors=successors,
+        initials=initials,
+        finals=finals,
+        symbols=symbols,
+        node_ids={symbol: node for node, symbol in enumerate(symbols)},
+        origins=origins,
+    )
+
+
+# Strongly connected components of a graph given by the successors of its nodes, found with
+# Tarjan's algorithm on an explicit stack. Components come out in reverse topological order,
+# the components reached from a component come out before it.
+def _get_strongly_connected_components(
+    successors: Sequence[Sequence[int]],
+) -> list[list[int]]:
+    indices = [-1] * len(successors)
+    low_links = [0] * len(successors)
+    on_stack = [False] * len(successors)
+    stack: list[int] = []
+    components: list[list[int]] = []
+    index = 0
+
+    for root in range(len(successors)):
+        if indices[root] >= 0:
+            continue
+
+        indices[root] = low_links[root] = index
+        index += 1
+        stack.append(root)
+        on_stack[root] = True
+        # Nodes being visited, with the position of their next successor to look at.
+        visits = [(root, 0)]
+
+        while visits:
+            node, position = visits[-1]
+            if position < len(successors[node]):
+                visits[-1] = (node, position + 1)
+                successor = successors[node][position]
+                if indices[successor] < 0:
+                    indices[successor] = low_links[successor] = index
+                    index += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    visits.append((successor, 0))
+                elif on_stack[successor]:
+                    low_links[node] = min(low_links[node], indices[successor])
+                continue
+
+            visits.pop()
+            if visits:
+                parent = visits[-1][0]
+                low_links[parent] = min(low_links[parent], low_links[node])
+
+            if low_links[node] == indices[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    return components
+
+
+# Copies the rules of `callee_rules` in place of the `NON_TERMINAL` nodes of `rule` referring to
+# them. The ends of a copy lead to what followed its node, the copies get their own symbols and
+# remember the label of the rule they come from in `origins`.
+def _splice_compiled_rules(
+    rule: CompiledRule,
+    callee_rules: dict[int, CompiledRule],
+    contents: list[str],
+    content_ids: dict[str, int],
+    arena: SymbolArena,
+) -> CompiledRule:
+    kinds = array("b")
+    node_contents = array("i")
+    origins = array("i")
+    symbols: list[Symbol] = []
+    # New id of each node of `rule`, the id of the first node of its copy when it's inlined.
+    new_nodes: list[int] = []
+
+    for node in range(len(rule)):
+        new_nodes.append(len(kinds))
+        callee_rule = callee_rules.get(node)
+
+        if callee_rule is None:
+            kinds.append(rule.kinds[node])
+            node_contents.append(rule.contents[node])
+            origins.append(rule.origins[node] if rule.origins else -1)
+            symbols.append(rule.symbols[node])
+            continue
+
+        label_content_id = _intern_content(callee_rule.label, contents, content_ids)
+        kinds.extend(callee_rule.kinds)
+        node_contents.extend(callee_rule.contents)
+        # Nodes inlined into the callee keep the label of the rule they come from.
+        origins.extend(
+            [
+                origin if origin >= 0 else label_content_id
+                for origin in callee_rule.origins
+            ]
+            if callee_rule.origins
+            else [label_content_id] * len(callee_rule)
+        )
+        symbols.extend(
+            arena.create_symbol(contents[content_id], SymbolType(kind))
+            for kind, content_id in zip(callee_rule.kinds, callee_rule.contents)
+        )
+
+    # New nodes reached when moving to `nodes`, the initials of the copy of an inlined node.
+    def get_new_nodes(nodes: Iterable[int]) -> list[int]:
+        reached_nodes: dict[int, None] = {}
+        for node in nodes:
+            callee_rule = callee_rules.get(node)
+            if callee_rule is None:
+                reached_nodes[new_nodes[node]] = None
+            else:
+                reached_nodes.update(
+                    dict.fromkeys(
+                        new_nodes[node] + initial for initial in callee_rule.initials
+                    )
+                )
+        return list(reached_nodes)
+
+    successor_offsets = array("i", [0])
+    successors = array("i")
+    for node in range(len(rule)):
+        next_nodes = get_new_nodes(rule.get_next_nodes(node))
+        callee_rule = callee_rules.get(node)
+
+        if callee_rule is None:
+            successors.extend(next_nodes)
+            successor_offsets.append(len(successors))
+            continue
+
+        for callee_node in range(len(callee_rule)):
+            callee_next_nodes = callee_rule.get_next_nodes(callee_node)
+            if callee_next_nodes:
+                successors.extend(
+                    new_nodes[node] + callee_next_node
+                    for callee_next_node in callee_next_nodes
+                )
+            else:
+                successors.extend(next_nodes)
+            successor_offsets.append(len(successors))
+
+    finals: dict[int, None] = {}
+    for node in rule.finals:
+        callee_rule = callee_rules.get(node)
+        if callee_rule is None:
+            finals[new_nodes[node]] = None
+        else:
+            finals.update(
+                dict.fromkeys(new_nodes[node] + final for final in callee_rule.finals)
+            )
+
+    return CompiledRule(
+        label=rule.label,
+        kinds=kinds,
+        contents=node_contents,
+        successor_offsets=successor_offsets,
+        successors=successors,
+        initials=array("i", get_new_nodes(rule.initials)),
+        finals=array("i", finals),
+        symbols=tuple(symbols),
+        node_ids={symbol: node for node, symbol in enumerate(symbols)},
+        origins=origins,
+    )
+
+
+# Inlines the rules of at most `inline_max_nodes` nodes that can't reach themselves into the
+# rules referring to them, so that the guide doesn't push a layer for each of them. Rules are
+# inlined after the rules they refer to, the ones they were inlined into are replaced in
+# `rules`. Returns the labels of the rules inlined into each rule.
+def _inline_compiled_rules(
+    rules: list[CompiledRule],
+    contents: list[str],
+    content_ids: dict[str, int],
+    arena: SymbolArena,
+    inline_max_nodes: int,
+) -> dict[str, tuple[str, ...]]:
+    rule_ids = {rule.label: rule_id for rule_id, rule in enumerate(rules)}
+
+    # Rules each rule refers to, undefined rules are reported by `_link_compiled_rules`.
+    referred_rule_ids: list[list[int]] = []
+    for rule in rules:
+        referred_rule_ids.append(
+            list(
+                dict.fromkeys(
+                    rule_ids[contents[content_id]]
+                    for kind, content_id in zip(rule.kinds, rule.contents)
+                    if kind == _NON_TERMINAL_KIND and contents[content_id] in rule_ids
+                )
+            )
+        )
+
+    inlined_rules: dict[str, tuple[str, ...]] = {}
+    inlinable_rule_ids: set[int] = set()
+    for component in _get_strongly_connected_components(referred_rule_ids):
+        for rule_id in component:
+            rule = rules[rule_id]
+            callee_rules = {
+                node: rules[rule_ids[contents[content_id]]]
+                for node, (kind, content_id) in enumerate(
+                    zip(rule.kinds, rule.contents)
+                )
+                if kind == _NON_TERMINAL_KIND
+                and rule_ids.get(contents[content_id]) in inlinable_rule_ids
+            }
+            if callee_rules:
+                rules[rule_id] = _splice_compiled_rules(
+                    rule, callee_rules, contents, content_ids, arena
+                )
+                inlined_rules[rule.label] = tuple(
+                    dict.fromkeys(
+                        callee_rule.label for callee_rule in callee_rules.values()
+                    )
+                )
+
+        (rule_id, *other_rule_ids) = component
+        if (
+            not other_rule_ids
+            and rule_id not in referred_rule_ids[rule_id]
+            and rules[rule_id].initials
+            and len(rules[rule_id]) <= inline_max_nodes
+        ):
+            inlinable_rule_ids.add(rule_id)
+
+    return inlined_rules
+
+
+# Labels of the rules a definition refers to, as they're met by the lexer.
+def _iter_referred_labels(symbol_def: str) -> Iterator[str]:
+    for token in _lex_symbol_def(symbol_def):
+        # Single special characters are built into `NON_TERMINAL` symbols too.
+        if token.t_type in (TokenType.NON_TERMINAL, TokenType.SPECIAL):
+            yield token.content
+
+
+# Rules reachable from `start` through the non-terminals of the definitions, found with the
+# lexer only so that unreachable rules are dropped before being built. Returns the reachable
+# definitions in grammar order and the labels of the unreachable rules.
+def _split_reachable_cfg_grammar_definitions(
+    divided_cfg_grammar_dict: dict[str, str],
+) -> tuple[dict[str, str], list[str]]:
+    reachable_labels = {"start"}
+    labels = ["start"]
+    while labels:
+        for label in _iter_referred_labels(divided_cfg_grammar_dict[labels.pop()]):
+            if label in divided_cfg_grammar_dict and label not in reachable_labels:
+                reachable_labels.add(label)
+                labels.append(label)
+
+    reachable_cfg_grammar_dict: dict[str, str] = {}
+    unreachable_labels: list[str] = []
+    for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
+        if symbol_name in reachable_labels:
+            reachable_cfg_grammar_dict[symbol_name] = symbol_def
+        else:
+            unreachable_labels.append(symbol_name)
+
+    return reachable_cfg_grammar_dict, unreachable_labels
+
+
+def _is_dead_node(
+    rule: CompiledRule, node: int, contents: Sequence[str], dead_labels: set[str]
+) -> bool:
+    return (
+        rule.kinds[node] == _NON_TERMINAL_KIND
+        and contents[rule.contents[node]] in dead_labels
+    )
+
+
+# Whether an end of `rule` can be reached from each node without going through a
+# `NON_TERMINAL` node naming one of `dead_labels`. Ends are the nodes without successors.
+def _get_live_nodes(
+    rule: CompiledRule, contents: Sequence[str], dead_labels: set[str]
+) -> list[bool]:
+    live_nodes = [False] * len(rule)
+    predecessors: list[list[int]] = [[] for _ in range(len(rule))]
+    nodes: list[int] = []
+
+    for node in range(len(rule)):
+        if _is_dead_node(rule, node, contents, dead_labels):
+            continue
+        next_nodes = rule.get_next_nodes(node)
+        if not next_nodes:
+            live_nodes[node] = True
+            nodes.append(node)
+        for next_node in next_nodes:
+            predecessors[next_node].append(node)
+
+    while nodes:
+        for predecessor in predecessors[nodes.pop()]:
+            if not live_nodes[predecessor]:
+                live_nodes[predecessor] = True
+                nodes.append(predecessor)
+
+    return live_nodes
+
+
+# Labels of the rules that derive no terminal string, none of their paths reaches an end
+# without going through one of them. Undefined rules are left to `_link_compiled_rules`.
+def _get_unproductive_labels(
+    rules: Sequence[CompiledRule], contents: Sequence[str]
+) -> set[str]:
+    unproductive_labels = {rule.label for rule in rules}
+
+    # Rules are checked again only when a rule they refer to turns out productive.
+    referring_rules: dict[str, list[CompiledRule]] = {}
+    for rule in rules:
+        for kind, content_id in dict.fromkeys(zip(rule.kinds, rule.contents)):
+            if kind == _NON_TERMINAL_KIND:
+                referring_rules.setdefault(contents[content_id], []).append(rule)
+
+    checked_rules = list(rules)
+    checked_labels = set(unproductive_labels)
+    while checked_rules:
+        rule = checked_rules.pop()
+        checked_labels.discard(rule.label)
+        live_nodes = _get_live_nodes(rule, contents, unproductive_labels)
+        if any(live_nodes[initial] for initial in rule.initials):
+            unproductive_labels.discard(rule.label)
+            for referring_rule in referring_rules.get(rule.label, ()):
+                if (
+                    referring_rule.label in unproductive_labels
+                    and referring_rule.label not in checked_labels
+                ):
+                    checked_labels.add(referring_rule.label)
+                    checked_rules.append(referring_rule)
+
+    return unproductive_labels
+
+
+# Drops the paths of `rule` going through rules of `dead_labels`, along with the nodes left
+# unreachable from its initials. Returns `rule` itself when no path is dropped.
+def _prune_compiled_rule(
+    rule: CompiledRule, contents: Sequence[str], dead_labels: set[str]
+) -> CompiledRule:
+    if not any(
+        kind == _NON_TERMINAL_KIND and contents[content_id] in dead_labels
+        for kind, content_id in zip(rule.kinds, rule.contents)
+    ):
+        return rule
+
+    live_nodes = _get_live_nodes(rule, contents, dead_labels)
+    kept_nodes = [False] * len(rule)
+    nodes = [initial for initial in rule.initials if live_nodes[initial]]
+    for node in nodes:
+        kept_nodes[node] = True
+    while nodes:
+        for next_node in rule.get_next_nodes(nodes.pop()):
+            if live_nodes[next_node] and not kept_nodes[next_node]:
+                kept_nodes[next_node] = True
+                nodes.append(next_node)
+
+    # Nodes keep their order, `new_nodes` maps the kept ones to their new id.
+    new_nodes = {
+        node: new_node
+        for new_node, node in enumerate(
+            node for node in range(len(rule)) if kept_nodes[node]
+        )
+    }
+    successor_offsets = array("i", [0])
+    successors = array("i")
+    for node in new_nodes:
+        successors.extend(
+            new_nodes[next_node]
+            for next_node in rule.get_next_nodes(node)
+            if kept_nodes[next_node]
+        )
+        successor_offsets.append(len(successors))
+
+    symbols = tuple(rule.symbols[node] for node in new_nodes)
+
+    return CompiledRule(
+        label=rule.label,
+        kinds=array("b", [rule.kinds[node] for node in new_nodes]),
+        contents=array("i", [rule.contents[node] for node in new_nodes]),
+        successor_offsets=successor_offsets,
+        successors=successors,
+        initials=array(
+            "i", [new_nodes[node] for node in rule.initials if node in new_nodes]
+        ),
+        finals=array(
+            "i", [new_nodes[node] for node in rule.finals if node in new_nodes]
+        ),
+        symbols=symbols,
+        node_ids={symbol: node for node, symbol in enumerate(symbols)},
+        origins=(
+            array("i", [rule.origins[node] for node in new_nodes])
+            if rule.origins
+            else array("i")
+        ),
+    )
+
+
+# Drops the rules deriving no terminal string and the paths going through them, then the rules
+# no longer reachable from `start`. The remaining rules replace `rules`. Returns the labels of
+# the unreachable rules and of the unproductive ones.
+def _eliminate_dead_compiled_rules(
+    rules: list[CompiledRule], contents: Sequence[str]
+) -> tuple[list[str], list[str]]:
+    unproductive_labels = _get_unproductive_labels(rules, contents)
+    if "start" in unproductive_labels:
+        raise InvalidGrammar("The symbol `start` derives no terminal string.")
+
+    productive_rules = {
+        rule.label: _prune_compiled_rule(rule, contents, unproductive_labels)
+        for rule in rules
+        if rule.label not in unproductive_labels
+    }
+
+    reachable_labels = {"start"}
+    labels = ["start"]
+    while labels:
+        rule = productive_rules[labels.pop()]
+        for kind, content_id in zip(rule.kinds, rule.contents):
+            label = contents[content_id]
+            if (
+                kind == _NON_TERMINAL_KIND
+                and label in productive_rules
+                and label not in reachable_labels
+            ):
+                reachable_labels.add(label)
+                labels.append(label)
+
+    unreachable_labels = [
+        rule.label
+        for rule in rules
+        if rule.label in productive_rules and rule.label not in reachable_labels
+    ]
+    unproductive_labels_in_order = [
+        rule.label for rule in rules if rule.label in unproductive_labels
+    ]
+    rules[:] = [
+        productive_rules[rule.label] for rule in rules if rule.label in reachable_labels
+    ]
+
+    return unreachable_labels, unproductive_labels_in_order
+
+
+# Whitespace and line breaks don't change the meaning of a grammar, the canonical text has a
+# single rule per line and its symbols separated by a single space.
+def _canonicalize_cfg_grammar(cfg_grammar: str) -> str:
+    return _canonicalize_cfg_grammar_definitions(
+        _divide_cfg_grammar_into_definitions(cfg_grammar)
+    )
+
+
+def _canonicalize_cfg_grammar_definitions(
+    divided_cfg_grammar_dict: dict[str, str]
+) -> str:
+    return "\n".join(
+        f"{symbol_name}: {' '.join(symbol_def[start:end] for start, end in _iter_symbol_def_spans(symbol_def))}"
+        for symbol_name, symbol_def in divided_cfg_grammar_dict.items()
+    )
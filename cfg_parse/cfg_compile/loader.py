@@ -0,0 +1,37 @@
+import mmap
+import os
+from typing import Iterator, Union
+
+from cfg_parse.cfg_guide.helpers import _iter_cfg_grammar_definitions
+
+# A path to a grammar file, or a grammar file mapped in memory.
+CFGGrammarSource = Union[str, os.PathLike, mmap.mmap]
+
+
+def _iter_mmap_lines(mapped_cfg_grammar: mmap.mmap) -> Iterator[str]:
+    # Lines are decoded one at a time, `\n` can't be part of a multi-byte UTF-8 character.
+    line_start = 0
+    size = len(mapped_cfg_grammar)
+    while line_start < size:
+        line_end = mapped_cfg_grammar.find(b"\n", line_start)
+        if line_end < 0:
+            line_end = size
+        yield mapped_cfg_grammar[line_start:line_end].decode("utf-8")
+        line_start = line_end + 1
+
+
+def _iter_file_lines(cfg_grammar_path: Union[str, os.PathLike]) -> Iterator[str]:
+    # Lines are only split on `\n`, as for a grammar given as a string.
+    with open(cfg_grammar_path, encoding="utf-8", newline="\n") as cfg_grammar_file:
+        yield from cfg_grammar_file
+
+
+# Reads the rules of a grammar file incrementally, the memory used is bounded by the largest
+# rule rather than by the size of the file.
+def iter_cfg_grammar_definitions(source: CFGGrammarSource) -> Iterator[tuple[str, str]]:
+    if isinstance(source, mmap.mmap):
+        lines = _iter_mmap_lines(source)
+    else:
+        lines = _iter_file_lines(source)
+
+    yield from _iter_cfg_grammar_definitions(lines)
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+
+from cfg_parse.base import CompiledGrammar
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar
+from cfg_parse.cfg_compile.helpers import _canonicalize_cfg_grammar
+
+DEFAULT_GRAMMAR_REGISTRY_MAX_BYTES = 256 * 1024 * 1024
+
+
+# Shares compiled grammars between requests. Grammars are keyed by their canonical text, kept
+# in LRU order and evicted once their estimated size exceeds `max_bytes`. Requests for a
+# grammar being compiled wait on that single compilation instead of compiling it again.
+# The frontier tables of the grammars grow as guides use them, their sizes are measured again
+# on each request.
+class GrammarRegistry:
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_GRAMMAR_REGISTRY_MAX_BYTES,
+        cache_dir: Optional[str] = None,
+        max_workers: int = 1,
+        minimize: bool = False,
+        inline_max_nodes: int = 0,
+        eliminate_dead_rules: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        # Forwarded to `compile_cfg_grammar`, compiled grammars are then also cached on disk.
+        self.cache_dir = cache_dir
+        # Forwarded to `compile_cfg_grammar`, large grammars are then compiled in parallel.
+        self.max_workers = max_workers
+        # Forwarded to `compile_cfg_grammar`, rules are then minimized.
+        self.minimize = minimize
+        # Forwarded to `compile_cfg_grammar`, small rules are then inlined.
+        self.inline_max_nodes = inline_max_nodes
+        # Forwarded to `compile_cfg_grammar`, dead rules are then dropped.
+        self.eliminate_dead_rules = eliminate_dead_rules
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+        # Each grammar along with its size but for its frontier table, which is read from the
+        # table as it grows.
+        self._compiled_cfg_grammars: OrderedDict[
+            str, tuple[CompiledGrammar, int]
+        ] = OrderedDict()
+        self._pending_compilations: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._compiled_cfg_grammars)
+
+    def __contains__(self, cfg_grammar: str) -> bool:
+        return _canonicalize_cfg_grammar(cfg_grammar) in self._compiled_cfg_grammars
+
+    def get(self, cfg_grammar: str) -> CompiledGrammar:
+        key = _canonicalize_cfg_grammar(cfg_grammar)
+
+        with self._lock:
+            if key in self._compiled_cfg_grammars:
+                self._compiled_cfg_grammars.move_to_end(key)
+                self.hits += 1
+                compiled_cfg_grammar = self._compiled_cfg_grammars[key][0]
+                self._evict()
+                return compiled_cfg_grammar
+
+            pending_compilation = self._pending_compilations.get(key)
+            if pending_compilation is None:
+                self.misses += 1
+                compilation: Future = Future()
+                self._pending_compilations[key] = compilation
+            else:
+                self.hits += 1
+
+        # Waits on the compilation started by another request.
+        if pending_compilation is not None:
+            return pending_compilation.result()
+
+        try:
+            compiled_cfg_grammar = compile_cfg_grammar(
+                cfg_grammar,
+                self.cache_dir,
+                self.max_workers,
+                minimize=self.minimize,
+                inline_max_nodes=self.inline_max_nodes,
+                eliminate_dead_rules=self.eliminate_dead_rules,
+            )
+        except BaseException as exc:
+            with self._lock:
+                del self._pending_compilations[key]
+            compilation.set_exception(exc)
+            raise
+
+        with self._lock:
+            del self._pending_compilations[key]
+            self._add(key, compiled_cfg_grammar)
+        compilation.set_result(compiled_cfg_grammar)
+
+        return compiled_cfg_grammar
+
+    def clear(self):
+        with self._lock:
+            self._compiled_cfg_grammars.clear()
+            self.current_bytes = 0
+
+    def _add(self, key: str, compiled_cfg_grammar: CompiledGrammar):
+        self._compiled_cfg_grammars[key] = (
+            compiled_cfg_grammar,
+            compiled_cfg_grammar.get_rules_nbytes(),
+        )
+        self._evict()
+
+    def _evict(self):
+        self.current_bytes = sum(
+            rules_nbytes + compiled_cfg_grammar.frontier_table.nbytes
+            for compiled_cfg_grammar, rules_nbytes in self._compiled_cfg_grammars.values()
+        )
+
+        # Evicts the least recently used grammars, a grammar larger than the whole budget
+        # is returned to its caller but not kept.
+        while self.current_bytes > self.max_bytes and self._compiled_cfg_grammars:
+            _, evicted = self._compiled_cfg_grammars.popitem(last=False)
+            evicted_cfg_grammar, rules_nbytes = evicted
+            self.current_bytes -= (
+                rules_nbytes + evicted_cfg_grammar.frontier_table.nbytes
+            )
+            self.evictions += 1
@@ -0,0 +1,117 @@
+from typing import Optional, Sequence
+
+from cfg_parse.base import CompiledGrammar, EarleyItem, EarleySet, Symbol
+from cfg_parse.cfg_compile.helpers import _NON_TERMINAL_KIND
+from cfg_parse.cfg_guide.memo import FrontierMemo
+
+# The terminals allowed next, each with the items of the chart it's scanned from. The items are
+# shared with the frontiers before it, a frontier must not be mutated.
+EarleyFrontier = dict[Symbol, list[EarleyItem]]
+
+
+# Expands the set `earley_set` from `earley_items`, the items scanned into it (or the item of
+# `start`). Each item is predicted from, completed or waits for a terminal once, and items
+# added meanwhile are appended. Rules are looked up as the chart reaches them, a lazily compiled
+# grammar only compiles the rules predicted.
+def _add_earley_items(
+    compiled_cfg_grammar: CompiledGrammar,
+    earley_frontier: EarleyFrontier,
+    earley_set: EarleySet,
+    earley_items: list[EarleyItem],
+):
+    waiting_items = earley_set.waiting_items
+    # Items are told apart by their rule, node and origin, origins are kept alive by the items.
+    added_items = {(item.rule_id, item.node, id(item.origin)) for item in earley_items}
+
+    for item in earley_items:
+        rule = compiled_cfg_grammar.rules[item.rule_id]
+        next_nodes = rule.get_next_nodes(item.node)
+
+        if not next_nodes:
+            # Completion, the items waiting for the rule where it was predicted carry on. A rule
+            # entered without consuming a terminal can't end, it derives nothing.
+            if item.node < 0:
+                continue
+            for waiting_item, node in item.origin.waiting_items[item.rule_id]:
+                key = (waiting_item.rule_id, node, id(waiting_item.origin))
+                if key not in added_items:
+                    added_items.add(key)
+                    earley_items.append(
+                        EarleyItem(waiting_item.rule_id, node, waiting_item.origin)
+                    )
+            continue
+
+        for next_node in next_nodes:
+            if rule.kinds[next_node] != _NON_TERMINAL_KIND:
+                # Scanned once a terminal is chosen.
+                symbol = rule.symbols[next_node]
+                symbol_items = earley_frontier.get(symbol)
+                if symbol_items is None:
+                    earley_frontier[symbol] = [item]
+                else:
+                    symbol_items.append(item)
+                continue
+
+            # Prediction, a rule is predicted once at a position whatever the number of items
+            # waiting for it. Left-recursive rules wait for themselves.
+            next_rule_id = compiled_cfg_grammar.get_rule_id(rule, next_node)
+            rule_waiting_items = waiting_items.get(next_rule_id)
+            if rule_waiting_items is None:
+                waiting_items[next_rule_id] = [(item, next_node)]
+                key = (next_rule_id, -1, id(earley_set))
+                if key not in added_items:
+                    added_items.add(key)
+                    earley_items.append(EarleyItem(next_rule_id, -1, earley_set))
+            else:
+                rule_waiting_items.append((item, next_node))
+
+
+def get_start_earley_frontier(compiled_cfg_grammar: CompiledGrammar) -> EarleyFrontier:
+    # `start` is predicted at the first position, nothing waits for it unless it's
+    # left-recursive.
+    earley_set = EarleySet()
+    earley_set.waiting_items[compiled_cfg_grammar.start] = []
+    earley_frontier: EarleyFrontier = {}
+    _add_earley_items(
+        compiled_cfg_grammar,
+        earley_frontier,
+        earley_set,
+        [EarleyItem(compiled_cfg_grammar.start, -1, earley_set)],
+    )
+    return earley_frontier
+
+
+# Scans the items of `earley_frontier` waiting for one of `chosen_symbols`, the terminals
+# matching the chosen text, into a new set, and expands it. With `frontier_memo`, the frontier
+# may be one built before from the same items, it must not be mutated.
+def get_next_earley_frontier(
+    compiled_cfg_grammar: CompiledGrammar,
+    earley_frontier: EarleyFrontier,
+    chosen_symbols: Sequence[Symbol],
+    frontier_memo: Optional[FrontierMemo] = None,
+) -> EarleyFrontier:
+    # Scanned items by their rule, node and origin, an item scanned twice is added once.
+    scanned_items: dict[tuple[int, int, EarleySet], None] = {}
+    for chosen_symbol in chosen_symbols:
+        for item in earley_frontier[chosen_symbol]:
+            node = compiled_cfg_grammar.rules[item.rule_id].node_ids[chosen_symbol]
+            scanned_items[(item.rule_id, node, item.origin)] = None
+
+    if frontier_memo is not None:
+        key = frontier_memo.get_earley_key(scanned_items)
+        memoized_earley_frontier = frontier_memo.get(key)
+        if memoized_earley_frontier is not None:
+            # Items of the memo start at the same sets as the items scanned.
+            return memoized_earley_frontier  # type: ignore
+
+    next_earley_frontier: EarleyFrontier = {}
+    _add_earley_items(
+        compiled_cfg_grammar,
+        next_earley_frontier,
+        EarleySet(),
+        [EarleyItem(rule_id, node, origin) for rule_id, node, origin in scanned_items],
+    )
+
+    if frontier_memo is not None:
+        frontier_memo.add(key, next_earley_frontier)
+    return next_earley_frontier
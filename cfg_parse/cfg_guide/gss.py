@@ -0,0 +1,245 @@
+from typing import Optional, Sequence
+
+from cfg_parse.base import CompiledGrammar, FrontierSteps, GSSNode, GSSWalk, Symbol
+from cfg_parse.cfg_compile.analysis import (
+    get_next_frontier_steps,
+    get_start_frontier_steps,
+)
+from cfg_parse.cfg_guide.memo import FrontierMemo
+
+# The terminals allowed next, each with the nodes of the live parses it's reached from. The
+# nodes are shared with the frontiers before it, a frontier must not be mutated.
+GSSFrontier = dict[Symbol, list[GSSNode]]
+
+
+# Adds `parent` to the parents of `gss_node`, each parent once.
+def _add_gss_node_parent(gss_node: GSSNode, parent: GSSNode, node: int):
+    for gss_node_parent, gss_node_parent_node in gss_node.parents:
+        if gss_node_parent is parent and gss_node_parent_node == node:
+            return
+    gss_node.parents.append((parent, node))
+
+
+# Adds the terminals reached by `steps` from `gss_node`, the layers the steps go through are
+# pushed into `pushed_gss_nodes`, one node for each rule at this position. Steps entering a
+# rule are told apart by their `id`, each of them is gone through once whatever the number of
+# paths leading to it.
+def _add_gss_frontier_steps(
+    gss_frontier: GSSFrontier,
+    pushed_gss_nodes: dict[int, GSSNode],
+    visited_steps: set[int],
+    gss_node: GSSNode,
+    steps: FrontierSteps,
+):
+    pending_steps = [(gss_node, iter(steps))]
+    while pending_steps:
+        gss_node, steps_iter = pending_steps[-1]
+        for symbol, node, rule_id, next_steps in steps_iter:
+            if rule_id < 0:
+                gss_nodes = gss_frontier.get(symbol)
+                if gss_nodes is None:
+                    gss_frontier[symbol] = [gss_node]
+                elif gss_node not in gss_nodes:
+                    gss_nodes.append(gss_node)
+                continue
+
+            # A left-recursive rule entered again has no steps, its layer is already pushed.
+            pushed_gss_node = pushed_gss_nodes.get(rule_id)
+            if pushed_gss_node is None:
+                pushed_gss_node = pushed_gss_nodes[rule_id] = GSSNode(rule_id)
+            _add_gss_node_parent(pushed_gss_node, gss_node, node)
+
+            if id(next_steps) not in visited_steps:
+                visited_steps.add(id(next_steps))
+                pending_steps.append((pushed_gss_node, iter(next_steps)))
+                break
+        else:
+            pending_steps.pop()
+
+
+# Walk of the nodes `steps` push from a node of the rule `rule_id`, the nodes are numbered in
+# the order they're pushed. From the start, the node is the layer pushed for `start` and a
+# left-recursive `start` is its own parent.
+def _get_gss_walk(steps: FrontierSteps, rule_id: int, is_start: bool) -> GSSWalk:
+    gss_node = GSSNode(rule_id)
+    gss_frontier: GSSFrontier = {}
+    pushed_gss_nodes = {rule_id: gss_node} if is_start else {}
+    _add_gss_frontier_steps(gss_frontier, pushed_gss_nodes, set(), gss_node, steps)
+
+    layers = [gss_node]
+    layers.extend(
+        pushed_gss_node
+        for pushed_gss_node in pushed_gss_nodes.values()
+        if pushed_gss_node is not gss_node
+    )
+    layer_ids = {
+        id(layer_gss_node): layer for layer, layer_gss_node in enumerate(layers)
+    }
+    return GSSWalk(
+        tuple(layer_gss_node.rule_id for layer_gss_node in layers[1:]),
+        tuple(
+            (layer, layer_ids[id(parent)], node)
+            for layer, layer_gss_node in enumerate(layers)
+            for parent, node in layer_gss_node.parents
+        ),
+        tuple(
+            (
+                symbol,
+                tuple(layer_ids[id(symbol_gss_node)] for symbol_gss_node in gss_nodes),
+            )
+            for symbol, gss_nodes in gss_frontier.items()
+        ),
+    )
+
+
+def get_next_gss_walk(
+    compiled_cfg_grammar: CompiledGrammar, rule_id: int, node: int
+) -> GSSWalk:
+    next_gss_walks = compiled_cfg_grammar.frontier_table.next_gss_walks
+    walk = next_gss_walks.get((rule_id, node))
+    if walk is None:
+        walk = next_gss_walks[(rule_id, node)] = _get_gss_walk(
+            get_next_frontier_steps(compiled_cfg_grammar, rule_id, node), rule_id, False
+        )
+        compiled_cfg_grammar.frontier_table.add_nbytes(walk.get_nbytes())
+    return walk
+
+
+def get_start_gss_walk(compiled_cfg_grammar: CompiledGrammar) -> GSSWalk:
+    frontier_table = compiled_cfg_grammar.frontier_table
+    if frontier_table.start_gss_walk is None:
+        frontier_table.start_gss_walk = _get_gss_walk(
+            get_start_frontier_steps(compiled_cfg_grammar),
+            compiled_cfg_grammar.start,
+            True,
+        )
+        frontier_table.add_nbytes(frontier_table.start_gss_walk.get_nbytes())
+    return frontier_table.start_gss_walk
+
+
+# Adds the terminals reached by `walk` from `gss_node`, the nodes it pushes are merged with
+# the nodes pushed for the same rules at this position.
+def _add_gss_walk_to_gss_frontier(
+    gss_frontier: GSSFrontier,
+    pushed_gss_nodes: dict[int, GSSNode],
+    gss_node: GSSNode,
+    walk: GSSWalk,
+):
+    if not gss_frontier and not pushed_gss_nodes:
+        # The first walk of a position pushes its own nodes, nothing is merged.
+        layers = [gss_node, *map(GSSNode, walk.rule_ids)]
+        pushed_gss_nodes.update(zip(walk.rule_ids, layers[1:]))
+        for layer, parent_layer, node in walk.parents:
+            layers[layer].parents.append((layers[parent_layer], node))
+        for symbol, symbol_layers in walk.terminals:
+            gss_frontier[symbol] = [layers[layer] for layer in symbol_layers]
+        return
+
+    layers = [gss_node]
+    for rule_id in walk.rule_ids:
+        pushed_gss_node = pushed_gss_nodes.get(rule_id)
+        if pushed_gss_node is None:
+            pushed_gss_node = pushed_gss_nodes[rule_id] = GSSNode(rule_id)
+        layers.append(pushed_gss_node)
+
+    for layer, parent_layer, node in walk.parents:
+        _add_gss_node_parent(layers[layer], layers[parent_layer], node)
+
+    for symbol, symbol_layers in walk.terminals:
+        gss_nodes = gss_frontier.get(symbol)
+        if gss_nodes is None:
+            gss_frontier[symbol] = [layers[layer] for layer in symbol_layers]
+            continue
+        for layer in symbol_layers:
+            if layers[layer] not in gss_nodes:
+                gss_nodes.append(layers[layer])
+
+
+def get_start_gss_frontier(compiled_cfg_grammar: CompiledGrammar) -> GSSFrontier:
+    gss_frontier: GSSFrontier = {}
+    _add_gss_walk_to_gss_frontier(
+        gss_frontier,
+        {},
+        GSSNode(compiled_cfg_grammar.start),
+        get_start_gss_walk(compiled_cfg_grammar),
+    )
+    return gss_frontier
+
+
+# Parents of the layer of `gss_node` carrying on from `node`, merged with the parents of the
+# layers carrying on from the same node of the same rule at this position.
+def _resume_gss_node(
+    resumed_gss_parents: dict[tuple[int, int], list[tuple[GSSNode, int]]],
+    gss_node: GSSNode,
+    node: int,
+):
+    key = (gss_node.rule_id, node)
+    parents = resumed_gss_parents.get(key)
+    if parents is None:
+        resumed_gss_parents[key] = list(gss_node.parents)
+        return
+    for parent, parent_node in gss_node.parents:
+        if (parent, parent_node) not in parents:
+            parents.append((parent, parent_node))
+
+
+# Advances every live parse of `gss_frontier` reaching one of `chosen_symbols`, the terminals
+# matching the chosen text. The parses are expanded together, the next frontier is the union of
+# their next terminals. With `frontier_memo`, the frontier may be one built before from the same
+# nodes, it must not be mutated.
+def get_next_gss_frontier(
+    compiled_cfg_grammar: CompiledGrammar,
+    gss_frontier: GSSFrontier,
+    chosen_symbols: Sequence[Symbol],
+    frontier_memo: Optional[FrontierMemo] = None,
+) -> GSSFrontier:
+    # The nodes are only built when the next frontier isn't found in `frontier_memo`.
+    resumed_gss_parents: dict[tuple[int, int], list[tuple[GSSNode, int]]] = {}
+    # Parents of the layers whose rule ends with the chosen terminal.
+    popped_parents: list[list[tuple[GSSNode, int]]] = []
+    for chosen_symbol in chosen_symbols:
+        for gss_node in gss_frontier[chosen_symbol]:
+            chosen_node = compiled_cfg_grammar.rules[gss_node.rule_id].node_ids.get(
+                chosen_symbol
+            )
+            if chosen_node is not None and get_next_frontier_steps(
+                compiled_cfg_grammar, gss_node.rule_id, chosen_node
+            ):
+                _resume_gss_node(resumed_gss_parents, gss_node, chosen_node)
+            else:
+                popped_parents.append(gss_node.parents)
+
+    # Nodes of the positions before are complete, their parents are told apart by their `id`.
+    # Parents are gone through in order, the parents popped meanwhile are appended.
+    visited_parents: set[int] = set()
+    for parents in popped_parents:
+        if id(parents) in visited_parents:
+            continue
+        visited_parents.add(id(parents))
+        for parent, node in parents:
+            if get_next_frontier_steps(compiled_cfg_grammar, parent.rule_id, node):
+                _resume_gss_node(resumed_gss_parents, parent, node)
+            else:
+                popped_parents.append(parent.parents)
+
+    if frontier_memo is not None:
+        key = frontier_memo.get_gss_key(resumed_gss_parents)
+        memoized_gss_frontier = frontier_memo.get(key)
+        if memoized_gss_frontier is not None:
+            # Nodes of the memo carry on from the same parents as the nodes resumed.
+            return memoized_gss_frontier  # type: ignore
+
+    # The steps are gone through as walks built along with them.
+    next_gss_frontier: GSSFrontier = {}
+    pushed_gss_nodes: dict[int, GSSNode] = {}
+    for (rule_id, node), parents in resumed_gss_parents.items():
+        _add_gss_walk_to_gss_frontier(
+            next_gss_frontier,
+            pushed_gss_nodes,
+            GSSNode(rule_id, node, parents),
+            get_next_gss_walk(compiled_cfg_grammar, rule_id, node),
+        )
+
+    if frontier_memo is not None:
+        frontier_memo.add(key, next_gss_frontier)
+    return next_gss_frontier
@@ -1,46 +1,93 @@
 import warnings
-from collections import defaultdict, deque
-from copy import deepcopy
-from functools import wraps
-from typing import Deque, Optional
+from dataclasses import replace
+from functools import cached_property, wraps
+from typing import Optional, Sequence, Union
 
 from cfg_parse.base import (
+    CompiledGrammar,
+    CompiledGraphState,
+    NextTerminals,
+    OrderedSet,
     Symbol,
+    SymbolArena,
     SymbolGraph,
     SymbolGraphState,
     SymbolType,
 )
-from cfg_parse.cfg_build.build import build_symbol_graph
+from cfg_parse.cfg_build.build import build_symbol_graph, minimize_symbol_graph
+from cfg_parse.cfg_compile.analysis import (
+    get_next_frontier_steps,
+    get_next_frontier_walk,
+    get_start_frontier_walk,
+)
+from cfg_parse.cfg_compile.compile import compile_cfg_grammar, compile_cfg_grammar_file
+from cfg_parse.cfg_compile.helpers import _split_reachable_cfg_grammar_definitions
+from cfg_parse.cfg_compile.loader import CFGGrammarSource
+from cfg_parse.cfg_guide.earley import (
+    EarleyFrontier,
+    get_next_earley_frontier,
+    get_start_earley_frontier,
+)
+from cfg_parse.cfg_guide.gss import (
+    GSSFrontier,
+    get_next_gss_frontier,
+    get_start_gss_frontier,
+)
 from cfg_parse.cfg_guide.helpers import (
-    _push_stateful_symbol_graph_layer_to_stack,
+    _add_frontier_walk_to_next_terminals,
     _divide_cfg_grammar_into_definitions,
     _exist_infinite_loop_around_non_terminal_symbols,
     _get_non_terminal_loop_str_from_generation_state_stack,
+    _push_stateful_symbol_graph_layer_to_stack,
+    _retrace_symbol_objs_from_str,
     _turn_symbol_graph_into_stateful_obj,
+    _update_stateful_symbol_graph_layer_state,
 )
+from cfg_parse.cfg_guide.memo import DEFAULT_FRONTIER_MEMO_MAX_SIZE, FrontierMemo
 
-CFGGenerationState = Optional[Deque[SymbolGraphState]]
+# The top frame of a persistent generation stack, frames below it are reached through `parent`.
+CFGGenerationState = Optional[SymbolGraphState]
+CFGCompiledGenerationState = Optional[CompiledGraphState]
+# The next terminals of the live parses of a sequence, with the nodes of their graph-structured
+# stack, or the items of their Earley chart.
+CFGParsesFrontier = Union[GSSFrontier, EarleyFrontier]
 
 
-def build_cfg_grammar_into_symbol_graphs(cfg_grammar: str) -> dict[str, SymbolGraph]:
+# With `minimize`, equivalent nodes of each symbol graph are merged.
+# With `eliminate_dead_rules`, the rules unreachable from `start` aren't built.
+def build_cfg_grammar_into_symbol_graphs(
+    cfg_grammar: str, minimize: bool = False, eliminate_dead_rules: bool = False
+) -> dict[str, SymbolGraph]:
     built_cfg_grammar_dict: dict[str, SymbolGraph] = {}
 
     divided_cfg_grammar_dict = _divide_cfg_grammar_into_definitions(cfg_grammar)
+    if eliminate_dead_rules:
+        divided_cfg_grammar_dict, _ = _split_reachable_cfg_grammar_definitions(
+            divided_cfg_grammar_dict
+        )
 
+    # Symbol ids are allocated per grammar.
+    arena = SymbolArena()
     for symbol_name, symbol_def in divided_cfg_grammar_dict.items():
-        built_cfg_grammar_dict[symbol_name] = build_symbol_graph(symbol_def)
+        symbol_graph = build_symbol_graph(symbol_def, arena)
+        if minimize:
+            symbol_graph = minimize_symbol_graph(symbol_graph)
+        built_cfg_grammar_dict[symbol_name] = symbol_graph
 
     return built_cfg_grammar_dict
 
 
+# Follows the symbol graphs of `build_cfg_grammar_into_symbol_graphs` (or
+# `CFGGuide.built_cfg_grammar`). Once a terminal ending a rule is chosen, no terminal is
+# returned: the caller closes the rule by choosing a symbol whose content is `EOS_SYMBOL` from
+# the returned state. `CFGGuide.get_next_terminals` closes the rule itself and returns the
+# terminals following it.
 def get_next_terminals(
     built_cfg_grammar: dict[str, SymbolGraph],
     generation_state: CFGGenerationState = None,
     chosen_symbol: Optional[Symbol] = None,
 ):
-    next_terminal_symbols_w_history: dict[Symbol, Deque[SymbolGraphState]] = (
-        defaultdict(deque)
-    )
+    next_terminal_symbols_w_history: dict[Symbol, SymbolGraphState] = {}
 
     def recurse_guide(
         generation_state: CFGGenerationState = None,
@@ -52,7 +99,7 @@ def get_next_terminals(
                 start = _turn_symbol_graph_into_stateful_obj(
                     built_cfg_grammar["start"], "start"
                 )
-                recurse_guide(deque([start]))
+                recurse_guide(start)
                 return
             else:
                 raise ValueError(
@@ -61,18 +108,18 @@ def get_next_terminals(
 
         if _exist_infinite_loop_around_non_terminal_symbols(generation_state):
             warnings.warn(
-                f"A loop of non-terminal symbols is found {_get_non_terminal_loop_str_from_generation_state_stack(deepcopy(generation_state))}, path will be ignored."
+                f"A loop of non-terminal symbols is found {_get_non_terminal_loop_str_from_generation_state_stack(generation_state)}, path will be ignored."
             )
             return
 
         if chosen_symbol is None:
-            # Poping the last graph.
-            last_visit_graph = generation_state[-1].graph
-            # Poping the last state.
-            last_visit_symbol = generation_state[-1].state
+            # Peeking the last graph.
+            last_visit_graph = generation_state.graph
+            # Peeking the last state.
+            last_visit_symbol = generation_state.state
             # Get the next nodes according to `last_visit_symbol`, which refers to the last visited (non-terminal) symbol from where the stack was addded.
             next_symbols = (
-                last_visit_graph.tree[last_visit_symbol]
+                last_visit_graph.tree.get(last_visit_symbol, OrderedSet())
                 if last_visit_symbol is not None
                 else last_visit_graph.initials
             )
@@ -83,14 +130,13 @@ def get_next_terminals(
                     SymbolType.REGEX,
                     SymbolType.SPECIAL,
                 ]:
-                    next_terminal_symbols_w_history[next_symbol] = deepcopy(
-                        generation_state
-                    )
+                    # Frames are immutable, the stack is shared instead of copied.
+                    next_terminal_symbols_w_history[next_symbol] = generation_state
 
                 # Create an additional layer in the stack.
                 if next_symbol.s_type == SymbolType.NON_TERMINAL:
                     last_generation_state = _push_stateful_symbol_graph_layer_to_stack(
-                        deepcopy(generation_state),
+                        generation_state,
                         built_cfg_grammar[next_symbol.content],
                         next_symbol,
                     )
@@ -99,17 +145,21 @@ def get_next_terminals(
             return
 
         if chosen_symbol.content == "EOS_SYMBOL":
-            generation_state.pop()
+            # Handles reaching the end of stack.
+            if generation_state.parent is None:
+                return
             # Should return the last label, but as a symbol of the last symbol graph.
-            recurse_guide(deepcopy(generation_state))
+            recurse_guide(generation_state.parent)
             return
 
-        # Poping the last graph.
-        last_visit_graph = generation_state[-1].graph
+        # Peeking the last graph.
+        last_visit_graph = generation_state.graph
         # Get the next nodes according to `chosen_symbol`, which refers to the (terminal) symbol chosen by the LLM.
-        next_symbols = last_visit_graph.tree[chosen_symbol]
+        next_symbols = last_visit_graph.tree.get(chosen_symbol, OrderedSet())
         # Update the state for `SymbolGraphState` to the (terminal) symbol chosen by the LLM.
-        generation_state[-1].state = chosen_symbol
+        generation_state = _update_stateful_symbol_graph_layer_state(
+            generation_state, chosen_symbol
+        )
 
         for next_symbol in next_symbols:
             if next_symbol.s_type in [
@@ -117,14 +167,12 @@ def get_next_terminals(
                 SymbolType.REGEX,
                 SymbolType.SPECIAL,
             ]:
-                next_terminal_symbols_w_history[next_symbol] = deepcopy(
-                    generation_state  # type: ignore
-                )
+                next_terminal_symbols_w_history[next_symbol] = generation_state
 
             # Create an additional layer in the stack.
             if next_symbol.s_type == SymbolType.NON_TERMINAL:
                 generation_state = _push_stateful_symbol_graph_layer_to_stack(
-                    deepcopy(generation_state),  # type: ignore
+                    generation_state,
                     built_cfg_grammar[next_symbol.content],
                     next_symbol,
                 )
@@ -146,123 +194,297 @@ def clear_dict_before_call(dict_name: str):
     return decorator
 
 
+# The compiled grammar, its frontier table and the frontier memo are shared by the threads using
+# a guide, `get_next_terminals_batch` and the sessions of the guide (see `GuideSession`) only
+# keep their state in the dicts they return. `get_next_terminals` writes its results into the
+# guide, a thread calling it uses its own guide (see `from_compiled_cfg_grammar`). It follows
+# one parse, the state and symbol chosen by the caller, while the batch and the sessions
+# follow every parse of the chosen text. Unlike the module-level `get_next_terminals`, a rule is
+# closed as soon as a terminal ending it is chosen, the terminals following it are returned.
 class CFGGuide:
-    built_cfg_grammar: dict[str, SymbolGraph]
-    next_terminals_w_history: dict[Symbol, CFGGenerationState]
+    compiled_cfg_grammar: CompiledGrammar
+    next_terminals_w_history: NextTerminals
+    frontier_memo: Optional[FrontierMemo]
+    earley: bool
 
-    def __init__(self, cfg_grammar: str):
-        self.built_cfg_grammar = build_cfg_grammar_into_symbol_graphs(cfg_grammar)
+    def __init__(
+        self,
+        cfg_grammar: str,
+        cache_dir: Optional[str] = None,
+        max_workers: int = 1,
+        lazy: bool = False,
+        validate: bool = True,
+        minimize: bool = False,
+        inline_max_nodes: int = 0,
+        eliminate_dead_rules: bool = False,
+        frontier_memo_max_size: int = DEFAULT_FRONTIER_MEMO_MAX_SIZE,
+        earley: bool = False,
+    ):
+        # With `cache_dir`, the compiled grammar is loaded from disk when it was already built.
+        # With `max_workers > 1`, large grammars are compiled by a pool of processes.
+        # With `lazy`, a rule is compiled the first time a layer is pushed for it, `validate`
+        # still checks the syntax and the rules of the whole grammar up front.
+        # With `minimize`, equivalent nodes of each rule are merged, fewer symbols are then
+        # proposed for the same next terminals.
+        # With `inline_max_nodes > 0`, small non-recursive rules are spliced into the rules
+        # referring to them, fewer layers are then pushed.
+        # With `eliminate_dead_rules`, the rules unreachable from `start` or deriving no
+        # terminal string are dropped, along with the paths through them.
+        # With `frontier_memo_max_size > 0`, the next terminals of up to that many states are
+        # remembered (see `FrontierMemo`).
+        # With `earley`, the batch and the sessions keep the live parses in an Earley chart
+        # (see `cfg_guide/earley.py`) instead of a graph-structured stack.
+        self.compiled_cfg_grammar = compile_cfg_grammar(
+            cfg_grammar,
+            cache_dir,
+            max_workers,
+            lazy,
+            validate,
+            minimize,
+            inline_max_nodes,
+            eliminate_dead_rules,
+        )
         self.next_terminals_w_history = {}
+        self.frontier_memo = (
+            FrontierMemo(frontier_memo_max_size) if frontier_memo_max_size > 0 else None
+        )
+        self.earley = earley
+
+    @classmethod
+    def from_compiled_cfg_grammar(
+        cls,
+        compiled_cfg_grammar: CompiledGrammar,
+        frontier_memo_max_size: int = DEFAULT_FRONTIER_MEMO_MAX_SIZE,
+        earley: bool = False,
+    ):
+        # The compiled grammar is read-only, it can be shared by guides (see `GrammarRegistry`).
+        guide = cls.__new__(cls)
+        guide.compiled_cfg_grammar = compiled_cfg_grammar
+        guide.next_terminals_w_history = {}
+        guide.frontier_memo = (
+            FrontierMemo(frontier_memo_max_size) if frontier_memo_max_size > 0 else None
+        )
+        guide.earley = earley
+        return guide
+
+    @classmethod
+    def from_cfg_grammar_file(
+        cls,
+        source: CFGGrammarSource,
+        minimize: bool = False,
+        inline_max_nodes: int = 0,
+        eliminate_dead_rules: bool = False,
+        cache_dir: Optional[str] = None,
+        lazy: bool = False,
+        validate: bool = True,
+        frontier_memo_max_size: int = DEFAULT_FRONTIER_MEMO_MAX_SIZE,
+        earley: bool = False,
+    ):
+        # Rules are read and compiled incrementally from a path or a memory-mapped file, the
+        # options are those of `__init__` (see `compile_cfg_grammar_file`).
+        return cls.from_compiled_cfg_grammar(
+            compile_cfg_grammar_file(
+                source,
+                minimize,
+                inline_max_nodes,
+                eliminate_dead_rules,
+                cache_dir,
+                lazy,
+                validate,
+            ),
+            frontier_memo_max_size,
+            earley,
+        )
+
+    # The symbol graphs of the rules, built from the definitions of the compiled grammar on
+    # first use, for the module-level `get_next_terminals`. Their symbols and states aren't
+    # those of the guide. The rules dropped by `eliminate_dead_rules` are missing.
+    @cached_property
+    def built_cfg_grammar(self) -> dict[str, SymbolGraph]:
+        compiled_cfg_grammar = self.compiled_cfg_grammar
+        arena = SymbolArena()
+        built_cfg_grammar_dict: dict[str, SymbolGraph] = {}
+        for symbol_name, symbol_def in zip(
+            compiled_cfg_grammar.rule_ids, compiled_cfg_grammar.definitions
+        ):
+            symbol_graph = build_symbol_graph(symbol_def, arena)
+            if compiled_cfg_grammar.options.minimize:
+                symbol_graph = minimize_symbol_graph(symbol_graph)
+            built_cfg_grammar_dict[symbol_name] = symbol_graph
+        return built_cfg_grammar_dict
 
     @clear_dict_before_call("next_terminals_w_history")
     def get_next_terminals(
         self,
-        generation_state: CFGGenerationState = None,
+        generation_state: CFGCompiledGenerationState = None,
         chosen_symbol: Optional[Symbol] = None,
     ):
-        # Ignore paths where there are infinite loops of non-terminals.
+        self.next_terminals_w_history.update(
+            self._get_next_terminals(generation_state, chosen_symbol)
+        )
+
+    # Advances a batch of sequences in one call. Each sequence is given by its last next
+    # terminals and the text chosen among them, both `None` to start it. Every terminal matching
+    # the text is followed, the next terminals of a sequence are those of all its live parses
+    # (see `cfg_guide/gss.py` and `cfg_guide/earley.py`). The next terminals of every sequence
+    # are returned in the same order. Sequences choosing the same text from the same next
+    # terminals are advanced once and share the returned dict, which must not be mutated.
+    def get_next_terminals_batch(
+        self,
+        parses_frontiers: Sequence[Optional[CFGParsesFrontier]],
+        chosen_symbol_strs: Sequence[Optional[str]],
+    ) -> list[CFGParsesFrontier]:
+        if len(parses_frontiers) != len(chosen_symbol_strs):
+            raise ValueError(
+                f"{len(parses_frontiers)} sequences are given for {len(chosen_symbol_strs)} chosen symbols."
+            )
+
+        # The next terminals given are kept alive by the caller for the whole call, they can
+        # be told apart by their `id`.
+        batch_parses_frontiers: dict[tuple[int, Optional[str]], CFGParsesFrontier] = {}
+
+        batch_results: list[CFGParsesFrontier] = []
+        for parses_frontier, chosen_symbol_str in zip(
+            parses_frontiers, chosen_symbol_strs
+        ):
+            if (parses_frontier is None) != (chosen_symbol_str is None):
+                raise ValueError(
+                    "A sequence is started with both its next terminals and its chosen symbol as `None`."
+                )
+
+            key = (id(parses_frontier), chosen_symbol_str)
+            next_parses_frontier = batch_parses_frontiers.get(key)
+            if next_parses_frontier is None:
+                next_parses_frontier = self.advance_parses_frontier(
+                    parses_frontier, chosen_symbol_str
+                )
+                batch_parses_frontiers[key] = next_parses_frontier
+            batch_results.append(next_parses_frontier)
+
+        return batch_results
+
+    # Advances one sequence, following every terminal of `parses_frontier` matching the chosen
+    # text (see `get_next_terminals_batch`). The start frontier when both are `None`. The
+    # returned dict may be kept by the frontier memo, it must not be mutated.
+    def advance_parses_frontier(
+        self,
+        parses_frontier: Optional[CFGParsesFrontier],
+        chosen_symbol_str: Optional[str],
+    ) -> CFGParsesFrontier:
+        compiled_cfg_grammar = self.compiled_cfg_grammar
+        if parses_frontier is None:
+            if self.earley:
+                return get_start_earley_frontier(compiled_cfg_grammar)
+            return get_start_gss_frontier(compiled_cfg_grammar)
+
+        chosen_symbols = _retrace_symbol_objs_from_str(
+            chosen_symbol_str, parses_frontier  # type: ignore
+        )
+        if self.earley:
+            return get_next_earley_frontier(
+                compiled_cfg_grammar,
+                parses_frontier,  # type: ignore
+                chosen_symbols,
+                self.frontier_memo,
+            )
+        return get_next_gss_frontier(
+            compiled_cfg_grammar,
+            parses_frontier,  # type: ignore
+            chosen_symbols,
+            self.frontier_memo,
+        )
+
+    # The returned dict may be kept by the frontier memo, it must not be mutated.
+    def _get_next_terminals(
+        self,
+        generation_state: CFGCompiledGenerationState,
+        chosen_symbol: Optional[Symbol],
+    ) -> NextTerminals:
+        frontier_memo = self.frontier_memo
+        next_terminals_w_history: NextTerminals = {}
+        if frontier_memo is None:
+            self._add_next_terminals(
+                next_terminals_w_history, generation_state, chosen_symbol
+            )
+            return next_terminals_w_history
+
+        key = frontier_memo.get_key(generation_state, chosen_symbol)
+        memoized_next_terminals_w_history = frontier_memo.get(key)
+        if memoized_next_terminals_w_history is not None:
+            # States of the memo are built on the same frames as `generation_state`.
+            return memoized_next_terminals_w_history  # type: ignore
+
+        self._add_next_terminals(
+            next_terminals_w_history, generation_state, chosen_symbol
+        )
+        frontier_memo.add(key, next_terminals_w_history)
+        return next_terminals_w_history
+
+    def _add_next_terminals(
+        self,
+        next_terminals_w_history: NextTerminals,
+        generation_state: CFGCompiledGenerationState,
+        chosen_symbol: Optional[Symbol],
+    ):
+        compiled_cfg_grammar = self.compiled_cfg_grammar
+
         if generation_state is None:
             if chosen_symbol is None:
-                start = _turn_symbol_graph_into_stateful_obj(
-                    self.built_cfg_grammar["start"], "start"
+                # The start frontier is built when compiling the grammar.
+                _add_frontier_walk_to_next_terminals(
+                    next_terminals_w_history,
+                    CompiledGraphState(compiled_cfg_grammar.start),
+                    get_start_frontier_walk(compiled_cfg_grammar),
                 )
-                self.get_next_terminals(generation_state=deque([start]))
                 return
             else:
                 raise ValueError(
                     "`CFGGenerationState` is `None` while `chosen_symbol` is not."
                 )
 
-        # [NOTE] This is way more complicated than it seems, this can loop X times then choose
-        # another path. Should it be stopped? What about some `LIMIT_LOOP_NON_TERMINAL_DEFAULT`?
-        if _exist_infinite_loop_around_non_terminal_symbols(generation_state):
-            warnings.warn(
-                f"A loop of non-terminal symbols is found {_get_non_terminal_loop_str_from_generation_state_stack(deepcopy(generation_state))}, path will be ignored."
-            )
-            return
-
         if chosen_symbol is None:
-            # Poping the last graph.
-            last_visit_graph = generation_state[-1].graph
-            # Poping the last state.
-            last_visit_symbol = generation_state[-1].state
-            # Get the next nodes according to `last_visit_symbol`, which refers to the last visited (non-terminal) symbol from where the stack was addded.
-            next_symbols = (
-                last_visit_graph.tree[last_visit_symbol]
-                if last_visit_symbol is not None
-                else last_visit_graph.initials
+            # Get the next nodes according to the last visited node, which refers to the last visited (non-terminal) symbol from where the stack was addded.
+            next_steps = get_next_frontier_steps(
+                compiled_cfg_grammar, generation_state.rule_id, generation_state.node
             )
 
-            # [NOTE] Sometimes `next_symbols` is returned empty, this can happen when:
-            # (1) You pop from the stack, and the place where you land was a `END-OF-DEFINITON`
-            # non-terminal symbol (we return a None chosen symbol after poping from the stack).
-            # (2) The second case where we pass a `chosen_symbol = None` is at the beggining,
-            # this would then happen if `start` is connected to one single terminal symbol.
-            # Handles reaching the end of a symbol graph (`next_symbols` being empty).
-            if not next_symbols:
-                generation_state.pop()
-                # Handles reaching the end of stack.
-                if not generation_state:
-                    return
-                # Should return the last label, but as a symbol of the last symbol graph.
-                self.get_next_terminals(deepcopy(generation_state))
-                return
-
-            for next_symbol in next_symbols:
-                if next_symbol.s_type in [
-                    SymbolType.TERMINAL,
-                    SymbolType.REGEX,
-                    SymbolType.SPECIAL,
-                ]:
-                    self.next_terminals_w_history[next_symbol] = deepcopy(
-                        generation_state
-                    )
-
-                # Create an additional layer in the stack.
-                if next_symbol.s_type == SymbolType.NON_TERMINAL:
-                    last_generation_state = _push_stateful_symbol_graph_layer_to_stack(
-                        deepcopy(generation_state),
-                        self.built_cfg_grammar[next_symbol.content],
-                        next_symbol,
-                    )
-                    self.get_next_terminals(last_generation_state)
-
-            return
-
-        # Poping the last graph.
-        last_visit_graph = generation_state[-1].graph
-
-        # Get the next nodes according to `chosen_symbol`, which refers to the (terminal) symbol chosen by the LLM.
-        next_symbols = last_visit_graph.tree[chosen_symbol]
-
-        # Handles reaching the end of a symbol graph (`next_symbols` being empty).
-        if not next_symbols:
-            generation_state.pop()
+        else:
+            # Get the next nodes according to `chosen_symbol`, which refers to the (terminal) symbol chosen by the LLM.
+            chosen_node = compiled_cfg_grammar.rules[
+                generation_state.rule_id
+            ].node_ids.get(chosen_symbol)
+            next_steps = (
+                get_next_frontier_steps(
+                    compiled_cfg_grammar, generation_state.rule_id, chosen_node
+                )
+                if chosen_node is not None
+                else ()
+            )
+            if next_steps:
+                # Update the state for `CompiledGraphState` to the (terminal) node chosen by the LLM.
+                generation_state = replace(generation_state, node=chosen_node)
+
+        # [NOTE] Sometimes `next_steps` is returned empty, this can happen when:
+        # (1) You pop from the stack, and the place where you land was a `END-OF-DEFINITON`
+        # non-terminal symbol (we return a None chosen symbol after poping from the stack).
+        # (2) The second case where we pass a `chosen_symbol = None` is at the beggining,
+        # this would then happen if `start` is connected to one single terminal symbol.
+        # Handles reaching the end of a rule (`next_steps` being empty).
+        while not next_steps:
+            # Should return the last label, but as a symbol of the last symbol graph.
+            generation_state = generation_state.parent
             # Handles reaching the end of stack.
-            if not generation_state:
+            if generation_state is None:
                 return
-            # Should return the last label, but as a symbol of the last symbol graph.
-            self.get_next_terminals(deepcopy(generation_state))
-            return
-
-        # Update the state for `SymbolGraphState` to the (terminal) symbol chosen by the LLM.
-        generation_state[-1].state = chosen_symbol
-
-        # [NOTE] Do something about this?
-        for next_symbol in next_symbols:
-            if next_symbol.s_type in [
-                SymbolType.TERMINAL,
-                SymbolType.REGEX,
-                SymbolType.SPECIAL,
-            ]:
-                self.next_terminals_w_history[next_symbol] = deepcopy(generation_state)
+            next_steps = get_next_frontier_steps(
+                compiled_cfg_grammar, generation_state.rule_id, generation_state.node
+            )
 
-            # Create an additional layer in the stack.
-            if next_symbol.s_type == SymbolType.NON_TERMINAL:
-                self.get_next_terminals(
-                    _push_stateful_symbol_graph_layer_to_stack(
-                        deepcopy(generation_state),  # type: ignore
-                        self.built_cfg_grammar[next_symbol.content],
-                        next_symbol,
-                    )
-                )
+        # The steps are gone through as a walk built along with them.
+        _add_frontier_walk_to_next_terminals(
+            next_terminals_w_history,
+            generation_state,
+            get_next_frontier_walk(
+                compiled_cfg_grammar, generation_state.rule_id, generation_state.node
+            ),
+        )
@@ -1,10 +1,16 @@
-import warnings
-import random
 import re
-
-from typing import Deque
-
-from cfg_parse.base import Symbol, SymbolGraph, SymbolGraphState, SymbolType
+from dataclasses import replace
+from typing import Iterable, Iterator, Optional
+
+from cfg_parse.base import (
+    CompiledGraphState,
+    FrontierWalk,
+    NextTerminals,
+    Symbol,
+    SymbolGraph,
+    SymbolGraphState,
+    SymbolType,
+)
 from cfg_parse.exceptions import InvalidGrammar, ParsingError
 
 
@@ -18,11 +24,24 @@ def _is_not_valid_rule_name(rule: str):
     return regex.search(rule) is not None
 
 
-def _divide_cfg_grammar_into_definitions(grammar: str) -> dict[str, str]:
-    divided_cfg_grammar_dict: dict[str, str] = {}
-    current_rule: str = ""
+# Lines of the grammar one at a time, instead of splitting the whole grammar into a list.
+def _iter_cfg_grammar_lines(grammar: str) -> Iterator[str]:
+    line_start = 0
+    while True:
+        line_end = grammar.find("\n", line_start)
+        if line_end < 0:
+            yield grammar[line_start:]
+            return
+        yield grammar[line_start:line_end]
+        line_start = line_end + 1
+
 
-    lines = grammar.strip().split("\n")
+# Yields each rule with its definition once its continuation lines are assembled, only the
+# rule being read is held in memory. `start` is checked for once all the rules are yielded.
+def _iter_cfg_grammar_definitions(lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+    rule_names: set[str] = set()
+    current_rule: Optional[str] = None
+    definition_lines: list[str] = []
 
     for line in lines:
         line = line.strip()
@@ -35,7 +54,7 @@ def _divide_cfg_grammar_into_definitions(grammar: str) -> dict[str, str]:
             if not current_rule:
                 raise InvalidGrammar(f"Missing `:` in '''{line}'''.")
 
-            divided_cfg_grammar_dict[current_rule] += " " + line
+            definition_lines.append(line)
 
         else:
             parts = line.split(":")
@@ -44,70 +63,143 @@ def _divide_cfg_grammar_into_definitions(grammar: str) -> dict[str, str]:
                 # Handles multiple use of ':' in a single definition.
                 raise InvalidGrammar(f"Invalid grammar rule: {line}.")
 
+            if current_rule is not None:
+                yield current_rule, " ".join(definition_lines)
+
             current_rule, definition = parts
 
             if _is_not_valid_rule_name(current_rule):
                 raise InvalidGrammar(f"Invalid rule name: {current_rule}.")
 
-            if current_rule in divided_cfg_grammar_dict:
+            if current_rule in rule_names:
                 raise InvalidGrammar(f"Redefinition of grammar rule: {current_rule}.")
 
-            divided_cfg_grammar_dict[current_rule] = definition.strip()
+            rule_names.add(current_rule)
+            definition_lines = [definition.strip()]
+
+    if current_rule is not None:
+        yield current_rule, " ".join(definition_lines)
 
-    if "start" not in divided_cfg_grammar_dict:
+    if "start" not in rule_names:
         raise InvalidGrammar(f"The symbol `start` is non-existant.")
 
-    return divided_cfg_grammar_dict
+
+def _divide_cfg_grammar_into_definitions(grammar: str) -> dict[str, str]:
+    return dict(_iter_cfg_grammar_definitions(_iter_cfg_grammar_lines(grammar)))
 
 
 # [NOTE] `StatefulSymbolGraph` is better.
-def _turn_symbol_graph_into_stateful_obj(symbol_graph: SymbolGraph, label: str):
-    return SymbolGraphState(symbol_graph, label)
+def _turn_symbol_graph_into_stateful_obj(
+    symbol_graph: SymbolGraph,
+    label: str,
+    parent: Optional[SymbolGraphState] = None,
+):
+    return SymbolGraphState(symbol_graph, label, parent=parent)
+
+
+def _update_stateful_symbol_graph_layer_state(
+    generation_state: SymbolGraphState, symbol: Symbol
+) -> SymbolGraphState:
+    # Frames are immutable, the updated top frame shares its parent with `generation_state`.
+    return replace(generation_state, state=symbol)
 
 
 def _push_stateful_symbol_graph_layer_to_stack(
-    generation_state: Deque[SymbolGraphState],
+    generation_state: SymbolGraphState,
     symbol_graph_state_symbol_graph: SymbolGraph,
     symbol_graph_state_symbol: Symbol,
-):
-    symbol_graph_state_upper_layer = _turn_symbol_graph_into_stateful_obj(
-        symbol_graph_state_symbol_graph, symbol_graph_state_symbol.content
-    )
-
+) -> SymbolGraphState:
     # Set up the state for the bottom stack layer, it'll save where we left for when
     # we pop the upper stack layer. We would then search for the next symbols from
     # the last non-terminal symbol.
-    generation_state[-1].state = symbol_graph_state_symbol
+    symbol_graph_state_bottom_layer = _update_stateful_symbol_graph_layer_state(
+        generation_state, symbol_graph_state_symbol
+    )
+
+    # Add stack layer `StackGraphState` on top of the bottom stack layer.
+    return _turn_symbol_graph_into_stateful_obj(
+        symbol_graph_state_symbol_graph,
+        symbol_graph_state_symbol.content,
+        parent=symbol_graph_state_bottom_layer,
+    )
 
-    # Add stack layer `StackGraphState` to `Deque[SymbolGraphState]`.
-    generation_state.append(symbol_graph_state_upper_layer)
 
-    return generation_state
+def _iter_generation_state_stack(
+    generation_state: Optional[SymbolGraphState],
+) -> Iterator[SymbolGraphState]:
+    # Iterates from the top of the stack to its bottom.
+    while generation_state is not None:
+        yield generation_state
+        generation_state = generation_state.parent
 
 
 def _get_non_terminal_loop_str_from_generation_state_stack(
-    generation_state_loop_queue: Deque[SymbolGraphState],
+    generation_state: SymbolGraphState,
 ) -> str:
-    initial = generation_state_loop_queue.popleft()
+    labels = [
+        symbol_graph_state.label
+        for symbol_graph_state in _iter_generation_state_stack(generation_state)
+    ]
+    labels.reverse()
 
-    result = initial.label
+    result = labels[0]
 
-    for generation_state in generation_state_loop_queue:
-        result += " ->" + generation_state.label
+    for label in labels[1:]:
+        result += " ->" + label
 
-    result += " ->" + initial.label
+    result += " ->" + labels[0]
 
     return result
 
 
 def _exist_infinite_loop_around_non_terminal_symbols(
-    generation_state: Deque[SymbolGraphState],
+    generation_state: SymbolGraphState,
 ) -> bool:
-    if len(generation_state) > 1:
-        return generation_state[-1].label == generation_state[0].label
+    if generation_state.parent is not None:
+        *_, generation_state_bottom = _iter_generation_state_stack(generation_state)
+        return generation_state.label == generation_state_bottom.label
     return False
 
 
+def _push_compiled_graph_layer_to_stack(
+    generation_state: CompiledGraphState,
+    rule_id: int,
+    node: int,
+) -> CompiledGraphState:
+    # The bottom stack layer saves the non-terminal node from where the upper layer was pushed.
+    # Built directly rather than through `replace`, which costs more than the frame itself.
+    return CompiledGraphState(
+        rule_id,
+        parent=CompiledGraphState(
+            generation_state.rule_id, node, generation_state.parent
+        ),
+    )
+
+
+def _iter_compiled_generation_state_stack(
+    generation_state: Optional[CompiledGraphState],
+) -> Iterator[CompiledGraphState]:
+    # Iterates from the top of the stack to its bottom.
+    while generation_state is not None:
+        yield generation_state
+        generation_state = generation_state.parent
+
+
+# Adds the terminals reached by `walk` from `generation_state` (see `FrontierWalk`), pushing
+# the layers the walk goes through. Frames are immutable, the stack is shared instead of copied.
+def _add_frontier_walk_to_next_terminals(
+    next_terminals_w_history: NextTerminals,
+    generation_state: CompiledGraphState,
+    walk: FrontierWalk,
+):
+    layers = [generation_state]
+    for layer, rule_id, node in walk.pushes:
+        layers.append(_push_compiled_graph_layer_to_stack(layers[layer], rule_id, node))
+
+    for symbol, layer in walk.terminals:
+        next_terminals_w_history[symbol] = layers[layer]
+
+
 def _extract_str_from_symbols(symbols: list[Symbol]) -> list[str]:
     symbols_str: list[str] = []
     for symbol in symbols:
@@ -140,14 +232,15 @@ def _validate_regex(string: str, pattern: str) -> bool:
     return False
 
 
-def _retrace_symbol_obj_from_str(
+# Every symbol among the next terminals matching `chosen_symbol_str`, the text could stand for
+# more than one symbol in different paths and all of them are followed (see `cfg_guide/gss.py`).
+def _retrace_symbol_objs_from_str(
     chosen_symbol_str: str,
-    next_terminal_symbols: list[Symbol],
-) -> Symbol:
+    next_terminal_symbols: Iterable[Symbol],
+) -> list[Symbol]:
     chosen_symbols: list[Symbol] = []
 
     for symbol in next_terminal_symbols:
-        # [NOTE] `chosen_symbol_str` could represent more than one symbol in different paths. Send a warning and randomly pick a symbol with equal probability.
         if symbol.s_type == SymbolType.REGEX:
             if _validate_regex(chosen_symbol_str, symbol.content):
                 chosen_symbols.append(symbol)
@@ -159,13 +252,9 @@ def _retrace_symbol_obj_from_str(
                 f"{symbol.s_type} is invalid, only {SymbolType.TERMINAL} or {SymbolType.REGEX} are valid."
             )
 
-    # [NOTE] Could be interactive here.
-    # Shows the different paths and lets the user choose which one.
-    if len(chosen_symbols) > 2:
-        warnings.warn(
-            "Chosen symbol present in multiple paths, one will be picked with equal probability."
+    if not chosen_symbols:
+        raise ParsingError(
+            f"{chosen_symbol_str} doesn't match any of the next terminal symbols."
         )
-        chosen_symbol = random.choice(chosen_symbols)
-        return chosen_symbol
 
-    return chosen_symbols[0]
+    return chosen_symbols
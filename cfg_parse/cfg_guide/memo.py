@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Mapping, Optional, Union
+
+from cfg_parse.base import CompiledGraphState, EarleyItem, EarleySet, GSSNode, Symbol
+
+DEFAULT_FRONTIER_MEMO_MAX_SIZE = 1024
+DEFAULT_FRONTIER_MEMO_SUFFIX_DEPTH = 4
+
+# Next terminals of a state of the guide (see `NextTerminals`), or of the live parses of a
+# session (see `cfg_guide/gss.py` and `cfg_guide/earley.py`). The memo keeps them read-only.
+MemoizedNextTerminals = Mapping[
+    Symbol, Union[CompiledGraphState, list[GSSNode], list[EarleyItem]]
+]
+
+
+# Remembers the next terminals of the generation states met, in LRU order. The next terminals
+# only depend on the `(rule_id, node)` of the frames popped before reaching a frame with next
+# nodes, and on that frame, so that states repeating the same frames on top of a shared stack
+# are looked up instead of expanded again (e.g. the items of a list, after each `,`). The next
+# terminals of the live parses of a session are remembered the same way (see `get_gss_key` and
+# `get_earley_key`). The memo can be shared by the sessions of concurrent threads.
+class FrontierMemo:
+    def __init__(
+        self,
+        max_size: int = DEFAULT_FRONTIER_MEMO_MAX_SIZE,
+        suffix_depth: int = DEFAULT_FRONTIER_MEMO_SUFFIX_DEPTH,
+    ):
+        self.max_size = max_size
+        # Top frames of a state compared by their `(rule_id, node)`, the frame below them is
+        # compared as the object itself. Deeper suffixes match states rebuilt on top of the
+        # same stack more often, but cost more to compare.
+        self.suffix_depth = suffix_depth
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._next_terminals_w_history: OrderedDict[
+            Hashable, MemoizedNextTerminals
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._next_terminals_w_history)
+
+    def get_key(
+        self,
+        generation_state: Optional[CompiledGraphState],
+        chosen_symbol: Optional[Symbol],
+    ) -> Hashable:
+        # Frames are immutable, the frame below the suffix stands for the rest of the stack.
+        # Keeping it in the key keeps it alive, so that it can't be mistaken for another one.
+        key: list = [chosen_symbol]
+        for _ in range(self.suffix_depth):
+            if generation_state is None:
+                break
+            key.append(generation_state.rule_id)
+            key.append(generation_state.node)
+            generation_state = generation_state.parent
+        key.append(generation_state)
+        return tuple(key)
+
+    # The `(rule_id, node)` of the nodes of the graph-structured stack a position carries on
+    # from, with their parents, once the parses reaching the chosen text are advanced and popped.
+    # Parents are complete, they're compared as the objects themselves and stand for the rest
+    # of the stack.
+    def get_gss_key(
+        self, resumed_gss_parents: dict[tuple[int, int], list[tuple[GSSNode, int]]]
+    ) -> Hashable:
+        return tuple(
+            (rule_id, node, tuple(parents))
+            for (rule_id, node), parents in resumed_gss_parents.items()
+        )
+
+    # The `(rule_id, node, origin)` of the items an Earley set is scanned from, the set only
+    # depends on them. Origins are complete, they're compared as the objects themselves.
+    def get_earley_key(
+        self, scanned_items: Iterable[tuple[int, int, EarleySet]]
+    ) -> Hashable:
+        return tuple(scanned_items)
+
+    def get(self, key: Hashable) -> Optional[MemoizedNextTerminals]:
+        with self._lock:
+            next_terminals_w_history = self._next_terminals_w_history.get(key)
+            if next_terminals_w_history is None:
+                self.misses += 1
+                return None
+
+            self._next_terminals_w_history.move_to_end(key)
+            self.hits += 1
+            return next_terminals_w_history
+
+    def add(
+        self,
+        key: Hashable,
+        next_terminals_w_history: MemoizedNextTerminals,
+    ):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._next_terminals_w_history[key] = next_terminals_w_history
+            while len(self._next_terminals_w_history) > self.max_size:
+                self._next_terminals_w_history.popitem(last=False)
+                self.evictions += 1
+
+    def get_hit_rate(self) -> float:
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._next_terminals_w_history.clear()
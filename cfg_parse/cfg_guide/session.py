@@ -0,0 +1,37 @@
+from typing import KeysView
+
+from cfg_parse.base import Symbol
+from cfg_parse.cfg_guide.guide import CFGGuide, CFGParsesFrontier
+
+
+# The generation of one request. The session owns its next terminals, the guide, its compiled
+# grammar and its frontier table are shared by all sessions, so that a session costs one dict
+# of the size of the frontier and the nodes of its live parses. The parses are kept in a
+# graph-structured stack (see `cfg_guide/gss.py`), or in an Earley chart for a guide built with
+# `earley` (see `cfg_guide/earley.py`): every terminal matching the chosen text is followed,
+# the parses reaching the same state at the same position are merged.
+class GuideSession:
+    def __init__(self, guide: CFGGuide):
+        self.guide = guide
+        # It's replaced on each step but never mutated.
+        self.next_terminals_w_parses: CFGParsesFrontier = guide.advance_parses_frontier(
+            None, None
+        )
+
+    # The terminals allowed next, as a read-only set-like view. It's the union of the next
+    # terminals of every live parse.
+    def allowed(self) -> KeysView[Symbol]:
+        return self.next_terminals_w_parses.keys()
+
+    # Advances the session with the text chosen among the allowed terminals (e.g. `'"x"'`
+    # for the terminal `"x"`, `'"42"'` for `Regex("[0-9]+")`, `"EOS_SYMBOL"` to close a
+    # rule), and returns the terminals allowed next.
+    def advance(self, chosen_text: str) -> KeysView[Symbol]:
+        self.next_terminals_w_parses = self.guide.advance_parses_frontier(
+            self.next_terminals_w_parses, chosen_text
+        )
+        return self.allowed()
+
+    # No terminal is allowed once the end of `start` is reached.
+    def is_finished(self) -> bool:
+        return not self.next_terminals_w_parses
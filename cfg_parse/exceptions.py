@@ -1,13 +1,30 @@
+from typing import Optional
+
+
 class SymbolNotFound(Exception):
     pass
 
 
 class InvalidSymbol(Exception):
-    pass
+    # `offset` is the position of the invalid symbol in its definition.
+    def __init__(self, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.offset = offset
+
+    # Keeps `offset` when raised in a worker process.
+    def __reduce__(self):
+        return (type(self), (str(self), self.offset))
 
 
 class InvalidDelimiters(Exception):
-    pass
+    # `offset` is the position of the faulty delimiter in its definition.
+    def __init__(self, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.offset = offset
+
+    # Keeps `offset` when raised in a worker process.
+    def __reduce__(self):
+        return (type(self), (str(self), self.offset))
 
 
 class InvalidGrammar(Exception):
@@ -16,3 +33,7 @@ class InvalidGrammar(Exception):
 
 class ParsingError(Exception):
     pass
+
+
+class InvalidCompiledGrammar(Exception):
+    pass
@@ -1,14 +1,27 @@
+import sys
 from collections import defaultdict
 
 import pytest
 
-from cfg_parse.base import OrderedSet, Symbol, SymbolGraph
+from cfg_parse.base import (
+    OrderedSet,
+    Symbol,
+    SymbolArena,
+    SymbolGraph,
+    Token,
+    TokenType,
+)
 from cfg_parse.cfg_build.build import (
     build_symbol_graph,
     connect_symbol_graph,
     construct_symbol_subgraph,
+    minimize_symbol_graph,
+)
+from cfg_parse.cfg_build.helpers import (
+    _enumerate_symbol_graph_nodes,
+    _lex_symbol_def,
+    get_symbols_from_generated_symbol_graph,
 )
-from cfg_parse.cfg_build.helpers import get_symbols_from_generated_symbol_graph
 
 # ----------------------------- construct_symbol_subgraph -----------------------------
 
@@ -230,6 +243,26 @@ def test_connect_symbol_graph_subdefs_with_regex_and_or(
     assert true_symbol_graph == generated_symbol_graph
 
 
+def test_connect_symbol_graph_in_place(
+    simple_subdef_without_or: str, simple_subdef_with_or: str
+):
+    symbol_graph_lhs = construct_symbol_subgraph(simple_subdef_with_or.split())
+    symbol_graph_rhs = construct_symbol_subgraph(simple_subdef_without_or.split())
+    symbol_graph_lhs_before = symbol_graph_lhs.copy()
+
+    # By default the operands are left untouched.
+    generated_symbol_graph = connect_symbol_graph(symbol_graph_lhs, symbol_graph_rhs)
+    assert symbol_graph_lhs == symbol_graph_lhs_before
+
+    # With `in_place`, the result shares the operands instead of copying them.
+    generated_symbol_graph_in_place = connect_symbol_graph(
+        symbol_graph_lhs, symbol_graph_rhs, in_place=True
+    )
+    assert generated_symbol_graph_in_place == generated_symbol_graph
+    assert generated_symbol_graph_in_place.initials is symbol_graph_lhs.initials
+    assert generated_symbol_graph_in_place.finals is symbol_graph_rhs.finals
+
+
 @pytest.fixture
 def def_without_or_without_special_delimiters():
     return """ "(" expression (factor "-" Regex("[0-9]*.[0-9]*")) ")" """
@@ -1345,3 +1378,144 @@ def test_build_graph_def_with_in_and_out_ext_or_seq_mixed_disrupt_in_between_and
     true_symbol_graph = SymbolGraph(initials=initials, tree=tree, finals=finals)
 
     assert true_symbol_graph == generated_symbol_graph
+
+
+# ----------------------------- Symbol -----------------------------
+
+
+def test_symbol_occurrences_are_distinct_nodes():
+    arena = SymbolArena()
+    generated_symbol_graph = build_symbol_graph(""" "a" "a" | "a" """, arena)
+    symbols = get_symbols_from_generated_symbol_graph(generated_symbol_graph)
+
+    symbol_a_0, symbol_a_1, symbol_a_2 = (symbols[f'"a"|{index}'] for index in range(3))
+    assert symbol_a_0 != symbol_a_1 and symbol_a_1 != symbol_a_2
+    assert len({symbol_a_0, symbol_a_1, symbol_a_2}) == 3
+    # Ids are small integers allocated from the arena of the grammar.
+    assert {symbol.s_id for symbol in (symbol_a_0, symbol_a_1, symbol_a_2)} == {0, 1, 2}
+
+    # Contents are interned and copies share the symbols.
+    assert symbol_a_0.content is symbol_a_1.content
+    assert generated_symbol_graph.copy() == generated_symbol_graph
+    assert list(generated_symbol_graph.copy().initials)[0] is symbol_a_0
+
+
+def test_symbol_graph_predecessors_are_kept_up_to_date():
+    generated_symbol_graph = build_symbol_graph(""" "a" { "b" | "c" } "d" """)
+    symbols = get_symbols_from_generated_symbol_graph(generated_symbol_graph)
+
+    # The index built incrementally matches the one built from the tree.
+    rebuilt_symbol_graph = SymbolGraph(
+        initials=generated_symbol_graph.initials,
+        tree=generated_symbol_graph.tree,
+        finals=generated_symbol_graph.finals,
+    )
+    for symbol in generated_symbol_graph.tree:
+        assert list(generated_symbol_graph.get_predecessors(symbol)) == list(
+            rebuilt_symbol_graph.get_predecessors(symbol)
+        )
+    assert list(generated_symbol_graph.get_predecessors(symbols['"d"|0'])) == [
+        symbols['"b"|0'],
+        symbols['"c"|0'],
+    ]
+
+    generated_symbol_graph.discard_edge(symbols['"b"|0'], symbols['"d"|0'])
+    assert list(generated_symbol_graph.get_predecessors(symbols['"d"|0'])) == [
+        symbols['"c"|0']
+    ]
+
+
+def test_symbol_graph_eos_symbols_are_tracked():
+    generated_symbol_graph = build_symbol_graph(""" { "a" } """)
+
+    assert len(generated_symbol_graph.eos_initials) == 1
+    assert len(generated_symbol_graph.eos_finals) == 1
+    assert not build_symbol_graph(""" "a" """).eos_initials
+
+
+def test_build_graph_nesting_deeper_than_recursion_limit():
+    depth = sys.getrecursionlimit() + 100
+    symbol_def = "".join(f'( "a{i}" ' for i in range(depth)) + "".join(
+        f' "b{i}" )' for i in reversed(range(depth))
+    )
+
+    generated_symbol_graph = build_symbol_graph(symbol_def, SymbolArena())
+
+    assert [symbol.content for symbol in generated_symbol_graph.initials] == ['"a0"']
+    assert [symbol.content for symbol in generated_symbol_graph.finals] == ['"b0"']
+    assert len(generated_symbol_graph.tree) == 2 * depth - 1
+
+
+# ----------------------------- _lex_symbol_def -----------------------------
+
+
+def test_lex_symbol_def_tokens():
+    symbol_def = """term | "(" {Regex("[0-9]+")}"""
+
+    # The additional enclosing delimiters are placed right before and after the definition.
+    assert _lex_symbol_def(symbol_def) == [
+        Token("(", TokenType.OPENING_DELIMITER, -1),
+        Token("term", TokenType.NON_TERMINAL, 0),
+        Token("|", TokenType.OR, 5),
+        Token('"("', TokenType.TERMINAL, 7),
+        Token("{", TokenType.OPENING_DELIMITER, 11),
+        Token('Regex("[0-9]+")', TokenType.REGEX, 12),
+        Token("}", TokenType.CLOSING_DELIMITER, 27),
+        Token(")", TokenType.CLOSING_DELIMITER, 28),
+    ]
+
+
+# ----------------------------- minimize_symbol_graph -----------------------------
+
+
+def _get_contents_tree(symbol_graph: SymbolGraph) -> dict[str, list[str]]:
+    return {
+        f"{symbol.content}|{symbol.s_id}": [
+            f"{symbol_child.content}|{symbol_child.s_id}"
+            for symbol_child in symbol_children
+        ]
+        for symbol, symbol_children in symbol_graph.tree.items()
+    }
+
+
+def test_minimize_symbol_graph_merges_common_prefixes():
+    generated_symbol_graph = build_symbol_graph(
+        """ "a" x | "a" y | "a" z """, SymbolArena()
+    )
+    assert len(generated_symbol_graph.initials) == 3
+
+    minimized_symbol_graph = minimize_symbol_graph(generated_symbol_graph)
+
+    assert [symbol.content for symbol in minimized_symbol_graph.initials] == ['"a"']
+    assert _get_contents_tree(minimized_symbol_graph) == {
+        '"a"|0': ["x|1", "y|3", "z|5"]
+    }
+    assert [symbol.content for symbol in minimized_symbol_graph.finals] == [
+        "x",
+        "y",
+        "z",
+    ]
+
+
+def test_minimize_symbol_graph_merges_common_suffixes():
+    generated_symbol_graph = build_symbol_graph(
+        """ x "b" "c" | y "b" "c" """, SymbolArena()
+    )
+
+    minimized_symbol_graph = minimize_symbol_graph(generated_symbol_graph)
+
+    assert len(_enumerate_symbol_graph_nodes(generated_symbol_graph)) == 6
+    assert len(_enumerate_symbol_graph_nodes(minimized_symbol_graph)) == 4
+    assert _get_contents_tree(minimized_symbol_graph) == {
+        "x|0": ['"b"|1'],
+        '"b"|1': ['"c"|2'],
+        "y|3": ['"b"|1'],
+    }
+    assert [symbol.content for symbol in minimized_symbol_graph.finals] == ['"c"']
+
+
+def test_minimize_symbol_graph_keeps_rule_ends():
+    # The first `"a"` ends the rule while the second doesn't, they can't be merged.
+    generated_symbol_graph = build_symbol_graph(""" "a" | "a" "b" """, SymbolArena())
+
+    assert minimize_symbol_graph(generated_symbol_graph) is generated_symbol_graph
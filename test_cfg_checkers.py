@@ -1,10 +1,9 @@
+from typing import cast
+
 import pytest
 
 from cfg_parse.cfg_build.build import _convert_str_def_to_str_queue
-
 from cfg_parse.cfg_guide.guide import _divide_cfg_grammar_into_definitions
-
-
 from cfg_parse.exceptions import InvalidDelimiters, InvalidGrammar, InvalidSymbol
 
 # ----------------------------- InvalidSymbol -----------------------------
@@ -235,6 +234,51 @@ def test_invalid_delimiters_open_none_any_close_none_once(
     )
 
 
+# ----------------------------- Offsets -----------------------------
+
+
+def test_invalid_symbol_offset(
+    invalid_symbol_non_terminal_with_special_characters_0x40: str,
+):
+    with pytest.raises(InvalidSymbol) as exc_info:
+        _convert_str_def_to_str_queue(
+            invalid_symbol_non_terminal_with_special_characters_0x40
+        )
+
+    # The raised type is lost on `exc_info` by the installed pytest stubs.
+    assert cast(InvalidSymbol, exc_info.value).offset == (
+        invalid_symbol_non_terminal_with_special_characters_0x40.index("fact@or")
+    )
+
+
+def test_invalid_delimiters_offset(
+    invalid_delimiters_open_standard_close_none_any: str,
+):
+    with pytest.raises(InvalidDelimiters) as exc_info:
+        _convert_str_def_to_str_queue(invalid_delimiters_open_standard_close_none_any)
+
+    assert cast(InvalidDelimiters, exc_info.value).offset == (
+        invalid_delimiters_open_standard_close_none_any.index("}")
+    )
+
+
+def test_invalid_symbol_raised_before_invalid_delimiters():
+    with pytest.raises(InvalidSymbol) as exc_info:
+        _convert_str_def_to_str_queue(""" "(" expression } fact@or """)
+
+    assert str(exc_info.value) == "Invalid symbol name fact@or."
+
+
+def test_invalid_delimiters_closing_without_opening():
+    with pytest.raises(InvalidDelimiters) as exc_info:
+        _convert_str_def_to_str_queue(""" "(" expression ) factor """)
+
+    assert (
+        str(exc_info.value)
+        == 'No opening delimiter `(` found for `)` in `( "(" expression ) factor <<)>>`.'
+    )
+
+
 # ----------------------------- InvalidGrammar -----------------------------
 @pytest.fixture
 def invalid_grammar_rule_name_0x40():
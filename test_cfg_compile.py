@@ -0,0 +1,1123 @@
+import mmap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cfg_parse.base import LazyCompiledRules, SymbolType
+from cfg_parse.cfg_build.build import build_symbol_graph
+from cfg_parse.cfg_compile import cache
+from cfg_parse.cfg_compile import compile as compile_module
+from cfg_parse.cfg_compile import registry as registry_module
+from cfg_parse.cfg_compile.analysis import get_left_recursive_rule_groups
+from cfg_parse.cfg_compile.cache import load_compiled_grammar
+from cfg_parse.cfg_compile.compile import (
+    compile_cfg_grammar,
+    compile_cfg_grammar_file,
+    recompile_cfg_grammar,
+)
+from cfg_parse.cfg_compile.loader import iter_cfg_grammar_definitions
+from cfg_parse.cfg_compile.registry import GrammarRegistry
+from cfg_parse.cfg_guide.guide import CFGGuide
+from cfg_parse.cfg_guide.helpers import _divide_cfg_grammar_into_definitions
+from cfg_parse.exceptions import InvalidGrammar, InvalidSymbol
+
+# ----------------------------- compile_cfg_grammar -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_arithmetic():
+    return """
+    start: expression
+    expression: term {("+" | "-") term}
+    term: Regex("[0-9]+") | "(" expression ")"
+    """
+
+
+def test_compile_cfg_grammar_matches_symbol_graphs(cfg_grammar_arithmetic: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+
+    assert list(compiled_cfg_grammar.rule_ids) == ["start", "expression", "term"]
+    assert compiled_cfg_grammar.start == compiled_cfg_grammar.rule_ids["start"]
+
+    rule = compiled_cfg_grammar.rules[compiled_cfg_grammar.rule_ids["term"]]
+    symbol_graph = build_symbol_graph(""" Regex("[0-9]+") | "(" expression ")" """)
+
+    assert len(rule) == 4
+    assert [
+        compiled_cfg_grammar.contents[rule.contents[node]] for node in rule.initials
+    ] == [symbol.content for symbol in symbol_graph.initials]
+    assert [
+        compiled_cfg_grammar.contents[rule.contents[node]] for node in rule.finals
+    ] == [symbol.content for symbol in symbol_graph.finals]
+
+    # Successors follow the order of the symbol graph, contents are unique in `term`.
+    symbol_graph_tree = {
+        symbol.content: [symbol_child.content for symbol_child in symbol_children]
+        for symbol, symbol_children in symbol_graph.tree.items()
+    }
+    for symbol, node in rule.node_ids.items():
+        assert rule.symbols[node] is symbol
+        assert rule.kinds[node] == symbol.s_type.value
+        assert [
+            rule.symbols[next_node].content for next_node in rule.get_next_nodes(node)
+        ] == symbol_graph_tree.get(symbol.content, [])
+
+
+def test_compile_cfg_grammar_links_non_terminals(cfg_grammar_arithmetic: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+
+    rule = compiled_cfg_grammar.rules[compiled_cfg_grammar.start]
+    (node,) = rule.initials
+
+    assert rule.kinds[node] == SymbolType.NON_TERMINAL.value
+    assert (
+        compiled_cfg_grammar.get_rule_id(rule, node)
+        == compiled_cfg_grammar.rule_ids["expression"]
+    )
+
+
+def test_compile_cfg_grammar_undefined_rule():
+    with pytest.raises(InvalidGrammar) as exc_info:
+        compile_cfg_grammar("start: expression")
+
+    assert str(exc_info.value) == "Undefined grammar rule: expression (in start)."
+
+
+# ----------------------------- parallel compile -----------------------------
+
+
+def _get_compiled_grammar_arrays(compiled_cfg_grammar) -> tuple:
+    return (
+        compiled_cfg_grammar.contents,
+        list(compiled_cfg_grammar.content_rule_ids),
+        [
+            (
+                rule.label,
+                list(rule.kinds),
+                list(rule.contents),
+                list(rule.successor_offsets),
+                list(rule.successors),
+                list(rule.initials),
+                list(rule.finals),
+            )
+            for rule in compiled_cfg_grammar.rules
+        ],
+    )
+
+
+def test_compile_cfg_grammar_in_parallel_matches_serial(
+    cfg_grammar_arithmetic: str, monkeypatch
+):
+    monkeypatch.setattr(compile_module, "PARALLEL_COMPILE_MIN_GRAMMAR_SIZE", 0)
+
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+    compiled_cfg_grammar_in_parallel = compile_cfg_grammar(
+        cfg_grammar_arithmetic, max_workers=2
+    )
+
+    assert _get_compiled_grammar_arrays(
+        compiled_cfg_grammar_in_parallel
+    ) == _get_compiled_grammar_arrays(compiled_cfg_grammar)
+    for rule in compiled_cfg_grammar_in_parallel.rules:
+        assert [rule.node_ids[symbol] for symbol in rule.symbols] == list(
+            range(len(rule))
+        )
+
+
+def test_compile_cfg_grammar_in_parallel_reports_errors(monkeypatch):
+    monkeypatch.setattr(compile_module, "PARALLEL_COMPILE_MIN_GRAMMAR_SIZE", 0)
+
+    with pytest.raises(InvalidSymbol) as exc_info:
+        compile_cfg_grammar(
+            """
+            start: a
+            a: "x" fact@or
+            """,
+            max_workers=2,
+        )
+
+    assert str(exc_info.value) == "Invalid symbol name fact@or."
+    assert exc_info.value.offset == 4
+
+
+def test_compile_cfg_grammar_small_grammars_compile_serially(
+    cfg_grammar_arithmetic: str, monkeypatch
+):
+    def fail_compile_cfg_grammar_in_parallel(*args):
+        raise AssertionError("Small grammars shouldn't start a process pool.")
+
+    monkeypatch.setattr(
+        compile_module,
+        "_compile_cfg_grammar_in_parallel",
+        fail_compile_cfg_grammar_in_parallel,
+    )
+
+    compile_cfg_grammar(cfg_grammar_arithmetic, max_workers=2)
+
+
+# ----------------------------- lazy compile -----------------------------
+
+
+def _get_next_terminal_contents(guide: CFGGuide, chosen_contents: list[str]) -> list:
+    guide.get_next_terminals()
+    for chosen_content in chosen_contents:
+        (chosen_symbol,) = [
+            symbol
+            for symbol in guide.next_terminals_w_history
+            if symbol.content == chosen_content
+        ]
+        guide.get_next_terminals(
+            guide.next_terminals_w_history[chosen_symbol], chosen_symbol
+        )
+    return [symbol.content for symbol in guide.next_terminals_w_history]
+
+
+def test_compile_cfg_grammar_lazily_compiles_rules_on_demand(
+    cfg_grammar_arithmetic: str,
+):
+    cfg_grammar = cfg_grammar_arithmetic + 'unused: "z"'
+    guide = CFGGuide(cfg_grammar, lazy=True)
+    lazy_compiled_cfg_grammar = guide.compiled_cfg_grammar
+    assert isinstance(lazy_compiled_cfg_grammar.rules, LazyCompiledRules)
+    rule_ids = lazy_compiled_cfg_grammar.rule_ids
+
+    assert not any(
+        lazy_compiled_cfg_grammar.rules.is_compiled(rule_id)
+        for rule_id in rule_ids.values()
+    )
+
+    assert _get_next_terminal_contents(guide, ['"("']) == _get_next_terminal_contents(
+        CFGGuide(cfg_grammar), ['"("']
+    )
+    assert [
+        label
+        for label, rule_id in rule_ids.items()
+        if lazy_compiled_cfg_grammar.rules.is_compiled(rule_id)
+    ] == ["start", "expression", "term"]
+
+    # Compiled rules are kept.
+    rule = lazy_compiled_cfg_grammar.rules[rule_ids["term"]]
+    assert lazy_compiled_cfg_grammar.rules[rule_ids["term"]] is rule
+
+
+def test_compile_cfg_grammar_lazily_validates_up_front():
+    with pytest.raises(InvalidGrammar) as exc_info:
+        compile_cfg_grammar("start: a\na: expression", lazy=True)
+    assert str(exc_info.value) == "Undefined grammar rule: expression (in a)."
+
+    with pytest.raises(InvalidSymbol) as exc_info:
+        compile_cfg_grammar('start: a\na: "x" fact@or', lazy=True)
+    assert exc_info.value.offset == 4
+
+    # Without validation, errors are only raised when the rule is compiled.
+    lazy_compiled_cfg_grammar = compile_cfg_grammar(
+        "start: a\na: expression", lazy=True, validate=False
+    )
+    lazy_compiled_cfg_grammar.rules[lazy_compiled_cfg_grammar.start]
+    with pytest.raises(InvalidGrammar) as exc_info:
+        lazy_compiled_cfg_grammar.rules[lazy_compiled_cfg_grammar.rule_ids["a"]]
+    assert str(exc_info.value) == "Undefined grammar rule: expression (in a)."
+
+
+def test_compile_cfg_grammar_lazily_rejects_inlining(cfg_grammar_arithmetic: str):
+    # Inlining would compile every rule.
+    with pytest.raises(ValueError):
+        compile_cfg_grammar(cfg_grammar_arithmetic, lazy=True, inline_max_nodes=2)
+
+
+def test_compile_cfg_grammar_lazily_compiles_rules_once_under_concurrency(
+    cfg_grammar_arithmetic: str,
+):
+    lazy_compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, lazy=True)
+    lazy_compiled_rules = lazy_compiled_cfg_grammar.rules
+    assert isinstance(lazy_compiled_rules, LazyCompiledRules)
+    compile_rule = lazy_compiled_rules.compile_rule
+    compilations = []
+
+    def slow_compile_rule(rule_id: int):
+        compilations.append(rule_id)
+        time.sleep(0.05)
+        return compile_rule(rule_id)
+
+    lazy_compiled_rules.compile_rule = slow_compile_rule
+    start = lazy_compiled_cfg_grammar.start
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        rules = list(executor.map(lambda _: lazy_compiled_rules[start], range(8)))
+
+    assert compilations == [start]
+    assert all(rule is rules[0] for rule in rules)
+
+
+def test_compile_cfg_grammar_lazily_finds_left_recursive_rule_groups():
+    lazy_compiled_cfg_grammar = compile_cfg_grammar(
+        """
+        start: expr
+        expr: expr "+" term | term
+        term: "x" | "(" expr ")"
+        a: b "p" | "q"
+        b: a "r"
+        """,
+        lazy=True,
+    )
+    assert list(lazy_compiled_cfg_grammar.left_recursive_rules) == [-1] * 5
+
+    # The groups are found for the rules entered, the rules never entered aren't compiled.
+    guide = CFGGuide.from_compiled_cfg_grammar(lazy_compiled_cfg_grammar)
+    assert _get_next_terminal_contents(guide, []) == ['"x"', '"("']
+    assert list(lazy_compiled_cfg_grammar.left_recursive_rules) == [0, 1, 0, -1, -1]
+    assert lazy_compiled_cfg_grammar.left_recursive_rule_groups == [
+        frozenset(),
+        {1},
+        frozenset(),
+        None,
+        None,
+    ]
+    assert not lazy_compiled_cfg_grammar.rules.is_compiled(3)
+
+
+def test_compile_cfg_grammar_lazily_diamonds_entry_frontier_steps():
+    # Each level enters the next one through two rules, 2^depth paths lead to the last level.
+    depth = 16
+    cfg_grammar = "start: r0\n"
+    for i in range(depth):
+        cfg_grammar += f"r{i}: a{i} | b{i}\na{i}: r{i + 1}\nb{i}: r{i + 1}\n"
+    cfg_grammar += f'r{depth}: "z"\n'
+
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar)
+    lazy_guide = CFGGuide(cfg_grammar, lazy=True)
+    assert _get_next_terminal_contents(lazy_guide, []) == ['"z"']
+
+    # No rule is left-recursive, each rule is entered once as with an eager compile.
+    lazy_entry_steps = lazy_guide.compiled_cfg_grammar.frontier_table.entry_steps
+    assert len(lazy_entry_steps) == len(compiled_cfg_grammar.frontier_table.entry_steps)
+    assert len(lazy_entry_steps) <= len(compiled_cfg_grammar.rules)
+
+
+def test_recompile_cfg_grammar_from_lazy_compiled_grammar(cfg_grammar_arithmetic: str):
+    lazy_compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, lazy=True)
+    changed_cfg_grammar = cfg_grammar_arithmetic.replace('"-"', '"*"')
+
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        lazy_compiled_cfg_grammar, changed_cfg_grammar
+    )
+
+    assert _get_next_terminal_contents(
+        CFGGuide.from_compiled_cfg_grammar(recompiled_cfg_grammar), ['"("', '"("']
+    ) == _get_next_terminal_contents(CFGGuide(changed_cfg_grammar), ['"("', '"("'])
+
+
+# ----------------------------- grammar files -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_file(cfg_grammar_arithmetic: str, tmp_path):
+    # Continuation lines are assembled into the rule above them.
+    cfg_grammar_path = tmp_path / "grammar.cfg"
+    cfg_grammar_path.write_text(
+        cfg_grammar_arithmetic + '\n    list: "[" expression\n  {"," expression}\n"]"\n'
+    )
+    return cfg_grammar_path
+
+
+def test_iter_cfg_grammar_definitions_from_path_and_mmap(cfg_grammar_file):
+    divided_cfg_grammar_dict = _divide_cfg_grammar_into_definitions(
+        cfg_grammar_file.read_text()
+    )
+    assert divided_cfg_grammar_dict["list"] == '"[" expression {"," expression} "]"'
+
+    assert list(iter_cfg_grammar_definitions(cfg_grammar_file)) == list(
+        divided_cfg_grammar_dict.items()
+    )
+    with open(cfg_grammar_file, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert list(iter_cfg_grammar_definitions(mapped)) == list(
+                divided_cfg_grammar_dict.items()
+            )
+
+
+def test_iter_cfg_grammar_definitions_yields_rules_as_they_are_read(tmp_path):
+    cfg_grammar_path = tmp_path / "grammar.cfg"
+    cfg_grammar_path.write_text('a: "x"\nb: "y"\n')
+
+    cfg_grammar_definitions = iter_cfg_grammar_definitions(cfg_grammar_path)
+    assert next(cfg_grammar_definitions) == ("a", '"x"')
+    assert next(cfg_grammar_definitions) == ("b", '"y"')
+    with pytest.raises(InvalidGrammar) as exc_info:
+        next(cfg_grammar_definitions)
+    assert str(exc_info.value) == "The symbol `start` is non-existant."
+
+
+def test_compile_cfg_grammar_file_matches_compile_cfg_grammar(cfg_grammar_file):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_file.read_text())
+    compiled_cfg_grammar_file = compile_cfg_grammar_file(cfg_grammar_file)
+
+    assert _get_compiled_grammar_arrays(
+        compiled_cfg_grammar_file
+    ) == _get_compiled_grammar_arrays(compiled_cfg_grammar)
+    assert compiled_cfg_grammar_file.definitions == compiled_cfg_grammar.definitions
+
+    guide = CFGGuide.from_cfg_grammar_file(str(cfg_grammar_file))
+    guide.get_next_terminals()
+    assert [symbol.content for symbol in guide.next_terminals_w_history] == [
+        '"[0-9]+"',
+        '"("',
+    ]
+
+
+def test_compile_cfg_grammar_file_with_cache_dir(cfg_grammar_file, tmp_path):
+    compiled_cfg_grammar_file = compile_cfg_grammar_file(
+        cfg_grammar_file, cache_dir=str(tmp_path)
+    )
+    (cache_entry,) = _get_cache_entries(tmp_path)
+
+    # The file and its text share the cache entry.
+    cached_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_file.read_text(), str(tmp_path)
+    )
+    assert _get_cache_entries(tmp_path) == [cache_entry]
+    assert _get_compiled_grammar_arrays(
+        cached_cfg_grammar
+    ) == _get_compiled_grammar_arrays(compiled_cfg_grammar_file)
+
+
+def test_compile_cfg_grammar_file_lazily(cfg_grammar_file):
+    compiled_cfg_grammar_file = compile_cfg_grammar_file(cfg_grammar_file, lazy=True)
+
+    assert isinstance(compiled_cfg_grammar_file.rules, LazyCompiledRules)
+    assert (
+        compiled_cfg_grammar_file.definitions
+        == compile_cfg_grammar(cfg_grammar_file.read_text()).definitions
+    )
+    with pytest.raises(ValueError):
+        compile_cfg_grammar_file(cfg_grammar_file, inline_max_nodes=4, lazy=True)
+
+
+def test_guide_from_cfg_grammar_file_forwards_options(cfg_grammar_file, tmp_path):
+    guide = CFGGuide.from_cfg_grammar_file(
+        cfg_grammar_file,
+        cache_dir=str(tmp_path),
+        frontier_memo_max_size=0,
+        earley=True,
+    )
+
+    assert len(_get_cache_entries(tmp_path)) == 1
+    assert guide.frontier_memo is None
+    assert guide.earley
+
+    guide = CFGGuide.from_cfg_grammar_file(cfg_grammar_file, lazy=True)
+    assert isinstance(guide.compiled_cfg_grammar.rules, LazyCompiledRules)
+
+
+# ----------------------------- minimize -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_common_prefixes():
+    return """
+    start: "a" "p" | "a" "q" | "a" "r"
+    """
+
+
+def test_compile_cfg_grammar_minimize_reports_node_counts(
+    cfg_grammar_common_prefixes: str,
+):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_common_prefixes)
+    minimized_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_common_prefixes, minimize=True
+    )
+
+    assert not compiled_cfg_grammar.report.minimized_rules
+    assert minimized_cfg_grammar.report.minimized_rules == {"start": (6, 4)}
+    assert minimized_cfg_grammar.report.get_n_merged_nodes() == 2
+    assert len(minimized_cfg_grammar.rules[minimized_cfg_grammar.start]) == 4
+
+
+def test_compile_cfg_grammar_minimize_keeps_next_terminals(
+    cfg_grammar_common_prefixes: str,
+):
+    guide = CFGGuide(cfg_grammar_common_prefixes)
+    minimized_guide = CFGGuide(cfg_grammar_common_prefixes, minimize=True)
+
+    # A single `"a"` is proposed instead of one per alternative.
+    guide.get_next_terminals()
+    assert len(guide.next_terminals_w_history) == 3
+    minimized_guide.get_next_terminals()
+    assert len(minimized_guide.next_terminals_w_history) == 1
+
+    assert _get_next_terminal_contents(minimized_guide, ['"a"']) == [
+        '"p"',
+        '"q"',
+        '"r"',
+    ]
+
+
+def test_compile_cfg_grammar_minimize_is_cached_separately(
+    cfg_grammar_common_prefixes: str, tmp_path
+):
+    compile_cfg_grammar(cfg_grammar_common_prefixes, cache_dir=str(tmp_path))
+    minimized_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_common_prefixes, cache_dir=str(tmp_path), minimize=True
+    )
+
+    assert len(list(tmp_path.iterdir())) == 2
+    assert len(minimized_cfg_grammar.rules[minimized_cfg_grammar.start]) == 4
+
+
+def test_recompile_cfg_grammar_minimizes_every_rule_compiled_unminimized(
+    cfg_grammar_common_prefixes: str,
+):
+    cfg_grammar = cfg_grammar_common_prefixes.replace('"r"', "w") + 'w: "r"\n'
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar)
+
+    # Only `w` changed, `start` is still rebuilt to be minimized.
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        compiled_cfg_grammar, cfg_grammar.replace('w: "r"', 'w: "s"'), minimize=True
+    )
+
+    assert recompiled_cfg_grammar.report.minimized_rules == {
+        "start": (6, 4),
+        "w": (1, 1),
+    }
+    assert len(recompiled_cfg_grammar.rules[recompiled_cfg_grammar.start]) == 4
+    assert recompiled_cfg_grammar.options.minimize
+
+
+# ----------------------------- inline -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_greeting():
+    return """
+    start: greeting name "!"
+    greeting: "hi" | "hello"
+    name: Regex("[a-z]+") | "(" name ")"
+    """
+
+
+def test_compile_cfg_grammar_inlines_small_rules(cfg_grammar_greeting: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_greeting)
+    inlined_cfg_grammar = compile_cfg_grammar(cfg_grammar_greeting, inline_max_nodes=2)
+
+    assert not compiled_cfg_grammar.report.inlined_rules
+    # `name` refers to itself, it's never inlined.
+    assert inlined_cfg_grammar.report.inlined_rules == {"start": ("greeting",)}
+
+    rule = inlined_cfg_grammar.rules[inlined_cfg_grammar.start]
+    assert [
+        (
+            inlined_cfg_grammar.contents[rule.contents[node]],
+            inlined_cfg_grammar.get_origin_label(rule, node),
+        )
+        for node in range(len(rule))
+    ] == [
+        ('"hi"', "greeting"),
+        ('"hello"', "greeting"),
+        ("name", "start"),
+        ('"!"', "start"),
+    ]
+    assert [
+        inlined_cfg_grammar.contents[rule.contents[node]] for node in rule.initials
+    ] == ['"hi"', '"hello"']
+
+    # Rules larger than `inline_max_nodes` are kept as they are.
+    assert not compile_cfg_grammar(
+        cfg_grammar_greeting, inline_max_nodes=1
+    ).report.inlined_rules
+
+
+def test_compile_cfg_grammar_inline_keeps_next_terminals(cfg_grammar_greeting: str):
+    guide = CFGGuide(cfg_grammar_greeting)
+    inlined_guide = CFGGuide(cfg_grammar_greeting, inline_max_nodes=2)
+
+    walks: list[list[str]] = [[], ['"hi"'], ['"hello"', '"("']]
+    for chosen_contents in walks:
+        assert _get_next_terminal_contents(
+            inlined_guide, chosen_contents
+        ) == _get_next_terminal_contents(guide, chosen_contents)
+
+    # No layer is pushed for `greeting`.
+    inlined_guide.get_next_terminals()
+    assert all(
+        generation_state.parent is None
+        for generation_state in inlined_guide.next_terminals_w_history.values()
+    )
+
+
+def test_compile_cfg_grammar_inline_cache_round_trip(
+    cfg_grammar_greeting: str, tmp_path
+):
+    compile_cfg_grammar(cfg_grammar_greeting, cache_dir=str(tmp_path))
+    inlined_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_greeting, cache_dir=str(tmp_path), inline_max_nodes=2
+    )
+    loaded_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_greeting, cache_dir=str(tmp_path), inline_max_nodes=2
+    )
+
+    assert len(list(tmp_path.iterdir())) == 2
+    assert [rule.origins for rule in loaded_cfg_grammar.rules] == [
+        rule.origins for rule in inlined_cfg_grammar.rules
+    ]
+    assert loaded_cfg_grammar.options == inlined_cfg_grammar.options
+
+
+def test_recompile_cfg_grammar_rebuilds_rules_with_changed_inlined_rules(
+    cfg_grammar_greeting: str,
+):
+    inlined_cfg_grammar = compile_cfg_grammar(cfg_grammar_greeting, inline_max_nodes=2)
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        inlined_cfg_grammar,
+        cfg_grammar_greeting.replace('"hello"', '"hey"'),
+        inline_max_nodes=2,
+    )
+
+    rule = recompiled_cfg_grammar.rules[recompiled_cfg_grammar.start]
+    assert rule is not inlined_cfg_grammar.rules[inlined_cfg_grammar.start]
+    assert [
+        recompiled_cfg_grammar.contents[rule.contents[node]] for node in rule.initials
+    ] == ['"hi"', '"hey"']
+    assert recompiled_cfg_grammar.report.inlined_rules == {"start": ("greeting",)}
+    # `name` didn't change.
+    assert (
+        recompiled_cfg_grammar.rules[recompiled_cfg_grammar.rule_ids["name"]]
+        is inlined_cfg_grammar.rules[inlined_cfg_grammar.rule_ids["name"]]
+    )
+
+
+def test_recompile_cfg_grammar_rebuilds_every_rule_inlined_with_other_options(
+    cfg_grammar_greeting: str,
+):
+    inlined_cfg_grammar = compile_cfg_grammar(cfg_grammar_greeting, inline_max_nodes=2)
+    changed_cfg_grammar = cfg_grammar_greeting.replace('"!"', '"?"')
+
+    # Recompiled without inlining, `greeting` isn't spliced into `start` anymore.
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        inlined_cfg_grammar, changed_cfg_grammar
+    )
+    compiled_cfg_grammar = compile_cfg_grammar(changed_cfg_grammar)
+
+    assert not recompiled_cfg_grammar.report.inlined_rules
+    assert recompiled_cfg_grammar.options == compiled_cfg_grammar.options
+    assert [len(rule) for rule in recompiled_cfg_grammar.rules] == [
+        len(rule) for rule in compiled_cfg_grammar.rules
+    ]
+    assert all(
+        rule is not inlined_rule
+        for rule, inlined_rule in zip(
+            recompiled_cfg_grammar.rules, inlined_cfg_grammar.rules
+        )
+    )
+
+
+# ----------------------------- dead rules -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_dead_rules():
+    return """
+    start: "a" [suffix] | "(" loop helper ")"
+    suffix: "b"
+    loop: "x" loop
+    helper: "h"
+    unused: "z" other
+    other: "y"
+    """
+
+
+def test_compile_cfg_grammar_eliminates_dead_rules(cfg_grammar_dead_rules: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_dead_rules)
+    eliminated_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_dead_rules, eliminate_dead_rules=True
+    )
+
+    assert len(compiled_cfg_grammar.rules) == 6
+    assert not compiled_cfg_grammar.report.unreachable_rules
+    assert not compiled_cfg_grammar.report.unproductive_rules
+
+    # `helper` is only reachable through `loop`, which never ends.
+    assert list(eliminated_cfg_grammar.rule_ids) == ["start", "suffix"]
+    assert eliminated_cfg_grammar.report.unreachable_rules == [
+        "unused",
+        "other",
+        "helper",
+    ]
+    assert eliminated_cfg_grammar.report.unproductive_rules == ["loop"]
+    assert eliminated_cfg_grammar.definitions == (
+        '"a" [suffix] | "(" loop helper ")"',
+        '"b"',
+    )
+
+    rule = eliminated_cfg_grammar.rules[eliminated_cfg_grammar.start]
+    assert [
+        eliminated_cfg_grammar.contents[content_id] for content_id in rule.contents
+    ] == ['"a"', "suffix", "EOS_SYMBOL"]
+    assert _get_next_terminal_contents(
+        CFGGuide(cfg_grammar_dead_rules, eliminate_dead_rules=True), []
+    ) == ['"a"']
+
+
+def test_compile_cfg_grammar_eliminate_dead_rules_unproductive_start():
+    with pytest.raises(InvalidGrammar, match="derives no terminal string"):
+        compile_cfg_grammar('start: "x" start', eliminate_dead_rules=True)
+
+
+def test_compile_cfg_grammar_lazily_eliminates_unreachable_rules(
+    cfg_grammar_dead_rules: str,
+):
+    lazy_compiled_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_dead_rules, lazy=True, eliminate_dead_rules=True
+    )
+
+    assert list(lazy_compiled_cfg_grammar.rule_ids) == [
+        "start",
+        "suffix",
+        "loop",
+        "helper",
+    ]
+    assert lazy_compiled_cfg_grammar.report.unreachable_rules == ["unused", "other"]
+
+
+def test_recompile_cfg_grammar_rebuilds_rules_referring_to_unproductive_rules(
+    cfg_grammar_dead_rules: str,
+):
+    eliminated_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_dead_rules, eliminate_dead_rules=True
+    )
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        eliminated_cfg_grammar,
+        cfg_grammar_dead_rules.replace('"x" loop', '"x" [loop]'),
+        eliminate_dead_rules=True,
+    )
+
+    assert list(recompiled_cfg_grammar.rule_ids) == [
+        "start",
+        "suffix",
+        "loop",
+        "helper",
+    ]
+    assert not recompiled_cfg_grammar.report.unproductive_rules
+    assert recompiled_cfg_grammar.report.unreachable_rules == ["unused", "other"]
+    assert len(recompiled_cfg_grammar.rules[recompiled_cfg_grammar.start]) == 7
+    # `suffix` didn't change.
+    assert (
+        recompiled_cfg_grammar.rules[recompiled_cfg_grammar.rule_ids["suffix"]]
+        is eliminated_cfg_grammar.rules[eliminated_cfg_grammar.rule_ids["suffix"]]
+    )
+
+
+def test_recompile_cfg_grammar_from_cache_rebuilds_rules_referring_to_dropped_rules(
+    tmp_path,
+):
+    cfg_grammar = """
+    start: a | "z"
+    a: b
+    b: b "x"
+    """
+    compile_cfg_grammar(cfg_grammar, cache_dir=str(tmp_path), eliminate_dead_rules=True)
+    # The report isn't cached, the dropped rules are only missing from the loaded grammar.
+    loaded_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar, cache_dir=str(tmp_path), eliminate_dead_rules=True
+    )
+    assert list(loaded_cfg_grammar.rule_ids) == ["start"]
+    assert not loaded_cfg_grammar.report.unproductive_rules
+
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        loaded_cfg_grammar,
+        cfg_grammar.replace('b "x"', '"y"'),
+        eliminate_dead_rules=True,
+    )
+
+    assert list(recompiled_cfg_grammar.rule_ids) == ["start", "a", "b"]
+    assert _get_next_terminal_contents(
+        CFGGuide.from_compiled_cfg_grammar(recompiled_cfg_grammar), []
+    ) == ['"y"', '"z"']
+
+
+# ----------------------------- left recursion -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_left_recursive():
+    return """
+    start: expr
+    expr: expr "+" term | term
+    term: "x" | "(" expr ")"
+    a: b "p" | "q"
+    b: a "r"
+    """
+
+
+def test_get_left_recursive_rule_groups(cfg_grammar_left_recursive: str):
+    with pytest.warns(UserWarning) as warning_records:
+        compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_left_recursive)
+
+    # Warned once for the whole grammar.
+    assert len(warning_records) == 1
+    assert "expr ->expr, a ->b ->a" in str(warning_records[0].message)
+
+    # Groups are found over the rules of an eagerly compiled grammar.
+    assert isinstance(compiled_cfg_grammar.rules, tuple)
+    assert get_left_recursive_rule_groups(
+        compiled_cfg_grammar.rules, compiled_cfg_grammar.content_rule_ids
+    ) == [[1], [3, 4]]
+    assert compiled_cfg_grammar.report.left_recursive_rules == [("expr",), ("a", "b")]
+    assert list(compiled_cfg_grammar.left_recursive_rules) == [0, 1, 0, 1, 1]
+
+
+def test_get_left_recursive_rule_groups_after_a_terminal():
+    # `start` is only entered again once `"("` is consumed.
+    compiled_cfg_grammar = compile_cfg_grammar('start: "(" start ")" | "x"')
+
+    assert not compiled_cfg_grammar.report.left_recursive_rules
+    assert list(compiled_cfg_grammar.left_recursive_rules) == [0]
+
+
+def test_entry_frontier_steps_of_chained_left_recursive_rules():
+    # Each `a{i}` and `b{i}` loops on itself and enters both rules of the next level.
+    depth = 12
+    cfg_grammar = "start: a0 | b0\n"
+    for i in range(depth):
+        cfg_grammar += f'a{i}: a{i} "s" | a{i + 1} | b{i + 1}\n'
+        cfg_grammar += f'b{i}: b{i} "t" | a{i + 1} | b{i + 1}\n'
+    cfg_grammar += f'a{depth}: "z"\nb{depth}: "y"\n'
+    with pytest.warns(UserWarning):
+        compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar)
+
+    a3_rule_id = compiled_cfg_grammar.rule_ids["a3"]
+    assert compiled_cfg_grammar.left_recursive_rule_groups[a3_rule_id] == {a3_rule_id}
+    # The rules entered from other groups don't tell the steps of a rule apart, each rule is
+    # entered once instead of once for each of the 2^i paths leading to it.
+    assert len(compiled_cfg_grammar.frontier_table.entry_steps) <= len(
+        compiled_cfg_grammar.rules
+    )
+    assert _get_next_terminal_contents(
+        CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar), []
+    ) == ['"z"', '"y"']
+
+
+def test_left_recursive_rules_cache_round_trip(
+    cfg_grammar_left_recursive: str, tmp_path
+):
+    with pytest.warns(UserWarning):
+        compiled_cfg_grammar = compile_cfg_grammar(
+            cfg_grammar_left_recursive, cache_dir=str(tmp_path)
+        )
+    loaded_cfg_grammar = compile_cfg_grammar(
+        cfg_grammar_left_recursive, cache_dir=str(tmp_path)
+    )
+
+    assert loaded_cfg_grammar is not compiled_cfg_grammar
+    assert (
+        loaded_cfg_grammar.left_recursive_rules
+        == compiled_cfg_grammar.left_recursive_rules
+    )
+
+
+# ----------------------------- recompile_cfg_grammar -----------------------------
+
+
+def test_recompile_cfg_grammar_rebuilds_changed_rules_only(
+    cfg_grammar_arithmetic: str,
+):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+    recompiled_cfg_grammar = recompile_cfg_grammar(
+        compiled_cfg_grammar,
+        cfg_grammar_arithmetic.replace('"(" expression ")"', '"[" expression "]"'),
+    )
+
+    rule_ids = compiled_cfg_grammar.rule_ids
+    for label in ("start", "expression"):
+        assert (
+            recompiled_cfg_grammar.rules[rule_ids[label]]
+            is compiled_cfg_grammar.rules[rule_ids[label]]
+        )
+    assert (
+        recompiled_cfg_grammar.rules[rule_ids["term"]]
+        is not compiled_cfg_grammar.rules[rule_ids["term"]]
+    )
+
+    # The content table is only appended to.
+    n_contents = len(compiled_cfg_grammar.contents)
+    assert recompiled_cfg_grammar.contents[:n_contents] == compiled_cfg_grammar.contents
+    assert recompiled_cfg_grammar.contents[n_contents:] == ('"["', '"]"')
+
+    # Rebuilt symbols are distinct from the symbols of the reused rules.
+    s_ids = [
+        symbol.s_id for rule in recompiled_cfg_grammar.rules for symbol in rule.symbols
+    ]
+    assert len(s_ids) == len(set(s_ids))
+
+    guide = CFGGuide.from_compiled_cfg_grammar(recompiled_cfg_grammar)
+    guide.get_next_terminals()
+    assert [symbol.content for symbol in guide.next_terminals_w_history] == [
+        '"[0-9]+"',
+        '"["',
+    ]
+
+
+def test_recompile_cfg_grammar_carries_over_steps_of_unchanged_rules(
+    cfg_grammar_left_recursive: str,
+):
+    with pytest.warns(UserWarning):
+        compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_left_recursive)
+        _get_next_terminal_contents(
+            CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar), ['"("', '"x"']
+        )
+        recompiled_cfg_grammar = recompile_cfg_grammar(
+            compiled_cfg_grammar, cfg_grammar_left_recursive.replace('"q"', '"w"')
+        )
+
+    # Only `a` and `b` reach the changed rule, the steps of the others are carried over.
+    rule_ids = compiled_cfg_grammar.rule_ids
+    frontier_table = compiled_cfg_grammar.frontier_table
+    recompiled_frontier_table = recompiled_cfg_grammar.frontier_table
+    assert recompiled_frontier_table.start_walk is frontier_table.start_walk
+    for key, steps in recompiled_frontier_table.next_steps.items():
+        assert key[0] in (rule_ids["start"], rule_ids["expr"], rule_ids["term"])
+        assert steps is frontier_table.next_steps[key]
+    assert recompiled_frontier_table.next_steps
+    assert 0 < recompiled_frontier_table.nbytes <= frontier_table.nbytes
+
+    # The groups of the changed rules are found again.
+    assert (
+        recompiled_cfg_grammar.left_recursive_rules
+        == compiled_cfg_grammar.left_recursive_rules
+    )
+    assert (
+        recompiled_cfg_grammar.left_recursive_rule_groups
+        == compiled_cfg_grammar.left_recursive_rule_groups
+    )
+    assert recompiled_cfg_grammar.report.left_recursive_rules == [
+        ("expr",),
+        ("a", "b"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "old_definition,new_definition,chosen_contents",
+    [
+        # The loop of `expr` is broken.
+        (
+            'expr: expr "+" term | term',
+            'expr: term "+" term | term',
+            ['"("', '"x"', '"+"', '"x"'],
+        ),
+        # `term` enters `expr` again without consuming a terminal.
+        ('term: "x" | "(" expr ")"', 'term: "x" | expr ")"', ['"x"']),
+    ],
+)
+def test_recompile_cfg_grammar_matches_compile_with_changed_loops(
+    cfg_grammar_left_recursive: str,
+    old_definition: str,
+    new_definition: str,
+    chosen_contents: list[str],
+):
+    cfg_grammar = cfg_grammar_left_recursive.replace(old_definition, new_definition)
+    with pytest.warns(UserWarning):
+        compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_left_recursive)
+        _get_next_terminal_contents(
+            CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar), ['"("', '"x"']
+        )
+        recompiled_cfg_grammar = recompile_cfg_grammar(
+            compiled_cfg_grammar, cfg_grammar
+        )
+        fresh_cfg_grammar = compile_cfg_grammar(cfg_grammar)
+
+    assert (
+        recompiled_cfg_grammar.left_recursive_rules
+        == fresh_cfg_grammar.left_recursive_rules
+    )
+    assert (
+        recompiled_cfg_grammar.left_recursive_rule_groups
+        == fresh_cfg_grammar.left_recursive_rule_groups
+    )
+    assert (
+        recompiled_cfg_grammar.report.left_recursive_rules
+        == fresh_cfg_grammar.report.left_recursive_rules
+    )
+    for i in range(len(chosen_contents) + 1):
+        assert _get_next_terminal_contents(
+            CFGGuide.from_compiled_cfg_grammar(recompiled_cfg_grammar),
+            chosen_contents[:i],
+        ) == _get_next_terminal_contents(
+            CFGGuide.from_compiled_cfg_grammar(fresh_cfg_grammar), chosen_contents[:i]
+        )
+
+
+def test_recompile_cfg_grammar_unchanged_grammar(cfg_grammar_arithmetic: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+
+    assert (
+        recompile_cfg_grammar(compiled_cfg_grammar, cfg_grammar_arithmetic)
+        is compiled_cfg_grammar
+    )
+
+
+def test_recompile_cfg_grammar_removed_rule(cfg_grammar_arithmetic: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+
+    with pytest.raises(InvalidGrammar) as exc_info:
+        recompile_cfg_grammar(
+            compiled_cfg_grammar,
+            """
+            start: expression
+            expression: term {("+" | "-") term}
+            """,
+        )
+
+    assert str(exc_info.value) == "Undefined grammar rule: term (in expression)."
+
+
+# ----------------------------- compiled grammar cache -----------------------------
+
+
+def _get_cache_entries(cache_dir) -> list:
+    return sorted(path for path in cache_dir.iterdir() if path.suffix == ".cfgc")
+
+
+def test_compile_cfg_grammar_cache_round_trip(cfg_grammar_arithmetic: str, tmp_path):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+    (cache_entry,) = _get_cache_entries(tmp_path)
+
+    cached_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+
+    assert cached_cfg_grammar is not compiled_cfg_grammar
+    assert cached_cfg_grammar.contents == compiled_cfg_grammar.contents
+    assert cached_cfg_grammar.rule_ids == compiled_cfg_grammar.rule_ids
+    assert cached_cfg_grammar.content_rule_ids == compiled_cfg_grammar.content_rule_ids
+    assert cached_cfg_grammar.definitions == compiled_cfg_grammar.definitions
+    for cached_rule, rule in zip(cached_cfg_grammar.rules, compiled_cfg_grammar.rules):
+        assert cached_rule.kinds == rule.kinds
+        assert cached_rule.contents == rule.contents
+        assert cached_rule.successor_offsets == rule.successor_offsets
+        assert cached_rule.successors == rule.successors
+        assert cached_rule.initials == rule.initials
+        assert cached_rule.finals == rule.finals
+        assert [symbol.content for symbol in cached_rule.symbols] == [
+            symbol.content for symbol in rule.symbols
+        ]
+
+    # Whitespace and line breaks don't change the cache entry.
+    compile_cfg_grammar(
+        cfg_grammar_arithmetic.replace("{(", "{ ( ").replace("term {", "term\n   {"),
+        tmp_path,
+    )
+    assert _get_cache_entries(tmp_path) == [cache_entry]
+
+
+def test_compile_cfg_grammar_cache_rebuilds_corrupted_entries(
+    cfg_grammar_arithmetic: str, tmp_path
+):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+    (cache_entry,) = _get_cache_entries(tmp_path)
+    data = cache_entry.read_bytes()
+
+    # Truncated entry.
+    cache_entry.write_bytes(data[: len(data) // 2])
+    cached_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+    assert cached_cfg_grammar.contents == compiled_cfg_grammar.contents
+    assert cache_entry.read_bytes() == data
+
+    # Flipped byte in the payload.
+    cache_entry.write_bytes(data[:-1] + bytes([data[-1] ^ 0xFF]))
+    cached_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+    assert cached_cfg_grammar.contents == compiled_cfg_grammar.contents
+    assert cache_entry.read_bytes() == data
+
+
+def test_compile_cfg_grammar_cache_rejects_stale_entries(
+    cfg_grammar_arithmetic: str, tmp_path, monkeypatch
+):
+    compile_cfg_grammar(cfg_grammar_arithmetic, tmp_path)
+    (cache_entry,) = _get_cache_entries(tmp_path)
+
+    key = bytes.fromhex(cache_entry.stem)
+    assert load_compiled_grammar(str(tmp_path), key) is not None
+
+    monkeypatch.setattr(cache, "COMPILED_GRAMMAR_FORMAT_VERSION", 0)
+    assert load_compiled_grammar(str(tmp_path), key) is None
+
+
+# ----------------------------- GrammarRegistry -----------------------------
+
+
+def test_grammar_registry_shares_canonical_grammars(cfg_grammar_arithmetic: str):
+    registry = GrammarRegistry()
+
+    compiled_cfg_grammar = registry.get(cfg_grammar_arithmetic)
+    assert registry.get(cfg_grammar_arithmetic) is compiled_cfg_grammar
+    assert (
+        registry.get(cfg_grammar_arithmetic.replace("term {", "term\n   {"))
+        is compiled_cfg_grammar
+    )
+
+    assert (registry.hits, registry.misses, registry.evictions) == (2, 1, 0)
+    assert registry.current_bytes == compiled_cfg_grammar.get_nbytes()
+
+
+def test_grammar_registry_evicts_least_recently_used(cfg_grammar_arithmetic: str):
+    cfg_grammars = [
+        cfg_grammar_arithmetic.replace('"+"', f'"+{index}"') for index in range(3)
+    ]
+    nbytes = compile_cfg_grammar(cfg_grammars[0]).get_nbytes()
+    registry = GrammarRegistry(max_bytes=2 * nbytes + nbytes // 2)
+
+    registry.get(cfg_grammars[0])
+    registry.get(cfg_grammars[1])
+    registry.get(cfg_grammars[0])
+    registry.get(cfg_grammars[2])
+
+    assert cfg_grammars[0] in registry
+    assert cfg_grammars[1] not in registry
+    assert cfg_grammars[2] in registry
+    assert (registry.hits, registry.misses, registry.evictions) == (1, 3, 1)
+    assert registry.current_bytes <= registry.max_bytes
+
+
+def test_grammar_registry_counts_growing_frontier_tables(cfg_grammar_arithmetic: str):
+    compiled_cfg_grammar = compile_cfg_grammar(cfg_grammar_arithmetic)
+    registry = GrammarRegistry(max_bytes=compiled_cfg_grammar.get_nbytes() + 1)
+    compiled_cfg_grammar = registry.get(cfg_grammar_arithmetic)
+    nbytes = registry.current_bytes
+
+    # The steps built by the guide are counted on the next request, and go over the budget.
+    guide = CFGGuide.from_compiled_cfg_grammar(compiled_cfg_grammar)
+    _get_next_terminal_contents(guide, ['"("', '"("'])
+    assert compiled_cfg_grammar.get_nbytes() > nbytes
+
+    assert registry.get(cfg_grammar_arithmetic) is compiled_cfg_grammar
+    assert cfg_grammar_arithmetic not in registry
+    assert (registry.hits, registry.evictions, registry.current_bytes) == (1, 1, 0)
+
+
+def test_grammar_registry_compiles_once_under_concurrency(
+    cfg_grammar_arithmetic: str, monkeypatch
+):
+    compilations = []
+    compilation_started = threading.Event()
+    release_compilation = threading.Event()
+
+    def slow_compile_cfg_grammar(cfg_grammar, cache_dir=None, max_workers=1, **kwargs):
+        compilations.append(cfg_grammar)
+        compilation_started.set()
+        release_compilation.wait()
+        return compile_cfg_grammar(cfg_grammar, cache_dir, max_workers, **kwargs)
+
+    monkeypatch.setattr(
+        registry_module, "compile_cfg_grammar", slow_compile_cfg_grammar
+    )
+    registry = GrammarRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(registry.get, cfg_grammar_arithmetic) for _ in range(8)
+        ]
+        compilation_started.wait()
+        release_compilation.set()
+        results = [future.result() for future in futures]
+
+    assert len(compilations) == 1
+    assert all(result is results[0] for result in results)
+    assert (registry.hits, registry.misses) == (7, 1)
@@ -0,0 +1,751 @@
+import random
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cfg_parse.base import CompiledGraphState, Symbol, SymbolType
+from cfg_parse.cfg_guide.guide import (
+    CFGGuide,
+    build_cfg_grammar_into_symbol_graphs,
+    get_next_terminals,
+)
+from cfg_parse.cfg_guide.memo import FrontierMemo
+from cfg_parse.cfg_guide.session import GuideSession
+from cfg_parse.exceptions import ParsingError
+
+
+def _get_contents(next_terminals_w_history) -> list[str]:
+    return [symbol.content for symbol in next_terminals_w_history]
+
+
+# ----------------------------- get_next_terminals -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_sequence():
+    return """
+    start: a b
+    a: "x" | "y"
+    b: "p" "q"
+    """
+
+
+def test_get_next_terminals_sequence(cfg_grammar_sequence: str):
+    guide = CFGGuide(cfg_grammar_sequence)
+
+    guide.get_next_terminals()
+    assert _get_contents(guide.next_terminals_w_history) == ['"x"', '"y"']
+
+    chosen_symbol = list(guide.next_terminals_w_history)[0]
+    generation_state = guide.next_terminals_w_history[chosen_symbol]
+    guide.get_next_terminals(generation_state, chosen_symbol)
+    assert _get_contents(guide.next_terminals_w_history) == ['"p"']
+
+    chosen_symbol = list(guide.next_terminals_w_history)[0]
+    generation_state = guide.next_terminals_w_history[chosen_symbol]
+    guide.get_next_terminals(generation_state, chosen_symbol)
+    assert _get_contents(guide.next_terminals_w_history) == ['"q"']
+
+
+def test_get_next_terminals_generation_state_is_persistent(
+    cfg_grammar_sequence: str,
+):
+    guide = CFGGuide(cfg_grammar_sequence)
+
+    guide.get_next_terminals()
+    next_terminals_w_history = dict(guide.next_terminals_w_history)
+
+    # Both terminals of `a` share the same stack instead of independent copies.
+    generation_state_x, generation_state_y = next_terminals_w_history.values()
+    assert generation_state_x is generation_state_y
+    assert generation_state_x.parent is not None
+
+    # Advancing through one of the forks leaves the stored stack untouched.
+    chosen_symbol = list(next_terminals_w_history)[0]
+    guide.get_next_terminals(generation_state_x, chosen_symbol)
+    assert generation_state_x.node == -1
+    assert generation_state_x.parent.node == 0
+
+
+def test_get_next_terminals_module_level(cfg_grammar_sequence: str):
+    built_cfg_grammar = build_cfg_grammar_into_symbol_graphs(cfg_grammar_sequence)
+
+    next_terminals_w_history = get_next_terminals(built_cfg_grammar)
+
+    assert _get_contents(next_terminals_w_history) == ['"x"', '"y"']
+
+
+def test_get_next_terminals_closes_rules(cfg_grammar_sequence: str):
+    guide = CFGGuide(cfg_grammar_sequence)
+    built_cfg_grammar = guide.built_cfg_grammar
+    assert list(built_cfg_grammar) == ["start", "a", "b"]
+    assert guide.built_cfg_grammar is built_cfg_grammar
+
+    # The module-level function stops at the end of `a`, the caller closes it.
+    next_terminals_w_history = get_next_terminals(built_cfg_grammar)
+    chosen_symbol = list(next_terminals_w_history)[0]
+    generation_state = next_terminals_w_history[chosen_symbol]
+    assert get_next_terminals(built_cfg_grammar, generation_state, chosen_symbol) == {}
+    eos_symbol = Symbol("EOS_SYMBOL", SymbolType.SPECIAL)
+    assert _get_contents(
+        get_next_terminals(built_cfg_grammar, generation_state, eos_symbol)
+    ) == ['"p"']
+
+    # The guide closes `a` as soon as `"x"` is chosen.
+    guide.get_next_terminals()
+    _advance(guide, '"x"')
+    assert _get_contents(guide.next_terminals_w_history) == ['"p"']
+
+
+def test_get_next_terminals_from_compiled_cfg_grammar(cfg_grammar_sequence: str):
+    guide = CFGGuide(cfg_grammar_sequence)
+    guide_shared = CFGGuide.from_compiled_cfg_grammar(guide.compiled_cfg_grammar)
+
+    guide.get_next_terminals()
+    guide_shared.get_next_terminals()
+
+    assert list(guide_shared.next_terminals_w_history) == list(
+        guide.next_terminals_w_history
+    )
+
+
+def test_get_next_terminals_keeps_terminals_before_a_layer():
+    cfg_grammar = """
+    start: "a" | b
+    b: "c" | d
+    d: "e"
+    """
+    guide = CFGGuide(cfg_grammar)
+
+    guide.get_next_terminals()
+
+    assert _get_contents(guide.next_terminals_w_history) == ['"a"', '"c"', '"e"']
+
+
+def test_get_next_terminals_frontier_table(cfg_grammar_sequence: str):
+    guide = CFGGuide(cfg_grammar_sequence)
+    frontier_table = guide.compiled_cfg_grammar.frontier_table
+
+    # The start frontier is built when compiling the grammar.
+    assert frontier_table.entry_steps
+    assert not frontier_table.next_steps
+
+    guide.get_next_terminals()
+    chosen_symbol = list(guide.next_terminals_w_history)[0]
+    generation_state = guide.next_terminals_w_history[chosen_symbol]
+    guide.get_next_terminals(generation_state, chosen_symbol)
+    next_steps = dict(frontier_table.next_steps)
+    assert next_steps
+    assert frontier_table.next_walks
+    assert frontier_table.next_walks.keys() <= next_steps.keys()
+
+    # Steps are built once and shared by the guides of the grammar.
+    guide_shared = CFGGuide.from_compiled_cfg_grammar(guide.compiled_cfg_grammar)
+    guide_shared.get_next_terminals(generation_state, chosen_symbol)
+    assert frontier_table.next_steps == next_steps
+    assert list(guide_shared.next_terminals_w_history) == list(
+        guide.next_terminals_w_history
+    )
+
+
+def test_get_next_terminals_goes_through_shared_steps_once():
+    # `2 ** 40` paths lead from `start` to the terminals of `d40`.
+    rules = ["start: d0"]
+    rules += [f'd{i}: d{i + 1} "a{i}" | d{i + 1} "b{i}"' for i in range(40)]
+    rules.append('d40: "x" | "y"')
+    guide = CFGGuide("\n".join(rules))
+    compiled_cfg_grammar = guide.compiled_cfg_grammar
+
+    guide.get_next_terminals()
+    assert _get_contents(guide.next_terminals_w_history) == ['"x"', '"y"']
+
+    # Terminals keep the stack of the first path, going through the first node of each rule.
+    (stack,) = set(map(tuple, _get_stacks(guide.next_terminals_w_history)))
+    labels = [compiled_cfg_grammar.rules[rule_id].label for rule_id, _ in stack[1:]]
+    assert labels == [f"d{i}" for i in reversed(range(40))] + ["start"]
+    assert all(
+        compiled_cfg_grammar.rules[rule_id].initials[0] == node
+        for rule_id, node in stack[1:]
+    )
+    assert len(compiled_cfg_grammar.frontier_table.start_walk.pushes) == 41
+
+
+def test_get_next_terminals_deeper_than_the_recursion_limit():
+    depth = sys.getrecursionlimit() + 100
+    rules = ["start: r0"]
+    rules += [f'r{i}: r{i + 1} | "a{i}"' for i in range(depth)]
+    rules.append(f'r{depth}: "x"')
+    guide = CFGGuide("\n".join(rules))
+
+    guide.get_next_terminals()
+    assert len(guide.next_terminals_w_history) == depth + 1
+    _advance(guide, '"x"')
+    assert _get_contents(guide.next_terminals_w_history) == []
+
+
+# ----------------------------- frontier memo -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_list():
+    return """
+    start: "[" item {"," item} "]"
+    item: "x" | "y" item
+    """
+
+
+def _advance(guide: CFGGuide, chosen_content: str):
+    (chosen_symbol,) = [
+        symbol
+        for symbol in guide.next_terminals_w_history
+        if symbol.content == chosen_content
+    ]
+    guide.get_next_terminals(
+        guide.next_terminals_w_history[chosen_symbol], chosen_symbol
+    )
+
+
+def _get_stacks(next_terminals_w_history) -> list[list[tuple[int, int]]]:
+    stacks = []
+    for generation_state in next_terminals_w_history.values():
+        stack = []
+        while generation_state is not None:
+            stack.append((generation_state.rule_id, generation_state.node))
+            generation_state = generation_state.parent
+        stacks.append(stack)
+    return stacks
+
+
+# The stacks of every live parse reaching each terminal, parents are followed down to the start.
+def _get_gss_stacks(next_terminals_w_gss_nodes) -> list[list[list[tuple[int, int]]]]:
+    def iter_stacks(rule_id, node, parents):
+        if not parents:
+            yield [(rule_id, node)]
+        for parent, parent_node in parents:
+            for stack in iter_stacks(parent.rule_id, parent_node, parent.parents):
+                yield [(rule_id, node), *stack]
+
+    return [
+        sorted(
+            stack
+            for gss_node in gss_nodes
+            for stack in iter_stacks(gss_node.rule_id, gss_node.node, gss_node.parents)
+        )
+        for gss_nodes in next_terminals_w_gss_nodes.values()
+    ]
+
+
+def test_frontier_memo_matches_expanded_frontiers(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list)
+    guide_wo_memo = CFGGuide.from_compiled_cfg_grammar(
+        guide.compiled_cfg_grammar, frontier_memo_max_size=0
+    )
+    assert guide_wo_memo.frontier_memo is None
+
+    guide.get_next_terminals()
+    guide_wo_memo.get_next_terminals()
+    chosen_contents = ['"["', '"x"', '","', '"y"', '"x"'] + ['","', '"x"'] * 3
+    for chosen_content in chosen_contents:
+        for advanced_guide in (guide, guide_wo_memo):
+            _advance(advanced_guide, chosen_content)
+
+        assert _get_contents(guide.next_terminals_w_history) == _get_contents(
+            guide_wo_memo.next_terminals_w_history
+        )
+        assert _get_stacks(guide.next_terminals_w_history) == _get_stacks(
+            guide_wo_memo.next_terminals_w_history
+        )
+
+    # Each item starts from the same frames on top of the same stack.
+    assert guide.frontier_memo is not None
+    assert guide.frontier_memo.hits == 4
+    assert 0 < guide.frontier_memo.get_hit_rate() < 1
+
+
+def test_frontier_memo_key():
+    frontier_memo = FrontierMemo(suffix_depth=1)
+    bottom = CompiledGraphState(0, 1)
+    bottom_copy = CompiledGraphState(0, 1)
+
+    # Frames below the suffix are compared as objects.
+    assert frontier_memo.get_key(
+        CompiledGraphState(1, 2, parent=bottom), None
+    ) == frontier_memo.get_key(CompiledGraphState(1, 2, parent=bottom), None)
+    assert frontier_memo.get_key(
+        CompiledGraphState(1, 2, parent=bottom), None
+    ) != frontier_memo.get_key(CompiledGraphState(1, 2, parent=bottom_copy), None)
+
+    frontier_memo.suffix_depth = 2
+    assert frontier_memo.get_key(
+        CompiledGraphState(1, 2, parent=bottom), None
+    ) == frontier_memo.get_key(CompiledGraphState(1, 2, parent=bottom_copy), None)
+
+
+def test_frontier_memo_max_size():
+    frontier_memo = FrontierMemo(max_size=2)
+    for key in range(3):
+        frontier_memo.add(key, {})
+    assert frontier_memo.get(1) == {}
+
+    assert len(frontier_memo) == 2
+    assert frontier_memo.evictions == 1
+    assert frontier_memo.get(0) is None
+    assert (frontier_memo.hits, frontier_memo.misses) == (1, 1)
+
+
+# ----------------------------- batched next terminals -----------------------------
+
+
+def test_get_next_terminals_batch_matches_sequential(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list)
+    sequences_chosen_contents = [
+        ['"["', '"x"', '","', '"x"', '"]"'],
+        ['"["', '"y"', '"y"', '"x"', '","'],
+        ['"["', '"x"', '","', '"y"', '"x"'],
+    ]
+    sequential_guides = [
+        CFGGuide.from_compiled_cfg_grammar(guide.compiled_cfg_grammar)
+        for _ in sequences_chosen_contents
+    ]
+
+    batch_next_terminals_w_history = guide.get_next_terminals_batch(
+        [None] * len(sequences_chosen_contents), [None] * len(sequences_chosen_contents)
+    )
+    for sequential_guide in sequential_guides:
+        sequential_guide.get_next_terminals()
+
+    for chosen_contents in zip(*sequences_chosen_contents):
+        batch_next_terminals_w_history = guide.get_next_terminals_batch(
+            batch_next_terminals_w_history, chosen_contents
+        )
+        for next_terminals_w_history, sequential_guide, chosen_content in zip(
+            batch_next_terminals_w_history, sequential_guides, chosen_contents
+        ):
+            _advance(sequential_guide, chosen_content)
+            assert _get_contents(next_terminals_w_history) == _get_contents(
+                sequential_guide.next_terminals_w_history
+            )
+            # The grammar isn't ambiguous, each terminal is reached by one parse.
+            assert _get_gss_stacks(next_terminals_w_history) == [
+                [stack]
+                for stack in _get_stacks(sequential_guide.next_terminals_w_history)
+            ]
+
+    # The batch doesn't go through the dict of the guide.
+    assert guide.next_terminals_w_history == {}
+
+
+def test_get_next_terminals_batch_dedupes_sequences(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list, frontier_memo_max_size=0)
+
+    batch_next_terminals_w_history = guide.get_next_terminals_batch(
+        [None] * 4, [None] * 4
+    )
+    assert all(
+        next_terminals_w_history is batch_next_terminals_w_history[0]
+        for next_terminals_w_history in batch_next_terminals_w_history
+    )
+
+    batch_next_terminals_w_history = guide.get_next_terminals_batch(
+        batch_next_terminals_w_history, ['"["'] * 4
+    )
+    batch_next_terminals_w_history = guide.get_next_terminals_batch(
+        batch_next_terminals_w_history, ['"x"', '"y"', '"x"', '"y"']
+    )
+    assert batch_next_terminals_w_history[0] is batch_next_terminals_w_history[2]
+    assert batch_next_terminals_w_history[1] is batch_next_terminals_w_history[3]
+    assert _get_contents(batch_next_terminals_w_history[0]) == ['","', "EOS_SYMBOL"]
+    assert _get_contents(batch_next_terminals_w_history[1]) == ['"x"', '"y"']
+
+
+def test_get_next_terminals_batch_invalid_chosen_symbol(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list)
+    batch_next_terminals_w_history = guide.get_next_terminals_batch([None], [None])
+
+    with pytest.raises(ParsingError):
+        guide.get_next_terminals_batch(batch_next_terminals_w_history, ['"]"'])
+    with pytest.raises(ValueError):
+        guide.get_next_terminals_batch(batch_next_terminals_w_history, [])
+    with pytest.raises(ValueError):
+        guide.get_next_terminals_batch(batch_next_terminals_w_history, [None])
+
+
+def test_advance_parses_frontier_matches_batch(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list, frontier_memo_max_size=0)
+    parses_frontier = guide.advance_parses_frontier(None, None)
+    (batch_parses_frontier,) = guide.get_next_terminals_batch([None], [None])
+
+    for chosen_content in ['"["', '"x"', '","', '"y"']:
+        parses_frontier = guide.advance_parses_frontier(parses_frontier, chosen_content)
+        (batch_parses_frontier,) = guide.get_next_terminals_batch(
+            [batch_parses_frontier], [chosen_content]
+        )
+        assert _get_contents(parses_frontier) == _get_contents(batch_parses_frontier)
+        assert _get_gss_stacks(parses_frontier) == _get_gss_stacks(
+            batch_parses_frontier
+        )
+
+    with pytest.raises(ParsingError):
+        guide.advance_parses_frontier(parses_frontier, '"["')
+
+
+# ----------------------------- guide session -----------------------------
+
+
+def test_guide_session_advance(cfg_grammar_sequence: str):
+    session = GuideSession(CFGGuide(cfg_grammar_sequence))
+
+    assert _get_contents(session.allowed()) == ['"x"', '"y"']
+    assert _get_contents(session.advance('"y"')) == ['"p"']
+    assert _get_contents(session.advance('"p"')) == ['"q"']
+    assert not session.is_finished()
+
+    session.advance('"q"')
+    assert session.is_finished()
+    with pytest.raises(ParsingError):
+        session.advance('"q"')
+
+
+def test_guide_session_matches_guide(cfg_grammar_list: str):
+    guide = CFGGuide(cfg_grammar_list)
+    guide_shared = CFGGuide.from_compiled_cfg_grammar(guide.compiled_cfg_grammar)
+    sessions = [GuideSession(guide_shared) for _ in range(2)]
+
+    guide.get_next_terminals()
+    for chosen_content in ['"["', '"y"', '"x"', '","', '"x"', '"]"']:
+        _advance(guide, chosen_content)
+        # Sessions don't share their next terminals.
+        sessions[0].advance(chosen_content)
+        assert _get_contents(sessions[0].allowed()) == _get_contents(
+            guide.next_terminals_w_history
+        )
+        assert _get_gss_stacks(sessions[0].next_terminals_w_parses) == [
+            [stack] for stack in _get_stacks(guide.next_terminals_w_history)
+        ]
+
+    assert guide_shared.next_terminals_w_history == {}
+    assert _get_contents(sessions[1].allowed()) == ['"["']
+
+
+# ----------------------------- graph-structured stack -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_ambiguous():
+    return """
+    start: a | b | Regex("[0-9]+") "n"
+    a: "x" "p" | "1" "p"
+    b: "x" "q"
+    """
+
+
+def test_guide_session_follows_every_parse_of_the_chosen_text(
+    cfg_grammar_ambiguous: str,
+):
+    session = GuideSession(CFGGuide(cfg_grammar_ambiguous))
+    assert _get_contents(session.allowed()) == ['"x"', '"1"', '"x"', '"[0-9]+"']
+
+    assert _get_contents(session.advance('"x"')) == ['"p"', '"q"']
+    session.advance('"q"')
+    assert session.is_finished()
+
+    session = GuideSession(session.guide)
+    assert _get_contents(session.advance('"1"')) == ['"p"', '"n"']
+    session = GuideSession(session.guide)
+    assert _get_contents(session.advance('"12"')) == ['"n"']
+
+
+def test_get_next_terminals_batch_follows_every_parse(cfg_grammar_ambiguous: str):
+    guide = CFGGuide(cfg_grammar_ambiguous)
+    batch_next_terminals_w_gss_nodes = guide.get_next_terminals_batch(
+        [None] * 3, [None] * 3
+    )
+    batch_next_terminals_w_gss_nodes = guide.get_next_terminals_batch(
+        batch_next_terminals_w_gss_nodes, ['"x"', '"1"', '"7"']
+    )
+    assert [
+        _get_contents(next_terminals_w_gss_nodes)
+        for next_terminals_w_gss_nodes in batch_next_terminals_w_gss_nodes
+    ] == [['"p"', '"q"'], ['"p"', '"n"'], ['"n"']]
+
+
+def test_guide_session_merges_parses_reaching_the_same_terminal():
+    cfg_grammar = """
+    start: a "p" | b "q"
+    a: c
+    b: c
+    c: "x"
+    """
+    session = GuideSession(CFGGuide(cfg_grammar))
+
+    # One node for `c` with two parents, instead of a stack for each of them.
+    ((gss_node,),) = session.next_terminals_w_parses.values()
+    assert len(gss_node.parents) == 2
+    assert len(_get_gss_stacks(session.next_terminals_w_parses)[0]) == 2
+
+    assert _get_contents(session.advance('"x"')) == ['"p"', '"q"']
+
+
+def _count_gss_nodes_and_stacks(next_terminals_w_gss_nodes) -> tuple[int, int]:
+    n_stacks: dict[int, int] = {}
+
+    def count_stacks(gss_node) -> int:
+        if id(gss_node) not in n_stacks:
+            n_stacks[id(gss_node)] = (
+                sum(count_stacks(parent) for parent, _ in gss_node.parents) or 1
+            )
+        return n_stacks[id(gss_node)]
+
+    total_n_stacks = sum(
+        count_stacks(gss_node)
+        for gss_nodes in next_terminals_w_gss_nodes.values()
+        for gss_node in gss_nodes
+    )
+    return len(n_stacks), total_n_stacks
+
+
+def test_guide_session_ambiguity_costs_nodes_not_stacks():
+    cfg_grammar = """
+    start: a start | b start | "z"
+    a: "x"
+    b: "x"
+    """
+    session = GuideSession(CFGGuide(cfg_grammar))
+    for n_steps in range(1, 41):
+        session.advance('"x"')
+        n_gss_nodes, n_stacks = _count_gss_nodes_and_stacks(
+            session.next_terminals_w_parses
+        )
+        # Each `"x"` is read as `a` or as `b`, the parses are merged back at each step.
+        assert n_stacks == 3 * 2**n_steps
+        assert n_gss_nodes <= 3 * n_steps + 3
+
+
+def test_guide_session_left_recursion(cfg_grammar_left_recursive: str):
+    with pytest.warns(UserWarning, match="expr ->expr"):
+        session = GuideSession(CFGGuide(cfg_grammar_left_recursive))
+
+    assert _get_contents(session.allowed()) == ['"x"', '"("']
+    # A left-recursive rule is its own parent, `expr` carries on after each `term`.
+    assert _get_contents(session.advance('"x"')) == ['"+"']
+    assert _get_contents(session.advance('"+"')) == ['"x"', '"("']
+    assert _get_contents(session.advance('"("')) == ['"x"', '"("']
+    assert _get_contents(session.advance('"x"')) == ['")"', '"+"']
+    assert _get_contents(session.advance('")"')) == ['"+"']
+
+
+# ----------------------------- earley chart -----------------------------
+
+
+def _get_sorted_contents(next_terminals_w_parses) -> list[str]:
+    return sorted(_get_contents(next_terminals_w_parses))
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize(
+    "cfg_grammar",
+    [
+        """
+        start: a | b | "1" "n"
+        a: "x" "p" | "1" "p"
+        b: "x" "q"
+        """,
+        """
+        start: "[" item {"," item} "]"
+        item: "x" | "y" item | "(" start ")"
+        """,
+        """
+        start: a "p" | b "q"
+        a: c
+        b: c
+        c: "x" | c "y"
+        """,
+    ],
+)
+def test_earley_guide_session_matches_gss(cfg_grammar: str, lazy: bool):
+    gss_guide = CFGGuide(cfg_grammar, lazy=lazy)
+    # Both guides share the compiled grammar, the terminals are the same objects.
+    earley_guide = CFGGuide.from_compiled_cfg_grammar(
+        gss_guide.compiled_cfg_grammar, earley=True
+    )
+    for seed in range(100):
+        rng = random.Random(seed)
+        gss_session = GuideSession(gss_guide)
+        earley_session = GuideSession(earley_guide)
+        for _ in range(40):
+            allowed = list(gss_session.allowed())
+            assert set(earley_session.allowed()) == set(allowed)
+            if not allowed:
+                break
+            chosen_text = rng.choice(allowed).content
+            gss_session.advance(chosen_text)
+            earley_session.advance(chosen_text)
+
+
+def test_earley_guide_session_follows_every_parse(cfg_grammar_ambiguous: str):
+    session = GuideSession(CFGGuide(cfg_grammar_ambiguous, earley=True))
+    assert _get_sorted_contents(session.allowed()) == [
+        '"1"',
+        '"[0-9]+"',
+        '"x"',
+        '"x"',
+    ]
+
+    assert _get_sorted_contents(session.advance('"x"')) == ['"p"', '"q"']
+    session.advance('"p"')
+    assert session.is_finished()
+
+    session = GuideSession(session.guide)
+    assert _get_sorted_contents(session.advance('"1"')) == ['"n"', '"p"']
+
+
+def test_earley_guide_session_left_recursion():
+    cfg_grammar = """
+    start: expr
+    expr: expr "+" term | expr "-" term | term
+    term: term "*" factor | factor
+    factor: Regex("[0-9]+") | "(" expr ")"
+    """
+    with pytest.warns(UserWarning, match="expr ->expr"):
+        session = GuideSession(CFGGuide(cfg_grammar, earley=True))
+
+    assert _get_sorted_contents(session.allowed()) == ['"("', '"[0-9]+"']
+    n_items = set()
+    for _ in range(200):
+        assert _get_sorted_contents(session.advance('"1"')) == [
+            '"*"',
+            '"+"',
+            '"-"',
+        ]
+        session.advance('"+"')
+        n_items.add(sum(map(len, session.next_terminals_w_parses.values())))
+    # `expr` waits for itself where it's predicted, the sets don't grow with the expression.
+    assert len(n_items) == 1
+    assert _get_sorted_contents(session.advance('"("')) == ['"("', '"[0-9]+"']
+    assert _get_sorted_contents(session.advance('"2"')) == [
+        '")"',
+        '"*"',
+        '"+"',
+        '"-"',
+    ]
+    assert _get_sorted_contents(session.advance('")"')) == ['"*"', '"+"', '"-"']
+
+
+def test_earley_get_next_terminals_batch(cfg_grammar_ambiguous: str):
+    guide = CFGGuide(cfg_grammar_ambiguous, earley=True)
+    batch_next_terminals_w_items = guide.get_next_terminals_batch(
+        [None] * 3, [None] * 3
+    )
+    batch_next_terminals_w_items = guide.get_next_terminals_batch(
+        batch_next_terminals_w_items, ['"x"', '"1"', '"7"']
+    )
+    assert [
+        _get_sorted_contents(next_terminals_w_items)
+        for next_terminals_w_items in batch_next_terminals_w_items
+    ] == [['"p"', '"q"'], ['"n"', '"p"'], ['"n"']]
+
+    with pytest.raises(ParsingError):
+        guide.get_next_terminals_batch(batch_next_terminals_w_items[:1], ['"n"'])
+
+
+# ----------------------------- threads -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_nested_list():
+    return """
+    start: "[" item {"," item} "]"
+    item: "x" | "y" item | "(" start ")"
+    """
+
+
+def _walk_session(session: GuideSession, seed: int, max_steps: int = 60) -> list:
+    rng = random.Random(seed)
+    walk = []
+    for _ in range(max_steps):
+        allowed = list(session.allowed())
+        if not allowed:
+            break
+        walk.append(
+            (
+                _get_contents(allowed),
+                _get_gss_stacks(session.next_terminals_w_parses),
+            )
+        )
+        session.advance(rng.choice(allowed).content)
+    return walk
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_guide_sessions_across_threads(cfg_grammar_nested_list: str, lazy: bool):
+    seeds = range(400)
+    serial_guide = CFGGuide(cfg_grammar_nested_list, lazy=lazy)
+    serial_walks = [_walk_session(GuideSession(serial_guide), seed) for seed in seeds]
+
+    # One guide for every thread, rules of the lazy grammar are compiled by the sessions and
+    # the small memo is evicted from all the time.
+    guide = CFGGuide(cfg_grammar_nested_list, lazy=lazy, frontier_memo_max_size=8)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            walks = list(
+                executor.map(
+                    lambda seed: _walk_session(GuideSession(guide), seed), seeds
+                )
+            )
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert walks == serial_walks
+    assert guide.frontier_memo is not None
+    assert guide.frontier_memo.evictions > 0
+
+
+# ----------------------------- loops of non-terminals -----------------------------
+
+
+@pytest.fixture
+def cfg_grammar_left_recursive():
+    return """
+    start: expr
+    expr: expr "+" term | term
+    term: "x" | "(" expr ")"
+    """
+
+
+def test_get_next_terminals_ignores_left_recursive_paths(
+    cfg_grammar_left_recursive: str,
+):
+    with pytest.warns(UserWarning, match="expr ->expr"):
+        guide = CFGGuide(cfg_grammar_left_recursive)
+
+    # Loops are found at compile time, the guide doesn't warn.
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+
+        guide.get_next_terminals()
+        assert _get_contents(guide.next_terminals_w_history) == ['"x"', '"("']
+
+        # `expr` is entered again once `"("` is consumed.
+        _advance(guide, '"("')
+        assert _get_contents(guide.next_terminals_w_history) == ['"x"', '"("']
+
+        _advance(guide, '"x"')
+        assert _get_contents(guide.next_terminals_w_history) == ['")"']
+
+
+def test_get_next_terminals_recursion_after_a_terminal():
+    cfg_grammar = """
+    start: "(" start ")" | "x"
+    """
+    guide = CFGGuide(cfg_grammar)
+
+    guide.get_next_terminals()
+    _advance(guide, '"("')
+    assert _get_contents(guide.next_terminals_w_history) == ['"("', '"x"']
+
+    _advance(guide, '"x"')
+    assert _get_contents(guide.next_terminals_w_history) == ['")"']